@@ -0,0 +1,81 @@
+"""Import-time benchmark for the Cloud Functions entry point.
+
+Every cold start imports main.py before the first request is served, so its
+import time is paid by OPTIONS preflights and cache hits too. This runs the
+import in fresh interpreters with `python -X importtime` and reports the
+median, the heaviest imports, and whether any of the deferred analysis
+dependencies were pulled in.
+
+Usage:
+    python benchmarks/bench_cold_start.py [--module main] [--runs 5] [--max-ms 1500]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+FINTECH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fintech")
+
+# Dependencies that should only load when an analysis actually runs
+DEFERRED_MODULES = ["langgraph", "langchain", "langchain_core", "langchain_anthropic", "langchain_openai", "pandas", "yfinance", "financial_analysis", "rag_utils"]
+
+
+def profile_import(module: str) -> list[tuple[int, int, str]]:
+    """Import a module in a fresh interpreter and return (self_us, cumulative_us, name) rows"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=FINTECH_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name.rstrip()))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main", help="Module to import (default: main)")
+    parser.add_argument("--runs", type=int, default=5, help="Number of fresh interpreters to average over")
+    parser.add_argument("--top", type=int, default=15, help="Number of heaviest imports to list")
+    parser.add_argument("--max-ms", type=float, help="Exit non-zero if the median import time exceeds this")
+    args = parser.parse_args()
+
+    totals_ms = []
+    rows = []
+    for _ in range(args.runs):
+        rows = profile_import(args.module)
+        total = next(cumulative for _, cumulative, name in rows if name.strip() == args.module)
+        totals_ms.append(total / 1000)
+
+    median_ms = statistics.median(totals_ms)
+    print(f"import {args.module}: median {median_ms:.1f} ms, min {min(totals_ms):.1f} ms, max {max(totals_ms):.1f} ms over {args.runs} runs")
+
+    print(f"\nHeaviest direct imports (cumulative, last run):")
+    # Nesting is encoded as two spaces per level; depth 1 rows are the module's own imports
+    direct = [row for row in rows if len(row[2]) - len(row[2].lstrip()) == 3]
+    for _, cumulative, name in sorted(direct, key=lambda row: row[1], reverse=True)[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {name.strip()}")
+
+    imported = {name.strip().split(".")[0] for _, _, name in rows}
+    loaded_deferred = [module for module in DEFERRED_MODULES if module in imported]
+    if loaded_deferred:
+        print(f"\nWARNING: deferred modules loaded at import time: {', '.join(loaded_deferred)}")
+    else:
+        print("\nNo deferred analysis dependencies loaded at import time")
+
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f"FAIL: median import time {median_ms:.1f} ms exceeds budget of {args.max_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Recall-vs-size benchmark for embedding truncation and quantization.
+
+Compares the storage options of FirestoreVectorStore against exact float32
+search: truncation to fewer dimensions, alone and with rescoring on the
+float16- or int8-quantized full embedding. Bytes per vector are what the
+store writes for each option (the searched `embedding` list plus
+`embedding_full`). Recall@k is measured against exact cosine top-k over the
+full embeddings.
+
+By default the corpus is the `financial_data` collection (needs Firebase
+credentials, and full-dimension embeddings in the `embedding` field).
+Use --synthetic to run on random clustered vectors instead.
+
+Usage:
+    python benchmarks/bench_quantization.py [--synthetic 5000] [--queries 200] [--k 5]
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+FINTECH_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "fintech")
+sys.path.insert(0, FINTECH_DIR)
+
+from quantization import RESCORE_OVERSAMPLE, dequantize, quantize, truncate_embedding  # noqa: E402
+
+FIRESTORE_DOUBLE_BYTES = 8  # Firestore stores each list element as a 64-bit double
+
+
+def load_corpus(collection_name: str) -> np.ndarray:
+    from firebase.config import db
+    vectors = [
+        list(snapshot.to_dict()["embedding"])
+        for snapshot in db.collection(collection_name).select(["embedding"]).stream()
+    ]
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def synthetic_corpus(size: int, dimensions: int, seed: int = 0) -> np.ndarray:
+    """Clustered vectors with decaying per-dimension variance, roughly like real embeddings"""
+    rng = np.random.default_rng(seed)
+    scales = 1.0 / np.sqrt(np.arange(1, dimensions + 1))
+    centers = rng.normal(size=(max(size // 50, 1), dimensions)) * scales
+    vectors = centers[rng.integers(len(centers), size=size)] + rng.normal(size=(size, dimensions)) * scales * 0.5
+    return vectors.astype(np.float32)
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def top_k(matrix: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    scores = normalize_rows(queries) @ normalize_rows(matrix).T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def recall(found: np.ndarray, exact: np.ndarray) -> float:
+    return float(np.mean([len(set(f) & set(e)) / len(e) for f, e in zip(found, exact)]))
+
+
+def dequantized_matrix(corpus: np.ndarray, dtype: str) -> np.ndarray:
+    return np.stack([dequantize(*quantize(vector, dtype)) for vector in corpus])
+
+
+def rescored_top_k(corpus: np.ndarray, queries: np.ndarray, dimensions: int, dtype: str, k: int) -> np.ndarray:
+    truncated = np.stack([truncate_embedding(vector, dimensions) for vector in corpus])
+    truncated_queries = np.stack([truncate_embedding(query, dimensions) for query in queries])
+    candidates = top_k(truncated, truncated_queries, k * RESCORE_OVERSAMPLE)
+    full = normalize_rows(dequantized_matrix(corpus, dtype))
+    results = []
+    for query, rows in zip(normalize_rows(queries), candidates):
+        scores = full[rows] @ query
+        results.append(rows[np.argsort(-scores)[:k]])
+    return np.asarray(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection", default="financial_data", help="Firestore collection to load")
+    parser.add_argument("--synthetic", type=int, help="Use this many synthetic vectors instead of Firestore")
+    parser.add_argument("--dimensions", type=int, default=1536, help="Dimensions of synthetic vectors")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries to evaluate")
+    parser.add_argument("--k", type=int, default=5, help="Results per query (RAGManager uses 5)")
+    parser.add_argument("--truncate", type=int, nargs="+", default=[256, 512], help="Truncated dimensions to evaluate")
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.synthetic, args.dimensions) if args.synthetic else load_corpus(args.collection)
+    if len(corpus) <= args.k:
+        sys.exit(f"Corpus has only {len(corpus)} vectors; need more than k={args.k}")
+    dimensions = corpus.shape[1]
+
+    # Queries are perturbed corpus vectors, so each has true neighbours in the corpus
+    rng = np.random.default_rng(1)
+    picks = corpus[rng.integers(len(corpus), size=args.queries)]
+    queries = picks + rng.normal(size=picks.shape).astype(np.float32) * picks.std() * 0.3
+    exact = top_k(corpus, queries, args.k)
+
+    rows = [("float list (current)", dimensions * FIRESTORE_DOUBLE_BYTES, 1.0)]
+    for truncated_dimensions in args.truncate:
+        if truncated_dimensions >= dimensions:
+            continue
+        truncated = np.stack([truncate_embedding(vector, truncated_dimensions) for vector in corpus])
+        truncated_queries = np.stack([truncate_embedding(query, truncated_dimensions) for query in queries])
+        coarse_bytes = truncated_dimensions * FIRESTORE_DOUBLE_BYTES
+        rows.append((
+            f"truncate {truncated_dimensions}",
+            coarse_bytes,
+            recall(top_k(truncated, truncated_queries, args.k), exact)
+        ))
+        for dtype in ("float16", "int8"):
+            data, _ = quantize(corpus[0], dtype)
+            rows.append((
+                f"truncate {truncated_dimensions} + {dtype} rescore",
+                coarse_bytes + len(data),
+                recall(rescored_top_k(corpus, queries, truncated_dimensions, dtype, args.k), exact)
+            ))
+
+    print(f"{len(corpus)} vectors x {dimensions} dims, {args.queries} queries, recall@{args.k}\n")
+    print(f"{'storage':<34}{'bytes/vector':>14}{'vs current':>12}{'recall':>9}")
+    baseline_bytes = rows[0][1]
+    for name, size, value in rows:
+        print(f"{name:<34}{size:>14,}{size / baseline_bytes:>11.1%}{value:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
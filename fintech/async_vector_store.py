@@ -0,0 +1,84 @@
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from google.cloud import firestore
+from firestore_vector_store import VECTOR_SEARCH_LATENCY, FirestoreVectorStore, search_result
+
+
+def create_async_client(app=None) -> firestore.AsyncClient:
+    """Async Firestore client for the Firebase app's project and credentials
+
+    gRPC async channels are bound to the event loop they are first used on,
+    so create one client per event loop rather than sharing a global, and
+    close it before the loop ends (see AsyncFirestoreVectorStore.close).
+    """
+    if app is None:
+        from firebase.config import app
+    return firestore.AsyncClient(project=app.project_id, credentials=app.credential.get_credential())
+
+
+class AsyncFirestoreVectorStore:
+    """Async find_nearest search over a FirestoreVectorStore's collection
+
+    Uses the same truncation, quantization rescoring and result format as
+    the wrapped store; only the query is issued on the async client, so
+    several searches can be in flight at once without a thread each.
+    """
+
+    def __init__(self, store: FirestoreVectorStore = None, async_db=None):
+        """Initialize the async store
+
+        Args:
+            store: Synchronous store whose collection and settings to use
+            async_db: Async Firestore client (defaults to create_async_client())
+        """
+        self.store = store if store is not None else FirestoreVectorStore()
+        # A client created here is closed by close(); a caller's client is the caller's to close
+        self.owns_client = async_db is None
+        self.db = async_db if async_db is not None else create_async_client()
+        self.collection = self.db.collection(self.store.collection.id)
+
+    async def close(self) -> None:
+        """Close the async client's channel, if this store created the client"""
+        if not self.owns_client:
+            return
+        # AsyncClient.close() only closes the HTTP transport; the gRPC channel is
+        # closed through the GAPIC client's transport
+        await self.db._firestore_api.transport.close()
+        self.db.close()
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        limit: int = 10,
+        distance_threshold: float = None,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search for similar documents (see FirestoreVectorStore.search)"""
+        coarse_embedding, coarse_limit, coarse_threshold = self.store._coarse_params(
+            query_embedding, limit, distance_threshold
+        )
+        vector_query = self.store._vector_query(
+            self.collection, coarse_embedding, coarse_limit, coarse_threshold, metadata_filters, date_range
+        )
+        with VECTOR_SEARCH_LATENCY.time(backend="firestore_async"):
+            results = [search_result(doc) async for doc in vector_query.stream()]
+        return self.store._finish(query_embedding, results, limit, distance_threshold)
+
+    async def search_many(self, queries: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        """Run several searches concurrently
+
+        Closes the client afterwards if this store created it, since the
+        event loop it is bound to usually ends with the batch.
+
+        Args:
+            queries: Keyword arguments for search(), one dict per query
+
+        Returns:
+            Results for each query, in the same order as queries
+        """
+        try:
+            return list(await asyncio.gather(*(self.search(**query) for query in queries)))
+        finally:
+            await self.close()
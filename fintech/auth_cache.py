@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TOKENS = 1024
+CLOCK_SKEW_SECONDS = 30  # Stop trusting a cached token this long before its `exp`
+CERT_REFRESH_SECONDS = 3600  # Google rotates the signing keys every few hours
+
+TOKEN_CACHE_LOOKUPS = registry.counter("auth_token_cache_lookups_total", "Verified ID token cache lookups by result")
+
+
+def hash_token(id_token: str) -> str:
+    """Cache key for a token, so raw tokens are never kept in memory longer than needed"""
+    return hashlib.sha256(id_token.encode("utf-8")).hexdigest()
+
+
+class VerifiedTokenCache:
+    """Bounded LRU cache of verified Firebase ID tokens
+
+    Entries are keyed by the SHA-256 of the token and expire with the
+    token's own `exp` claim, so a cached token is never accepted after
+    Firebase would have rejected it as expired.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_MAX_TOKENS, clock_skew_seconds: int = CLOCK_SKEW_SECONDS):
+        """Initialize the token cache
+
+        Args:
+            max_size: Maximum number of tokens to keep
+            clock_skew_seconds: Margin subtracted from each token's expiry
+        """
+        self.max_size = max_size
+        self.clock_skew_seconds = clock_skew_seconds
+        self._entries: "OrderedDict[str, tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, id_token: str) -> Optional[Dict[str, Any]]:
+        """Get the decoded claims for a token if it was verified and hasn't expired"""
+        key = hash_token(id_token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                TOKEN_CACHE_LOOKUPS.inc(result="miss")
+                return None
+            expires_at, decoded_token = entry
+            if time.time() >= expires_at:
+                del self._entries[key]
+                self.misses += 1
+                TOKEN_CACHE_LOOKUPS.inc(result="expired")
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            TOKEN_CACHE_LOOKUPS.inc(result="hit")
+            return decoded_token
+
+    def put(self, id_token: str, decoded_token: Dict[str, Any]) -> None:
+        """Cache the decoded claims of a verified token until its `exp`"""
+        exp = decoded_token.get("exp")
+        if not exp:
+            return
+        expires_at = float(exp) - self.clock_skew_seconds
+        if expires_at <= time.time():
+            return
+        key = hash_token(id_token)
+        with self._lock:
+            self._entries[key] = (expires_at, decoded_token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def verify(self, id_token: str, verifier: Callable[[str], Dict[str, Any]]) -> Dict[str, Any]:
+        """Return the token's claims, calling verifier only on a cache miss
+
+        Args:
+            id_token: The Firebase ID token from the Authorization header
+            verifier: Function doing the full verification (e.g. auth.verify_id_token)
+
+        Returns:
+            The decoded token claims; verifier's exceptions propagate unchanged
+        """
+        decoded_token = self.get(id_token)
+        if decoded_token is None:
+            decoded_token = verifier(id_token)
+            self.put(id_token, decoded_token)
+        return decoded_token
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def warm_signing_certificates(app=None) -> bool:
+    """Fetch the ID token signing certificates into firebase_admin's HTTP cache
+
+    firebase_admin caches the certificates according to their Cache-Control
+    headers, so refreshing them ahead of time keeps the fetch off the
+    request path when a new token has to be verified.
+    """
+    try:
+        from firebase_admin import auth, _token_gen
+        token_verifier = auth._get_client(app)._token_verifier
+        token_verifier.request(url=_token_gen.ID_TOKEN_CERT_URI, method="GET")
+        return True
+    except Exception as e:
+        logger.warning(f"Failed to warm ID token signing certificates: {str(e)}")
+        return False
+
+
+_warmer_started = False
+_warmer_lock = threading.Lock()
+
+
+def start_certificate_warmer(refresh_seconds: int = CERT_REFRESH_SECONDS) -> None:
+    """Start a daemon thread that keeps the signing certificates cached
+
+    Safe to call on every request; only the first call starts the thread.
+    """
+    global _warmer_started
+    with _warmer_lock:
+        if _warmer_started:
+            return
+        _warmer_started = True
+
+    def refresh():
+        while True:
+            warm_signing_certificates()
+            time.sleep(refresh_seconds)
+
+    threading.Thread(target=refresh, name="cert-warmer", daemon=True).start()
+
+
+# Process-wide cache shared by all requests on this instance
+token_cache = VerifiedTokenCache()
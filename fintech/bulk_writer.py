@@ -0,0 +1,140 @@
+import logging
+import random
+import time
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from google.api_core import exceptions as google_exceptions
+from google.cloud.firestore_v1.vector import Vector
+
+logger = logging.getLogger(__name__)
+
+# Firestore limits a commit to 500 writes and 10 MiB; stay under both
+MAX_BATCH_WRITES = 500
+MAX_BATCH_BYTES = 9 * 1024 * 1024
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+
+# Errors Firestore returns when it is throttling or contended; the commit can simply be retried
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.Aborted,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+)
+
+# A write is ("set", ref, data), ("update", ref, data) or ("delete", ref, None)
+Write = Tuple[str, Any, Optional[Dict[str, Any]]]
+
+
+def estimate_size(value: Any) -> int:
+    """Rough encoded size of a Firestore value in bytes"""
+    if isinstance(value, (str, bytes)):
+        return len(value) + 1
+    if isinstance(value, dict):
+        return sum(len(str(key)) + 1 + estimate_size(item) for key, item in value.items())
+    if isinstance(value, Vector):
+        # Vector values (embeddings) are arrays of 8-byte doubles
+        return len(value) * 8
+    if isinstance(value, Sequence):
+        return sum(estimate_size(item) for item in value)
+    return 8
+
+
+def split_batches(
+    writes: Iterable[Write],
+    max_writes: int = MAX_BATCH_WRITES,
+    max_bytes: int = MAX_BATCH_BYTES
+) -> List[List[Write]]:
+    """Group writes into batches under Firestore's per-commit limits"""
+    batches: List[List[Write]] = []
+    current: List[Write] = []
+    current_bytes = 0
+    for write in writes:
+        size = estimate_size(write[2]) + 256
+        if current and (len(current) >= max_writes or current_bytes + size > max_bytes):
+            batches.append(current)
+            current, current_bytes = [], 0
+        current.append(write)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def commit_batch(db, writes: List[Write], max_retries: int = DEFAULT_MAX_RETRIES) -> int:
+    """Commit one batch, retrying with jittered exponential backoff when throttled
+
+    Returns:
+        Number of retries needed
+    """
+    for attempt in range(max_retries + 1):
+        batch = db.batch()
+        for operation, ref, data in writes:
+            if operation == "set":
+                batch.set(ref, data)
+            elif operation == "update":
+                batch.update(ref, data)
+            elif operation == "delete":
+                batch.delete(ref)
+            else:
+                raise ValueError(f"Unknown write operation: {operation}")
+        try:
+            batch.commit()
+            return attempt
+        except RETRYABLE_ERRORS as e:
+            if attempt == max_retries:
+                raise
+            delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt) * random.uniform(0.5, 1.0)
+            logger.warning(f"Batch of {len(writes)} writes throttled ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def bulk_write(
+    db,
+    writes: Iterable[Write],
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    max_retries: int = DEFAULT_MAX_RETRIES
+) -> Dict[str, Any]:
+    """Commit any number of writes as concurrent batches
+
+    Batches are independent commits, so a failure leaves earlier batches
+    written; the first error is raised after in-flight batches finish.
+
+    Args:
+        db: Firestore client
+        writes: Writes to commit
+        max_workers: Maximum number of batches committed at once
+        max_retries: Retries per batch for throttling errors
+
+    Returns:
+        Stats dict with documents, batches, retries, seconds and docs_per_second
+    """
+    start = time.perf_counter()
+    batches = split_batches(writes)
+    documents = sum(len(batch) for batch in batches)
+    retries = 0
+    if len(batches) == 1:
+        retries = commit_batch(db, batches[0], max_retries)
+    elif batches:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            futures = [executor.submit(commit_batch, db, batch, max_retries) for batch in batches]
+            retries = sum(future.result() for future in futures)
+
+    seconds = time.perf_counter() - start
+    stats = {
+        "documents": documents,
+        "batches": len(batches),
+        "retries": retries,
+        "seconds": seconds,
+        "docs_per_second": documents / seconds if seconds > 0 else 0.0
+    }
+    if documents:
+        logger.info(
+            f"Wrote {documents} documents in {len(batches)} batches ({retries} retries) "
+            f"in {seconds:.2f}s, {stats['docs_per_second']:.0f} docs/sec"
+        )
+    return stats
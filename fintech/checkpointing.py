@@ -0,0 +1,303 @@
+import logging
+import os
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+)
+from langgraph.checkpoint.memory import MemorySaver
+
+from bulk_writer import bulk_write
+
+logger = logging.getLogger(__name__)
+
+# Firestore collection holding one document per analysis (keyed by the
+# analysis_results document ID) with `checkpoints` and `writes` subcollections
+CHECKPOINT_COLLECTION = "analysis_checkpoints"
+
+# Field names can't be empty, so the root graph namespace ("") is stored under this key
+ROOT_NAMESPACE = "__root__"
+
+
+class FirestoreCheckpointSaver(BaseCheckpointSaver):
+    """LangGraph checkpoint saver that persists graph state in Firestore
+
+    Every completed node produces a checkpoint, so an analysis that is
+    interrupted (timeout, instance recycled) can be resumed from the last
+    completed agent instead of re-running the whole chain.
+    """
+
+    def __init__(self, db=None, collection_name: str = CHECKPOINT_COLLECTION):
+        """Initialize the checkpoint saver
+
+        Args:
+            db: Firestore client to use (defaults to the app's client)
+            collection_name: Name of the Firestore collection to use
+        """
+        super().__init__()
+        if db is None:
+            from firebase.config import db
+        self.db = db
+        self.collection = self.db.collection(collection_name)
+
+    def _thread_ref(self, thread_id: str):
+        return self.collection.document(thread_id)
+
+    def _checkpoint_doc_id(self, checkpoint_ns: str, checkpoint_id: str) -> str:
+        return f"{checkpoint_ns or ROOT_NAMESPACE}:{checkpoint_id}"
+
+    def _load_pending_writes(self, thread_id: str, checkpoint_ns: str, checkpoint_id: str) -> list:
+        writes_query = self._thread_ref(thread_id).collection("writes").where(
+            "checkpoint_key", "==", self._checkpoint_doc_id(checkpoint_ns, checkpoint_id)
+        )
+        writes = [doc.to_dict() for doc in writes_query.stream()]
+        writes.sort(key=lambda w: (w["task_id"], w["idx"]))
+        return [
+            (w["task_id"], w["channel"], self.serde.loads_typed((w["type"], w["value"])))
+            for w in writes
+        ]
+
+    def _to_tuple(self, thread_id: str, data: Dict[str, Any]) -> CheckpointTuple:
+        checkpoint_ns = data["checkpoint_ns"]
+        checkpoint_id = data["checkpoint_id"]
+        parent_checkpoint_id = data.get("parent_checkpoint_id")
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((data["checkpoint_type"], data["checkpoint"])),
+            metadata=self.serde.loads_typed((data["metadata_type"], data["metadata"])),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=self._load_pending_writes(thread_id, checkpoint_ns, checkpoint_id),
+        )
+
+    def get_tuple(self, config: Dict[str, Any]) -> Optional[CheckpointTuple]:
+        """Get a checkpoint tuple, defaulting to the latest one for the thread
+
+        Args:
+            config: The config identifying the thread (and optionally the checkpoint)
+
+        Returns:
+            The checkpoint tuple, or None if nothing has been saved yet
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        if not checkpoint_id:
+            thread_doc = self._thread_ref(thread_id).get()
+            if not thread_doc.exists:
+                return None
+            latest = (thread_doc.to_dict() or {}).get("latest_checkpoint_ids", {})
+            checkpoint_id = latest.get(checkpoint_ns or ROOT_NAMESPACE)
+            if not checkpoint_id:
+                return None
+
+        doc = self._thread_ref(thread_id).collection("checkpoints").document(
+            self._checkpoint_doc_id(checkpoint_ns, checkpoint_id)
+        ).get()
+        if not doc.exists:
+            return None
+        return self._to_tuple(thread_id, doc.to_dict())
+
+    def list(
+        self,
+        config: Optional[Dict[str, Any]],
+        *,
+        filter: Optional[Dict[str, Any]] = None,
+        before: Optional[Dict[str, Any]] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        """List checkpoints for a thread, newest first
+
+        Args:
+            config: The config identifying the thread
+            filter: Metadata key/values the checkpoints must match
+            before: Only return checkpoints created before this one
+            limit: Maximum number of checkpoints to return
+        """
+        if not config:
+            return
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns")
+        before_id = get_checkpoint_id(before) if before else None
+
+        docs = [doc.to_dict() for doc in self._thread_ref(thread_id).collection("checkpoints").stream()]
+        docs.sort(key=lambda d: d["checkpoint_id"], reverse=True)
+
+        count = 0
+        for data in docs:
+            if checkpoint_ns is not None and data["checkpoint_ns"] != checkpoint_ns:
+                continue
+            if before_id and data["checkpoint_id"] >= before_id:
+                continue
+            checkpoint_tuple = self._to_tuple(thread_id, data)
+            if filter and not all(checkpoint_tuple.metadata.get(k) == v for k, v in filter.items()):
+                continue
+            yield checkpoint_tuple
+            count += 1
+            if limit is not None and count >= limit:
+                break
+
+    def put(
+        self,
+        config: Dict[str, Any],
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> Dict[str, Any]:
+        """Save a checkpoint and mark it as the latest for its namespace
+
+        Args:
+            config: The config to associate with the checkpoint
+            checkpoint: The checkpoint to save
+            metadata: Additional metadata to save with the checkpoint
+            new_versions: New channel versions as of this write
+
+        Returns:
+            The config pointing at the saved checkpoint
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = checkpoint["id"]
+
+        checkpoint_type, checkpoint_bytes = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_bytes = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        thread_ref = self._thread_ref(thread_id)
+        batch = self.db.batch()
+        batch.set(thread_ref.collection("checkpoints").document(self._checkpoint_doc_id(checkpoint_ns, checkpoint_id)), {
+            "checkpoint_ns": checkpoint_ns,
+            "checkpoint_id": checkpoint_id,
+            "parent_checkpoint_id": config["configurable"].get("checkpoint_id"),
+            "checkpoint_type": checkpoint_type,
+            "checkpoint": checkpoint_bytes,
+            "metadata_type": metadata_type,
+            "metadata": metadata_bytes,
+        })
+        batch.set(thread_ref, {
+            "latest_checkpoint_ids": {checkpoint_ns or ROOT_NAMESPACE: checkpoint_id}
+        }, merge=True)
+        batch.commit()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint_id,
+            }
+        }
+
+    def put_writes(
+        self,
+        config: Dict[str, Any],
+        writes: Sequence[Tuple[str, Any]],
+        task_id: str,
+        task_path: str = "",
+    ) -> None:
+        """Save intermediate writes produced by a node for a checkpoint
+
+        Args:
+            config: The config of the checkpoint the writes belong to
+            writes: List of (channel, value) pairs
+            task_id: Identifier of the task that produced the writes
+            task_path: Path of the task that produced the writes
+        """
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_key = self._checkpoint_doc_id(checkpoint_ns, config["configurable"]["checkpoint_id"])
+        writes_ref = self._thread_ref(thread_id).collection("writes")
+
+        batch = self.db.batch()
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            value_type, value_bytes = self.serde.dumps_typed(value)
+            batch.set(writes_ref.document(f"{checkpoint_key}:{task_id}:{write_idx}"), {
+                "checkpoint_key": checkpoint_key,
+                "task_id": task_id,
+                "task_path": task_path,
+                "idx": write_idx,
+                "channel": channel,
+                "type": value_type,
+                "value": value_bytes,
+            })
+        batch.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Delete all checkpoints and writes saved for a thread
+
+        Args:
+            thread_id: The thread (analysis document) ID to delete
+        """
+        thread_ref = self._thread_ref(thread_id)
+        # A long analysis leaves more checkpoints and writes than fit in one 500-write batch
+        deletes = [
+            ("delete", doc.reference, None)
+            for subcollection in ("checkpoints", "writes")
+            for doc in thread_ref.collection(subcollection).stream()
+        ]
+        bulk_write(self.db, deletes + [("delete", thread_ref, None)])
+
+
+_checkpointer = None
+
+
+def get_checkpointer() -> BaseCheckpointSaver:
+    """Get the process-wide checkpoint saver
+
+    Uses Firestore by default; set ANALYSIS_CHECKPOINTER=memory to keep
+    checkpoints in memory (local development and tests).
+    """
+    global _checkpointer
+    if _checkpointer is None:
+        if os.getenv("ANALYSIS_CHECKPOINTER", "firestore").lower() == "memory":
+            _checkpointer = MemorySaver()
+        else:
+            _checkpointer = FirestoreCheckpointSaver()
+    return _checkpointer
+
+
+def invoke_with_checkpoint(app, initial_state: dict, thread_id: str) -> dict:
+    """Run a checkpointed graph, resuming from the last completed node if possible
+
+    Args:
+        app: Graph compiled with a checkpointer
+        initial_state: State to start from when there is no saved progress
+        thread_id: Key for the saved progress (the analysis document ID)
+
+    Returns:
+        The final graph state
+    """
+    config = {"configurable": {"thread_id": thread_id}}
+    snapshot = app.get_state(config)
+
+    if not snapshot.values:
+        return app.invoke(initial_state, config)
+
+    if not snapshot.next:
+        logger.info(f"Analysis {thread_id} already completed, reusing checkpointed state")
+        return snapshot.values
+
+    logger.info(f"Resuming analysis {thread_id} at node(s): {', '.join(snapshot.next)}")
+    return app.invoke(None, config)
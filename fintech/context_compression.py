@@ -0,0 +1,77 @@
+import re
+from typing import List, Set
+
+# Documents shorter than this are passed through unchanged
+MIN_COMPRESS_CHARS = 300
+# Never reduce a document to fewer sentences than this
+MIN_SENTENCES = 2
+STEM_CHARS = 5
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+|\n+")
+WORD_RE = re.compile(r"[a-z0-9]+")
+NUMBER_RE = re.compile(r"\d")
+
+STOPWORDS = {
+    "the", "and", "for", "with", "that", "this", "from", "into", "are", "was", "were", "its", "their",
+    "analyze", "analysis", "provide", "based", "stock", "company", "including", "about", "any"
+}
+
+
+def stem(word: str) -> str:
+    """Crude prefix stem, so "trading"/"trades" and "risks"/"risky" match"""
+    return word[:STEM_CHARS]
+
+
+def query_terms(query: str) -> Set[str]:
+    return {stem(word) for word in WORD_RE.findall(query.lower()) if len(word) > 2 and word not in STOPWORDS}
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in SENTENCE_RE.split(text) if sentence.strip()]
+
+
+def score_sentence(sentence: str, terms: Set[str]) -> float:
+    """Query terms in the sentence, plus a bonus for figures (prices, ratios, dates)"""
+    words = {stem(word) for word in WORD_RE.findall(sentence.lower())}
+    score = len(words & terms)
+    if NUMBER_RE.search(sentence):
+        score += 1
+    return score
+
+
+def compress_text(text: str, query: str) -> str:
+    """Keep only the sentences of a text that are relevant to a query
+
+    The first sentence (usually a headline or title) is always kept, as are
+    sentences that mention a query term or contain figures. Kept sentences
+    stay in their original order.
+
+    Args:
+        text: Retrieved document text
+        query: Query the document was retrieved for
+
+    Returns:
+        The compressed text, or the original text if it's short or nothing would be dropped
+    """
+    if len(text) < MIN_COMPRESS_CHARS:
+        return text
+    sentences = split_sentences(text)
+    if len(sentences) <= MIN_SENTENCES:
+        return text
+
+    terms = query_terms(query)
+    scores = [score_sentence(sentence, terms) for sentence in sentences]
+    keep = {0} | {i for i, score in enumerate(scores) if score >= 1}
+    for i in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+        if len(keep) >= MIN_SENTENCES:
+            break
+        keep.add(i)
+    if len(keep) == len(sentences):
+        return text
+    separator = "\n" if "\n" in text else " "
+    return separator.join(sentences[i] for i in sorted(keep))
+
+
+def compress_documents(docs: List, query: str) -> List:
+    """Apply compress_text to each document, keeping its metadata"""
+    return [type(doc)(page_content=compress_text(doc.page_content, query), metadata=doc.metadata) for doc in docs]
@@ -0,0 +1,163 @@
+import logging
+import re
+from functools import lru_cache
+from typing import List, Set
+from context_compression import compress_documents
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budget for retrieved context, per analysis agent (retrieval context type)
+AGENT_TOKEN_BUDGETS = {
+    "market_analysis": 1500,
+    "trading_strategy": 1200,
+    "execution_planning": 800,
+    "risk_assessment": 1200
+}
+DEFAULT_TOKEN_BUDGET = 1200
+
+SHINGLE_SIZE = 5
+DUPLICATE_THRESHOLD = 0.8  # Jaccard similarity of word shingles above which a chunk is dropped
+MIN_OVERLAP_CHARS = 40  # Shortest suffix/prefix overlap treated as splitter overlap
+MAX_OVERLAP_CHARS = 400  # Splitter overlap is 200 characters; leave room for whitespace differences
+MIN_TRUNCATED_TOKENS = 64  # Don't include a chunk cut down to fewer tokens than this
+
+WORD_RE = re.compile(r"\w+")
+
+
+@lru_cache(maxsize=1)
+def get_encoder():
+    """tiktoken encoder, loaded on first use; None if it can't be loaded"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"tiktoken unavailable, estimating tokens from length: {str(e)}")
+        return None
+
+
+def count_tokens(text: str) -> int:
+    encoder = get_encoder()
+    if encoder is None:
+        return len(text) // 4 + 1
+    return len(encoder.encode(text))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    encoder = get_encoder()
+    if encoder is None:
+        return text[:max_tokens * 4]
+    return encoder.decode(encoder.encode(text)[:max_tokens])
+
+
+def shingles(text: str, size: int = SHINGLE_SIZE) -> Set[tuple]:
+    words = WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: Set[tuple], b: Set[tuple]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def overlap_length(first: str, second: str) -> int:
+    """Length of the longest suffix of first that is a prefix of second"""
+    longest = min(len(first), len(second), MAX_OVERLAP_CHARS)
+    for length in range(longest, MIN_OVERLAP_CHARS - 1, -1):
+        if first.endswith(second[:length]):
+            return length
+    return 0
+
+
+def header(doc) -> str:
+    return (
+        f"Source: {doc.metadata.get('source', 'Unknown')}\n"
+        f"Date: {doc.metadata.get('date', 'Unknown')}\n"
+        f"Type: {doc.metadata.get('type', 'Unknown')}\n"
+    )
+
+
+def drop_near_duplicates(docs: List, threshold: float = DUPLICATE_THRESHOLD) -> List:
+    """Drop documents whose shingles mostly repeat a more relevant document
+
+    Documents are assumed to be in relevance order, so the first copy wins.
+    """
+    kept, kept_shingles = [], []
+    for doc in docs:
+        doc_shingles = shingles(doc.page_content)
+        if any(jaccard(doc_shingles, other) >= threshold for other in kept_shingles):
+            continue
+        kept.append(doc)
+        kept_shingles.append(doc_shingles)
+    return kept
+
+
+def merge_adjacent_chunks(docs: List) -> List:
+    """Merge chunks of the same source whose text overlaps end-to-start
+
+    RecursiveCharacterTextSplitter repeats up to chunk_overlap characters
+    between neighbouring chunks; merging them keeps that text once. The
+    merged document takes the position of the more relevant chunk.
+    """
+    merged = []
+    for doc in docs:
+        for i, existing in enumerate(merged):
+            if existing.metadata.get("source") != doc.metadata.get("source"):
+                continue
+            overlap = overlap_length(existing.page_content, doc.page_content)
+            if overlap:
+                text = existing.page_content + doc.page_content[overlap:]
+            else:
+                overlap = overlap_length(doc.page_content, existing.page_content)
+                if not overlap:
+                    continue
+                text = doc.page_content + existing.page_content[overlap:]
+            merged[i] = type(existing)(page_content=text, metadata=existing.metadata)
+            break
+        else:
+            merged.append(doc)
+    return merged
+
+
+def pack_context(docs: List, token_budget: int = DEFAULT_TOKEN_BUDGET, query: str = None) -> List:
+    """Select retrieved documents for a prompt within a token budget
+
+    Near-duplicates are dropped, overlapping chunks of one source are
+    merged, and, if a query is given, each document is cut down to its
+    query-relevant sentences. Documents are then added in relevance order
+    until the budget is reached; a document that doesn't fit is truncated
+    if enough budget is left, otherwise skipped.
+
+    Args:
+        docs: Retrieved documents, most relevant first
+        token_budget: Maximum tokens for the packed documents, headers included
+        query: Query the documents were retrieved for
+
+    Returns:
+        The documents to put in the prompt
+    """
+    docs = merge_adjacent_chunks(drop_near_duplicates(docs))
+    if query:
+        docs = compress_documents(docs, query)
+
+    packed = []
+    remaining = token_budget
+    for doc in docs:
+        header_tokens = count_tokens(header(doc))
+        content_tokens = count_tokens(doc.page_content)
+        if header_tokens + content_tokens <= remaining:
+            packed.append(doc)
+            remaining -= header_tokens + content_tokens
+            continue
+        available = remaining - header_tokens
+        if available >= MIN_TRUNCATED_TOKENS:
+            packed.append(type(doc)(page_content=truncate_to_tokens(doc.page_content, available), metadata=doc.metadata))
+            break
+        # Too little room to be useful; a shorter document further down may still fit
+    return packed
+
+
+def token_budget_for(context_type: str = None) -> int:
+    return AGENT_TOKEN_BUDGETS.get(context_type, DEFAULT_TOKEN_BUDGET)
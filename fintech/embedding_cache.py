@@ -0,0 +1,158 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+import numpy as np
+from google.cloud import firestore
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_COLLECTION = "embedding_cache"
+DEFAULT_MAX_ENTRIES = 4096
+
+EMBEDDING_LATENCY = registry.histogram("embedding_request_seconds", "OpenAI embedding request latency by operation")
+EMBEDDING_CACHE_LOOKUPS = registry.counter("embedding_cache_lookups_total", "Query embedding cache lookups by layer that answered")
+
+
+def model_name(embeddings) -> str:
+    """Name identifying the embedding model, so vectors of different models never mix"""
+    return getattr(embeddings, "model", None) or type(embeddings).__name__
+
+
+def cache_key(model: str, text: str) -> str:
+    """Cache key (and Firestore document ID) for a text embedded with a model"""
+    return hashlib.sha256(f"{model}\n{text}".encode("utf-8")).hexdigest()
+
+
+def to_float32(embedding) -> np.ndarray:
+    return np.asarray(embedding, dtype=np.float32)
+
+
+class EmbeddingCache:
+    """Two-level cache of embeddings keyed by model name and text hash
+
+    An in-process LRU answers repeats on the same instance; a Firestore
+    collection shares embeddings across instances and cold starts. Vectors
+    are kept as float32 arrays and stored as raw float32 bytes.
+    """
+
+    def __init__(
+        self,
+        max_size: int = DEFAULT_MAX_ENTRIES,
+        db=None,
+        collection_name: str = EMBEDDING_CACHE_COLLECTION,
+        persistent: bool = True
+    ):
+        """Initialize the embedding cache
+
+        Args:
+            max_size: Maximum number of embeddings kept in memory
+            db: Firestore client (defaults to the app's client)
+            collection_name: Collection holding the persistent layer
+            persistent: Whether to read and write the Firestore layer
+        """
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.collection = None
+        if persistent:
+            if db is None:
+                from firebase.config import db
+            self.collection = db.collection(collection_name)
+
+    def _remember(self, key: str, embedding: np.ndarray) -> None:
+        with self._lock:
+            self._entries[key] = embedding
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def get(self, model: str, text: str) -> Optional[np.ndarray]:
+        """Get a cached embedding from memory, then Firestore"""
+        key = cache_key(model, text)
+        with self._lock:
+            embedding = self._entries.get(key)
+            if embedding is not None:
+                self._entries.move_to_end(key)
+        if embedding is not None:
+            EMBEDDING_CACHE_LOOKUPS.inc(layer="memory")
+            return embedding
+
+        if self.collection is not None:
+            try:
+                snapshot = self.collection.document(key).get()
+                data = snapshot.to_dict() if snapshot.exists else None
+                if data and data.get("model") == model:
+                    embedding = np.frombuffer(data["embedding"], dtype=np.float32)
+                    self._remember(key, embedding)
+                    EMBEDDING_CACHE_LOOKUPS.inc(layer="firestore")
+                    return embedding
+            except Exception as e:
+                logger.warning(f"Embedding cache read failed: {str(e)}")
+
+        EMBEDDING_CACHE_LOOKUPS.inc(layer="miss")
+        return None
+
+    def put(self, model: str, text: str, embedding) -> np.ndarray:
+        """Cache an embedding in memory and Firestore
+
+        Returns:
+            The embedding as a float32 array
+        """
+        key = cache_key(model, text)
+        embedding = to_float32(embedding)
+        self._remember(key, embedding)
+        if self.collection is not None:
+            try:
+                self.collection.document(key).set({
+                    "model": model,
+                    "dimensions": int(embedding.shape[0]),
+                    "embedding": embedding.tobytes(),
+                    "timestamp": firestore.SERVER_TIMESTAMP
+                })
+            except Exception as e:
+                # The in-memory copy is still usable; the next instance will just re-embed
+                logger.warning(f"Embedding cache write failed: {str(e)}")
+        return embedding
+
+    def clear(self) -> None:
+        """Clear the in-memory layer"""
+        with self._lock:
+            self._entries.clear()
+
+
+class CachedEmbeddings:
+    """Embeddings wrapper that serves repeated queries from an EmbeddingCache
+
+    Query strings in the analysis prompts are templates parameterized only by
+    ticker, so after the first analysis of a ticker its queries are answered
+    from the cache without an embedding API call. Document embeddings are
+    stored alongside their chunks and pass straight through.
+    """
+
+    def __init__(self, embeddings, cache: EmbeddingCache = None):
+        """Initialize the wrapper
+
+        Args:
+            embeddings: LangChain embeddings model (e.g. OpenAIEmbeddings)
+            cache: Cache to use (defaults to a persistent EmbeddingCache)
+        """
+        self.embeddings = embeddings
+        self.model = model_name(embeddings)
+        self.cache = cache if cache is not None else EmbeddingCache()
+
+    def embed_query(self, text: str) -> List[float]:
+        embedding = self.cache.get(self.model, text)
+        if embedding is None:
+            with EMBEDDING_LATENCY.time(operation="query"):
+                embedding = self.embeddings.embed_query(text)
+            embedding = self.cache.put(self.model, text, embedding)
+        # Cached and fresh embeddings are both float32, so results don't depend on cache state
+        return embedding.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        with EMBEDDING_LATENCY.time(operation="documents"):
+            return self.embeddings.embed_documents(texts)
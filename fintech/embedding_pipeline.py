@@ -0,0 +1,124 @@
+import logging
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List
+
+from context_packer import count_tokens
+from vector_store import VectorStore
+
+logger = logging.getLogger(__name__)
+
+# OpenAI accepts up to 300k tokens and 2048 inputs per embeddings request
+PROVIDER_MAX_BATCH_TOKENS = 300_000
+PROVIDER_MAX_BATCH_INPUTS = 2048
+# Smaller batches keep memory low and give the concurrent requests something to overlap
+DEFAULT_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "50000"))
+DEFAULT_MAX_IN_FLIGHT = int(os.getenv("EMBEDDING_BATCHES_IN_FLIGHT", "4"))
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 200
+
+
+def default_text_splitter():
+    """The splitter RAG documents are chunked with (imported on first use)"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+
+
+def iter_chunks(documents: Iterable[Dict[str, Any]], text_splitter) -> Iterator[Dict[str, Any]]:
+    """Split documents into chunks, each keeping its document's metadata (ticker, sector, ...)"""
+    for doc in documents:
+        for text in text_splitter.split_text(doc["text"]):
+            yield {**doc, "text": text}
+
+
+def token_batches(
+    chunks: Iterable[Dict[str, Any]],
+    max_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_inputs: int = PROVIDER_MAX_BATCH_INPUTS
+) -> Iterator[List[Dict[str, Any]]]:
+    """Group chunks into batches of at most max_tokens tiktoken tokens and max_inputs chunks"""
+    max_tokens = min(max_tokens, PROVIDER_MAX_BATCH_TOKENS)
+    batch: List[Dict[str, Any]] = []
+    batch_tokens = 0
+    for chunk in chunks:
+        tokens = count_tokens(chunk["text"])
+        if batch and (batch_tokens + tokens > max_tokens or len(batch) >= max_inputs):
+            yield batch
+            batch, batch_tokens = [], 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    if batch:
+        yield batch
+
+
+def embed_batch(vector_store: VectorStore, embedding_model, batch: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Embed a batch's chunks that aren't stored yet and write them"""
+    new = vector_store.new_documents(batch)
+    if new:
+        embeddings = embedding_model.embed_documents([chunk["text"] for chunk in new])
+        vector_store.add_documents(new, embeddings)
+    return {"chunks": len(batch), "written": len(new)}
+
+
+def embed_and_store(
+    chunks: Iterable[Dict[str, Any]],
+    embedding_model,
+    vector_store: VectorStore,
+    max_tokens: int = DEFAULT_BATCH_TOKENS,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
+) -> Dict[str, Any]:
+    """Embed chunks in concurrent token-bounded batches, writing each batch as it completes
+
+    Chunks are consumed lazily and at most max_in_flight batches are held
+    at once, so memory doesn't grow with the number of chunks. Chunks that
+    are already stored are neither embedded nor rewritten. The first error
+    is raised after in-flight batches finish; batches written before it
+    stay written.
+
+    Args:
+        chunks: Chunk dicts with `text` and metadata, e.g. from iter_chunks
+        embedding_model: Object with embed_documents(texts)
+        vector_store: Store the embedded chunks are written to
+        max_tokens: Token limit per embeddings request
+        max_in_flight: Batches embedded or written at once
+
+    Returns:
+        Stats dict with chunks, written, batches and seconds
+    """
+    start = time.perf_counter()
+    stats = {"chunks": 0, "written": 0, "batches": 0}
+    error = None
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = set()
+
+        def collect(done) -> None:
+            nonlocal error
+            for future in done:
+                futures.discard(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                stats["chunks"] += result["chunks"]
+                stats["written"] += result["written"]
+                stats["batches"] += 1
+
+        for batch in token_batches(chunks, max_tokens):
+            if error is not None:
+                break
+            if len(futures) >= max_in_flight:
+                collect(wait(futures, return_when=FIRST_COMPLETED)[0])
+            futures.add(executor.submit(embed_batch, vector_store, embedding_model, batch))
+        collect(wait(futures)[0])
+
+    stats["seconds"] = time.perf_counter() - start
+    if error is not None:
+        raise error
+    if stats["written"]:
+        logger.info(
+            f"Embedded and wrote {stats['written']} of {stats['chunks']} chunks "
+            f"in {stats['batches']} batches in {stats['seconds']:.2f}s"
+        )
+    return stats
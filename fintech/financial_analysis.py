@@ -1,5 +1,3 @@
-import yfinance as yf
-import pandas as pd
 from typing import TypedDict, Annotated, Sequence
 from langgraph.graph import StateGraph, START, END
 from langchain_core.messages import BaseMessage, HumanMessage
@@ -8,13 +6,16 @@ from langchain_anthropic import ChatAnthropic
 from langchain_core.output_parsers import JsonOutputParser
 from dotenv import load_dotenv
 import os
-from utils import get_claude_api_key, get_alpha_vantage_api_key
+from utils import get_claude_api_key
 import time
-from functools import lru_cache
 import logging
 import requests
 from datetime import datetime, timedelta
-from rag_utils import rag_manager
+from rag_utils import get_rag_manager
+from checkpointing import get_checkpointer, invoke_with_checkpoint
+from metrics import registry
+from ingestion import QuotaExhausted
+from market_data import AlphaVantageThrottled, get_market_data_client
 
 load_dotenv()
 
@@ -22,6 +23,18 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+ALPHA_VANTAGE_ERRORS = registry.counter("alpha_vantage_errors_total", "Failed Alpha Vantage stock info fetches")
+AGENT_LATENCY = registry.histogram("agent_latency_seconds", "Latency of each analysis agent node, including retrieval")
+AGENT_ERRORS = registry.counter("agent_errors_total", "Analysis agent node failures")
+
+# Retrieval query for each agent, by the context type it retrieves
+CONTEXT_QUERIES = {
+    "market_analysis": "Analyze {ticker} stock performance, financial metrics, and market position",
+    "trading_strategy": "Develop trading strategies for {ticker} based on current market conditions and historical patterns",
+    "execution_planning": "Create execution plans for {ticker} considering market conditions and liquidity",
+    "risk_assessment": "Evaluate risks for {ticker} considering market conditions and regulatory environment"
+}
+
 # Define the state for our graph
 class AgentState(TypedDict):
     messages: Annotated[Sequence[BaseMessage], "The messages in the conversation"]
@@ -40,95 +53,70 @@ def safe_float_convert(value, default=0.0):
     except (ValueError, TypeError):
         return default
 
-@lru_cache(maxsize=100)
 def get_stock_info(ticker):
     """
-    Cached function to get comprehensive stock info using Alpha Vantage API
+    Get comprehensive stock info from the shared market data client
+
+    Prices and the company overview are cached by the client per day, so
+    repeat analyses (and RAG ingestion of the same ticker) don't refetch them.
     """
+    import pandas as pd  # Deferred: only needed once an analysis actually runs
+
     max_retries = 3
     retry_delay = 5  # seconds
-    api_key = get_alpha_vantage_api_key()
+    client = get_market_data_client()
     
     for attempt in range(max_retries):
         try:
-            # Get daily time series data
-            daily_url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY&symbol={ticker}&apikey={api_key}"
-            daily_response = requests.get(daily_url)
-            daily_data = daily_response.json()
-            
-            logger.info(f"Daily data response for {ticker}: {daily_data.keys()}")
-            
-            # Get company overview
-            overview_url = f"https://www.alphavantage.co/query?function=OVERVIEW&symbol={ticker}&apikey={api_key}"
-            overview_response = requests.get(overview_url)
-            overview_data = overview_response.json()
-            
-            if "Error Message" in daily_data or "Error Message" in overview_data:
-                raise Exception("API Error: " + (daily_data.get("Error Message") or overview_data.get("Error Message")))
-            
-            # Extract daily data
-            daily_series = daily_data.get("Time Series (Daily)", {})
+            daily_bars = client.get_daily_series(ticker)
+            overview = client.get_company_overview(ticker) or {}
             
             # Check if we have any data
-            if not daily_series:
+            if not daily_bars:
                 logger.error(f"No daily data available for ticker {ticker}")
                 return None
                 
-            logger.info(f"Number of daily data points for {ticker}: {len(daily_series)}")
+            latest_data = daily_bars[-1]
+            logger.info(f"Latest date for {ticker} of {len(daily_bars)} daily data points: {latest_data['date']}")
             
-            try:
-                latest_date = max(daily_series.keys())
-                latest_data = daily_series[latest_date]
-                logger.info(f"Latest date for {ticker}: {latest_date}")
-            except (ValueError, KeyError) as e:
-                logger.error(f"Error processing daily data for {ticker}: {str(e)}")
-                return None
+            # Convert daily closes to a series for technical analysis
+            closes = pd.Series(
+                [bar["close"] for bar in daily_bars],
+                index=pd.to_datetime([bar["date"] for bar in daily_bars])
+            )
             
-            # Convert daily data to DataFrame for technical analysis
+            # Calculate technical indicators
             try:
-                df = pd.DataFrame.from_dict(daily_series, orient='index')
-                df.index = pd.to_datetime(df.index)
-                df = df.astype(float)
-                logger.info(f"DataFrame shape for {ticker}: {df.shape}")
+                sma_50 = closes.rolling(window=50).mean().iloc[-1]
+                sma_200 = closes.rolling(window=200).mean().iloc[-1]
+                logger.info(f"Calculated SMAs for {ticker} - SMA50: {sma_50}, SMA200: {sma_200}")
+                rsi = calculate_rsi(closes)
+                volatility = closes.pct_change().std() * (252 ** 0.5)  # Annualized volatility
             except Exception as e:
-                logger.error(f"Error converting data to DataFrame for {ticker}: {str(e)}")
-                df = pd.DataFrame()  # Empty DataFrame as fallback
-            
-            # Calculate technical indicators
-            if not df.empty:
-                try:
-                    sma_50 = df['4. close'].rolling(window=50).mean().iloc[-1]
-                    sma_200 = df['4. close'].rolling(window=200).mean().iloc[-1]
-                    logger.info(f"Calculated SMAs for {ticker} - SMA50: {sma_50}, SMA200: {sma_200}")
-                    rsi = calculate_rsi(df['4. close'])
-                    volatility = df['4. close'].pct_change().std() * (252 ** 0.5)  # Annualized volatility
-                except Exception as e:
-                    logger.warning(f"Error calculating technical indicators for {ticker}: {str(e)}")
-                    sma_50 = sma_200 = rsi = volatility = None
-            else:
+                logger.warning(f"Error calculating technical indicators for {ticker}: {str(e)}")
                 sma_50 = sma_200 = rsi = volatility = None
             
-            # Combine data from both endpoints using safe float conversion
+            # Combine prices and overview, with 0.0 for metrics Alpha Vantage doesn't report
             enhanced_info = {
                 # Basic Info
-                'currentPrice': safe_float_convert(latest_data.get('4. close')),
-                'marketCap': safe_float_convert(overview_data.get('MarketCapitalization')),
-                'forwardPE': safe_float_convert(overview_data.get('ForwardPE')),
-                'trailingPE': safe_float_convert(overview_data.get('TrailingPE')),
-                'dividendYield': safe_float_convert(overview_data.get('DividendYield')),
-                'beta': safe_float_convert(overview_data.get('Beta')),
-                'fiftyTwoWeekHigh': safe_float_convert(overview_data.get('52WeekHigh')),
-                'fiftyTwoWeekLow': safe_float_convert(overview_data.get('52WeekLow')),
-                'volume': safe_float_convert(latest_data.get('5. volume')),
-                'averageVolume': safe_float_convert(overview_data.get('AverageVolume')),
+                'currentPrice': latest_data['close'],
+                'marketCap': safe_float_convert(overview.get('market_cap')),
+                'forwardPE': safe_float_convert(overview.get('forward_pe')),
+                'trailingPE': safe_float_convert(overview.get('trailing_pe')),
+                'dividendYield': safe_float_convert(overview.get('dividend_yield')),
+                'beta': safe_float_convert(overview.get('beta')),
+                'fiftyTwoWeekHigh': safe_float_convert(overview.get('week_52_high')),
+                'fiftyTwoWeekLow': safe_float_convert(overview.get('week_52_low')),
+                'volume': latest_data['volume'],
+                'averageVolume': safe_float_convert(overview.get('average_volume')),
                 
                 # Financial Metrics
-                'returnOnEquity': safe_float_convert(overview_data.get('ReturnOnEquityTTM')),
-                'profitMargins': safe_float_convert(overview_data.get('ProfitMargin')),
-                'revenueGrowth': safe_float_convert(overview_data.get('RevenueGrowth')),
-                'debtToEquity': safe_float_convert(overview_data.get('DebtToEquityRatio')),
-                'quickRatio': safe_float_convert(overview_data.get('QuickRatio')),
-                'currentRatio': safe_float_convert(overview_data.get('CurrentRatio')),
+                'returnOnEquity': safe_float_convert(overview.get('return_on_equity')),
+                'profitMargins': safe_float_convert(overview.get('profit_margin')),
+                'revenueGrowth': safe_float_convert(overview.get('revenue_growth')),
+                'debtToEquity': safe_float_convert(overview.get('debt_to_equity')),
+                'quickRatio': safe_float_convert(overview.get('quick_ratio')),
+                'currentRatio': safe_float_convert(overview.get('current_ratio')),
                 
                 # Technical Indicators
                 'SMA50': sma_50,
@@ -137,22 +125,33 @@ def get_stock_info(ticker):
                 'annualizedVolatility': volatility,
                 
                 # Additional Data
-                'sector': overview_data.get('Sector'),
-                'industry': overview_data.get('Industry'),
-                'fullTimeEmployees': int(safe_float_convert(overview_data.get('FullTimeEmployees'))),
-                'recommendationKey': overview_data.get('AnalystTargetPrice')
+                'sector': overview.get('sector'),
+                'industry': overview.get('industry'),
+                'fullTimeEmployees': overview.get('full_time_employees') or 0,
+                'recommendationKey': overview.get('analyst_target_price')
             }
             
             return enhanced_info
             
-        except Exception as e:
-            if "API call frequency" in str(e) and attempt < max_retries - 1:
-                logger.warning(f"Rate limit hit, retrying in {retry_delay} seconds...")
+        except (requests.RequestException, AlphaVantageThrottled) as e:
+            # The client holds further calls after a throttle message, so the retry waits out the limit
+            if attempt < max_retries - 1:
+                logger.warning(f"Alpha Vantage request failed ({str(e)}), retrying in {retry_delay} seconds...")
                 time.sleep(retry_delay)
                 retry_delay *= 2  # Exponential backoff
             else:
                 logger.error(f"Error fetching stock info for {ticker}: {str(e)}")
+                ALPHA_VANTAGE_ERRORS.inc()
                 return None
+        except QuotaExhausted as e:
+            # Retrying can't help until the quota resets at midnight UTC
+            logger.error(f"Alpha Vantage daily quota exhausted, not fetching {ticker}: {str(e)}")
+            ALPHA_VANTAGE_ERRORS.inc()
+            return None
+        except Exception as e:
+            logger.error(f"Error fetching stock info for {ticker}: {str(e)}")
+            ALPHA_VANTAGE_ERRORS.inc()
+            return None
 
 def calculate_rsi(prices, periods=14):
     """Calculate RSI technical indicator"""
@@ -164,6 +163,17 @@ def calculate_rsi(prices, periods=14):
     rsi = 100 - (100 / (1 + rs))
     return rsi.iloc[-1]
 
+def timed_node(agent: str, node):
+    """Wrap a graph node so its latency and failures are recorded per agent"""
+    def run(state):
+        try:
+            with AGENT_LATENCY.time(agent=agent):
+                return node(state)
+        except Exception:
+            AGENT_ERRORS.inc(agent=agent)
+            raise
+    return run
+
 def create_agent(name: str, description: str, llm: ChatAnthropic):
     """Create a LangChain agent with specific role and capabilities"""
     prompt = ChatPromptTemplate.from_messages([
@@ -174,11 +184,17 @@ def create_agent(name: str, description: str, llm: ChatAnthropic):
     chain = prompt | llm | JsonOutputParser()
     return chain
 
-def analyze_stock(stock_selection: str):
+def analyze_stock(stock_selection: str, thread_id: str = None):
     """
     Analyze a stock using LangGraph for multi-agent collaboration
+
+    When thread_id (the analysis document ID) is given, progress is checkpointed
+    after every agent and a retried analysis resumes from the last completed node.
     """
     try:
+        # Created first so its keyword index loads in the background while market data is fetched
+        rag_manager = get_rag_manager()
+
         # Get stock data with retry logic
         stock_data = get_stock_info(stock_selection)
         if not stock_data:
@@ -188,6 +204,12 @@ def analyze_stock(stock_selection: str):
         if not claude_api_key:
             raise Exception("Claude API key not found. Please check your environment variables.")
 
+        # Run all four agents' retrievals concurrently up front; each agent then hits the cache
+        rag_manager.prefetch_context([
+            {"query": query.format(ticker=stock_selection), "context_type": context_type, "ticker": stock_selection}
+            for context_type, query in CONTEXT_QUERIES.items()
+        ])
+
         # Set up LLM
         llm = ChatAnthropic(
             model_name="claude-3-5-sonnet-latest",
@@ -230,9 +252,9 @@ def analyze_stock(stock_selection: str):
             stock_data = state["stock_data"]
             
             # Retrieve relevant context for data analysis
-            context_query = f"Analyze {stock_selection} stock performance, financial metrics, and market position"
-            relevant_docs = rag_manager.retrieve_relevant_context(context_query, "market_analysis")
-            context = rag_manager.format_context_for_prompt(relevant_docs)
+            context_query = CONTEXT_QUERIES["market_analysis"].format(ticker=stock_selection)
+            relevant_docs = rag_manager.retrieve_relevant_context(context_query, "market_analysis", ticker=stock_selection)
+            context = rag_manager.format_context_for_prompt(relevant_docs, "market_analysis", context_query)
             
             analysis_prompt = f"""
             {context}
@@ -288,9 +310,9 @@ def analyze_stock(stock_selection: str):
             analysis = state["analysis_results"]["data_analysis"]
             
             # Retrieve relevant context for trading strategy
-            context_query = f"Develop trading strategies for {stock_selection} based on current market conditions and historical patterns"
-            relevant_docs = rag_manager.retrieve_relevant_context(context_query, "trading_strategy")
-            context = rag_manager.format_context_for_prompt(relevant_docs)
+            context_query = CONTEXT_QUERIES["trading_strategy"].format(ticker=stock_selection)
+            relevant_docs = rag_manager.retrieve_relevant_context(context_query, "trading_strategy", ticker=stock_selection)
+            context = rag_manager.format_context_for_prompt(relevant_docs, "trading_strategy", context_query)
             
             strategy_prompt = f"""
             {context}
@@ -375,9 +397,9 @@ def analyze_stock(stock_selection: str):
             strategy = state["analysis_results"]["trading_strategy"]
             
             # Retrieve relevant context for execution planning
-            context_query = f"Create execution plans for {stock_selection} considering market conditions and liquidity"
-            relevant_docs = rag_manager.retrieve_relevant_context(context_query, "execution_planning")
-            context = rag_manager.format_context_for_prompt(relevant_docs)
+            context_query = CONTEXT_QUERIES["execution_planning"].format(ticker=stock_selection)
+            relevant_docs = rag_manager.retrieve_relevant_context(context_query, "execution_planning", ticker=stock_selection)
+            context = rag_manager.format_context_for_prompt(relevant_docs, "execution_planning", context_query)
             
             execution_prompt = f"""
             {context}
@@ -472,9 +494,9 @@ def analyze_stock(stock_selection: str):
             execution_plan = state["analysis_results"]["execution_plan"]
             
             # Retrieve relevant context for risk assessment
-            context_query = f"Evaluate risks for {stock_selection} considering market conditions and regulatory environment"
-            relevant_docs = rag_manager.retrieve_relevant_context(context_query, "risk_assessment")
-            context = rag_manager.format_context_for_prompt(relevant_docs)
+            context_query = CONTEXT_QUERIES["risk_assessment"].format(ticker=stock_selection)
+            relevant_docs = rag_manager.retrieve_relevant_context(context_query, "risk_assessment", ticker=stock_selection)
+            context = rag_manager.format_context_for_prompt(relevant_docs, "risk_assessment", context_query)
             
             risk_prompt = f"""
             {context}
@@ -524,10 +546,10 @@ def analyze_stock(stock_selection: str):
             }
 
         # Add nodes to the graph
-        workflow.add_node("data_analyst", data_analysis)
-        workflow.add_node("trading_strategist", trading_strategy)
-        workflow.add_node("execution_agent", execution_planning)
-        workflow.add_node("risk_manager", risk_assessment)
+        workflow.add_node("data_analyst", timed_node("data_analyst", data_analysis))
+        workflow.add_node("trading_strategist", timed_node("trading_strategist", trading_strategy))
+        workflow.add_node("execution_agent", timed_node("execution_agent", execution_planning))
+        workflow.add_node("risk_manager", timed_node("risk_manager", risk_assessment))
 
         # Define edges
         workflow.add_edge(START, "data_analyst")
@@ -537,7 +559,7 @@ def analyze_stock(stock_selection: str):
         workflow.add_edge("risk_manager", END)
 
         # Compile the graph
-        app = workflow.compile()
+        app = workflow.compile(checkpointer=get_checkpointer() if thread_id else None)
 
         # Initialize state
         initial_state = {
@@ -548,7 +570,10 @@ def analyze_stock(stock_selection: str):
         }
 
         # Run the analysis
-        final_state = app.invoke(initial_state)
+        if thread_id:
+            final_state = invoke_with_checkpoint(app, initial_state, thread_id)
+        else:
+            final_state = app.invoke(initial_state)
 
         # Combine quantitative data with analysis
         final_result = {
@@ -1,108 +1,401 @@
 from google.cloud.firestore_v1.base_vector_query import DistanceMeasure
 from google.cloud.firestore_v1.vector import Vector
 from google.cloud import firestore
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
+import os
+import threading
+import time
 import numpy as np
 from firebase.config import db      
+from local_index import LocalVectorIndex
+from lexical_index import LexicalIndex, term_frequencies
+from bulk_writer import bulk_write
+from quantization import QUANTIZATIONS, RESCORE_OVERSAMPLE, quantize, rescore, truncate_embedding
+from vector_store import VECTOR_SEARCH_LATENCY, VectorStore, chunk_id, document_metadata
 
-class FirestoreVectorStore:
-    def __init__(self, collection_name: str = "financial_data"):
+VECTOR_STORE_META_COLLECTION = "vector_store_meta"
+# Document references per get_all call when checking which chunks already exist
+EXISTS_CHUNK_SIZE = 300
+# How long a read of the corpus version is trusted; bounds how stale cached retrievals can be
+CORPUS_VERSION_TTL_SECONDS = 10
+
+# find_nearest writes each hit's computed distance into this (unstored) result field
+DISTANCE_FIELD = "vector_distance"
+
+_local_indexes: Dict[str, LocalVectorIndex] = {}
+_lexical_indexes: Dict[str, LexicalIndex] = {}
+_local_indexes_lock = threading.Lock()
+
+
+def search_result(snapshot) -> Dict[str, Any]:
+    """Format a find_nearest hit as a search result"""
+    doc_data = snapshot.to_dict()
+    return {
+        "id": snapshot.id,
+        "content": doc_data["content"],
+        "metadata": doc_data["metadata"],
+        "distance": doc_data[DISTANCE_FIELD],
+        "embedding_full": doc_data.get("embedding_full"),
+        "embedding_encoding": doc_data.get("embedding_encoding")
+    }
+
+
+def get_local_index(collection) -> LocalVectorIndex:
+    """Get the process-wide local index mirroring a collection"""
+    with _local_indexes_lock:
+        index = _local_indexes.get(collection.id)
+        if index is None:
+            index = LocalVectorIndex(collection)
+            _local_indexes[collection.id] = index
+        return index
+
+
+def get_lexical_index(collection) -> LexicalIndex:
+    """Get the process-wide BM25 index over a collection"""
+    with _local_indexes_lock:
+        index = _lexical_indexes.get(collection.id)
+        if index is None:
+            index = LexicalIndex(collection)
+            _lexical_indexes[collection.id] = index
+        return index
+
+
+class FirestoreVectorStore(VectorStore):
+    backend = "firestore"
+    
+    def __init__(
+        self,
+        collection_name: str = "financial_data",
+        use_local_index: bool = None,
+        embedding_dimensions: int = None,
+        quantization: str = None
+    ):
         """Initialize Firestore vector store
         
+        With embedding_dimensions, the searched `embedding` field holds only the
+        leading dimensions. With quantization, the full embedding is also stored
+        compactly in `embedding_full` and used to rescore an oversampled set of
+        candidates, which recovers most of the recall lost to truncation.
+        Quantization requires embedding_dimensions: next to an untruncated
+        `embedding` the quantized copy would only add storage.
+
+        find_nearest needs a vector index whose dimension matches the stored
+        embeddings, plus one per metadata pre-filter combination.
+        firestore.indexes.json declares them for the full 1536 dimensions and
+        for EMBEDDING_DIMENSIONS=256; other sizes need their own entries.
+
         Args:
             collection_name: Name of the Firestore collection to use
+            use_local_index: Search an in-process mirror of the collection instead of
+                calling find_nearest (defaults to VECTOR_INDEX=local)
+            embedding_dimensions: Truncate stored and query embeddings to this many
+                dimensions (defaults to EMBEDDING_DIMENSIONS, unset keeps all)
+            quantization: "float16" or "int8" encoding of the full embedding used for
+                rescoring (defaults to EMBEDDING_QUANTIZATION, unset disables rescoring)
+
+        Raises:
+            ValueError: If quantization is unsupported or set without embedding_dimensions
         """
         self.db = db
         self.collection = self.db.collection(collection_name)
+        if use_local_index is None:
+            use_local_index = os.getenv("VECTOR_INDEX", "firestore").lower() == "local"
+        self.use_local_index = use_local_index
+        # find_nearest calls are network-bound and worth running concurrently; local index searches are not
+        self.concurrent_search = not use_local_index
+        if embedding_dimensions is None and os.getenv("EMBEDDING_DIMENSIONS"):
+            embedding_dimensions = int(os.getenv("EMBEDDING_DIMENSIONS"))
+        self.embedding_dimensions = embedding_dimensions
+        if quantization is None:
+            quantization = os.getenv("EMBEDDING_QUANTIZATION") or None
+        if quantization is not None and quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        if quantization is not None and not embedding_dimensions:
+            raise ValueError("Quantization requires embedding_dimensions (EMBEDDING_DIMENSIONS) to truncate the searched embedding")
+        self.quantization = quantization
+        
+        # Counter bumped by every write, so cached retrievals can tell the corpus changed
+        self.version_ref = self.db.collection(VECTOR_STORE_META_COLLECTION).document(collection_name)
+        self._corpus_version: Optional[Tuple[int, float]] = None
+    
+    def corpus_version(self) -> int:
+        """Current corpus version, re-read at most every CORPUS_VERSION_TTL_SECONDS"""
+        cached = self._corpus_version
+        if cached is not None and time.monotonic() - cached[1] < CORPUS_VERSION_TTL_SECONDS:
+            return cached[0]
+        snapshot = self.version_ref.get()
+        version = (snapshot.to_dict() or {}).get("version", 0) if snapshot.exists else 0
+        self._corpus_version = (version, time.monotonic())
+        return version
+    
+    def _bump_corpus_version(self, batch=None) -> None:
+        """Increment the corpus version, as part of a write batch if given"""
+        data = {"version": firestore.Increment(1), "updated": firestore.SERVER_TIMESTAMP}
+        if batch is not None:
+            batch.set(self.version_ref, data, merge=True)
+        else:
+            self.version_ref.set(data, merge=True)
+        self._corpus_version = None
+        
+    def get_watermark(self, key: str) -> Optional[str]:
+        """Ingestion high-water mark stored alongside the collection"""
+        snapshot = self.version_ref.collection("watermarks").document(key).get()
+        return (snapshot.to_dict() or {}).get("value") if snapshot.exists else None
+    
+    def set_watermark(self, key: str, value: str) -> None:
+        self.version_ref.collection("watermarks").document(key).set(
+            {"value": value, "updated": firestore.SERVER_TIMESTAMP}
+        )
+    
+    def new_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Filter out documents that are already stored (or repeated in the list)
+        
+        Call before embedding, so unchanged chunks cost neither an embedding
+        call nor a write.
         
-    def add_documents(self, documents: List[Dict[str, Any]], embeddings: List[List[float]]) -> None:
+        Args:
+            documents: List of document dictionaries
+            
+        Returns:
+            The documents whose content-hash ID isn't in the collection yet
+        """
+        unique = {}
+        for doc in documents:
+            unique.setdefault(chunk_id(doc), doc)
+        ids = list(unique)
+        existing = set()
+        for start in range(0, len(ids), EXISTS_CHUNK_SIZE):
+            refs = [self.collection.document(doc_id) for doc_id in ids[start:start + EXISTS_CHUNK_SIZE]]
+            # Only a small field is requested; the embedding never leaves Firestore
+            for snapshot in self.db.get_all(refs, field_paths=["timestamp"]):
+                if snapshot.exists:
+                    existing.add(snapshot.id)
+        return [doc for doc_id, doc in unique.items() if doc_id not in existing]
+    
+    def add_documents(self, documents: List[Dict[str, Any]], embeddings: List[List[float]]) -> Dict[str, Any]:
         """Add documents with their embeddings to Firestore
         
+        Documents are upserted under content-hash IDs (see chunk_id), so adding
+        the same chunk again replaces it instead of creating a duplicate.
+        Any number of documents can be added; writes are split into batches
+        under Firestore's limits and committed concurrently (see bulk_write).
+        
         Args:
             documents: List of document dictionaries containing content and metadata
             embeddings: List of embedding vectors for each document
+            
+        Returns:
+            Write stats, including docs_per_second
         """
-        batch = self.db.batch()
-        
-        for i, (doc, embedding) in enumerate(zip(documents, embeddings)):
+        writes = []
+        for doc, embedding in zip(documents, embeddings):
             # Create document data
             doc_data = {
                 "content": doc.get("text", ""),
-                "embedding": embedding,
-                "metadata": {
-                    "source": doc.get("source", "unknown"),
-                    "date": doc.get("date", "unknown"),
-                    "type": doc.get("type", "unknown")
-                },
+                # Stored as a Vector value; plain arrays aren't vector-indexed for find_nearest
+                "embedding": Vector(embedding),
+                "metadata": document_metadata(doc),
+                # Term counts for the lexical index, computed once at ingestion
+                "terms": term_frequencies(doc.get("text", "")),
                 "timestamp": firestore.SERVER_TIMESTAMP
             }
+            if self.embedding_dimensions:
+                doc_data["embedding"] = Vector(truncate_embedding(embedding, self.embedding_dimensions).tolist())
+            if self.quantization:
+                doc_data["embedding_full"], doc_data["embedding_encoding"] = quantize(embedding, self.quantization)
             
-            # Add to batch
-            doc_ref = self.collection.document()
-            batch.set(doc_ref, doc_data)
-            
-        # Commit the batch
-        batch.commit()
+            writes.append(("set", self.collection.document(chunk_id(doc)), doc_data))
+        
+        stats = bulk_write(self.db, writes)
+        # Bumped once all batches landed, so no cache is keyed to a partial corpus
+        self._bump_corpus_version()
+        return stats
         
     def search(
         self, 
         query_embedding: List[float], 
         limit: int = 10,
         distance_threshold: float = None,
-        metadata_filters: Dict[str, Any] = None
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None,
+        use_local_index: bool = None
     ) -> List[Dict[str, Any]]:
         """Search for similar documents
         
+        Filters are applied before the nearest-neighbour step, so only matching
+        documents are ranked (e.g. `{"ticker": "AAPL"}` never returns other tickers).
+        
         Args:
             query_embedding: The embedding vector to search with
             limit: Maximum number of results to return
             distance_threshold: Maximum distance for results (None for no threshold)
             metadata_filters: Dictionary of metadata fields to filter by
+            date_range: Inclusive (start, end) bounds on metadata.date, either may be None
+            use_local_index: Override the store's choice of search backend
             
         Returns:
             List of matching documents with their metadata and distances
         """
-        # Start with base query
-        query = self.collection
+        if use_local_index is None:
+            use_local_index = self.use_local_index
         
-        # Apply metadata filters if provided
-        if metadata_filters:
-            for field, value in metadata_filters.items():
-                query = query.where(f"metadata.{field}", "==", value)
+        coarse_embedding, coarse_limit, coarse_threshold = self._coarse_params(query_embedding, limit, distance_threshold)
+        if use_local_index:
+            index = get_local_index(self.collection)
+            index.ensure_fresh()
+            with VECTOR_SEARCH_LATENCY.time(backend="local"):
+                results = index.search(coarse_embedding, coarse_limit, coarse_threshold, metadata_filters, date_range)
+        else:
+            vector_query = self._vector_query(
+                self.collection, coarse_embedding, coarse_limit, coarse_threshold, metadata_filters, date_range
+            )
+            with VECTOR_SEARCH_LATENCY.time(backend="firestore"):
+                results = [search_result(doc) for doc in vector_query.stream()]
+        
+        return self._finish(query_embedding, results, limit, distance_threshold)
+    
+    def _coarse_params(
+        self,
+        query_embedding: List[float],
+        limit: int,
+        distance_threshold: Optional[float]
+    ) -> Tuple[List[float], int, Optional[float]]:
+        """Query embedding, limit and threshold for the index search
+        
+        Rescoring needs more candidates, and distances are only final after it.
+        """
+        coarse_embedding = query_embedding
+        if self.embedding_dimensions:
+            coarse_embedding = truncate_embedding(query_embedding, self.embedding_dimensions).tolist()
+        if self.quantization:
+            return coarse_embedding, limit * RESCORE_OVERSAMPLE, None
+        return coarse_embedding, limit, distance_threshold
+    
+    def _finish(
+        self,
+        query_embedding: List[float],
+        results: List[Dict[str, Any]],
+        limit: int,
+        distance_threshold: Optional[float]
+    ) -> List[Dict[str, Any]]:
+        """Rescore index results if quantization is on, and drop the encoded embeddings"""
+        if self.quantization:
+            return rescore(query_embedding, results, limit, distance_threshold)
+        for result in results:
+            result.pop("embedding_full", None)
+            result.pop("embedding_encoding", None)
+        return results
+    
+    def warm(self) -> None:
+        """Start loading the in-process indexes in the background, so the first query doesn't wait for the full scan"""
+        get_lexical_index(self.collection).warm()
+        if self.use_local_index:
+            get_local_index(self.collection).warm()
+    
+    def lexical_search(
+        self,
+        query: str,
+        limit: int = 10,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search for documents by BM25 keyword relevance
+        
+        Args:
+            query: The query text
+            limit: Maximum number of results to return
+            metadata_filters: Dictionary of metadata fields to filter by
+            date_range: Inclusive (start, end) bounds on metadata.date, either may be None
+            
+        Returns:
+            List of matching documents with their metadata and BM25 scores
+        """
+        index = get_lexical_index(self.collection)
+        index.ensure_fresh()
+        with VECTOR_SEARCH_LATENCY.time(backend="lexical"):
+            return index.search(query, limit, metadata_filters, date_range)
+    
+    def _vector_query(
+        self,
+        collection,
+        query_embedding: List[float],
+        limit: int,
+        distance_threshold: Optional[float],
+        metadata_filters: Optional[Dict[str, Any]],
+        date_range: Optional[Tuple[Optional[str], Optional[str]]]
+    ):
+        """Build a find_nearest query with pre-filters applied
+        
+        Only content, metadata and the computed distance (plus the rescoring
+        fields when quantization is on) are returned, so hits don't carry their
+        embedding back. The distance field has to be in the projection, or
+        Firestore leaves it out of projected results. Works on sync and async
+        collection references alike.
+        """
+        fields = ["content", "metadata", DISTANCE_FIELD]
+        if self.quantization:
+            fields += ["embedding_full", "embedding_encoding"]
+        
+        query = self._filtered(collection.select(fields), metadata_filters, date_range)
         
         # Create vector query
-        vector_query = query.find_nearest(
+        return query.find_nearest(
             vector_field="embedding",
             query_vector=Vector(query_embedding),
             distance_measure=DistanceMeasure.COSINE,
             limit=limit,
+            distance_result_field=DISTANCE_FIELD,
             distance_threshold=distance_threshold
         )
         
-        # Execute query and format results
-        results = []
-        for doc in vector_query.stream():
-            doc_data = doc.to_dict()
-            results.append({
-                "id": doc.id,
-                "content": doc_data["content"],
-                "metadata": doc_data["metadata"],
-                "distance": doc_data.get("distance", 0.0)
-            })
-            
-        return results
+    @staticmethod
+    def _filtered(
+        query,
+        metadata_filters: Optional[Dict[str, Any]],
+        date_range: Optional[Tuple[Optional[str], Optional[str]]]
+    ):
+        """Apply metadata equality filters and a metadata.date range to a query"""
+        if metadata_filters:
+            for field, value in metadata_filters.items():
+                query = query.where(f"metadata.{field}", "==", value)
+        if date_range:
+            start, end = date_range
+            if start:
+                query = query.where("metadata.date", ">=", start)
+            if end:
+                query = query.where("metadata.date", "<=", end)
+        return query
+    
+    def list_documents(
+        self,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """List the IDs and metadata of documents matching the filters
         
-    def delete_documents(self, document_ids: List[str]) -> None:
+        Only metadata is read, so listing is cheap enough for retention sweeps.
+        """
+        query = self._filtered(self.collection.select(["metadata"]), metadata_filters, date_range)
+        return [{"id": snapshot.id, "metadata": snapshot.to_dict().get("metadata", {})} for snapshot in query.stream()]
+    
+    def delete_documents(self, document_ids: List[str]) -> Dict[str, Any]:
         """Delete documents by their IDs
         
         Args:
             document_ids: List of document IDs to delete
+            
+        Returns:
+            Write stats, including docs_per_second
         """
-        batch = self.db.batch()
-        for doc_id in document_ids:
-            doc_ref = self.collection.document(doc_id)
-            batch.delete(doc_ref)
-        batch.commit()
+        stats = bulk_write(self.db, [("delete", self.collection.document(doc_id), None) for doc_id in document_ids])
+        self._bump_corpus_version()
+        indexes = [get_lexical_index(self.collection)]
+        if self.use_local_index:
+            indexes.append(get_local_index(self.collection))
+        for index in indexes:
+            for doc_id in document_ids:
+                index.remove(doc_id)
+        return stats
         
     def update_document(self, document_id: str, updates: Dict[str, Any]) -> None:
         """Update a document's fields
@@ -111,5 +404,7 @@ class FirestoreVectorStore:
             document_id: ID of the document to update
             updates: Dictionary of fields to update
         """
-        doc_ref = self.collection.document(document_id)
-        doc_ref.update(updates) 
\ No newline at end of file
+        batch = self.db.batch()
+        batch.update(self.collection.document(document_id), updates)
+        self._bump_corpus_version(batch)
+        batch.commit() 
\ No newline at end of file
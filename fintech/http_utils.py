@@ -0,0 +1,67 @@
+import gzip
+import hashlib
+from typing import Dict, Optional
+
+try:
+    import brotli
+except ImportError:  # Brotli is optional; gzip is always available
+    brotli = None
+
+# Bodies smaller than this aren't worth compressing
+MIN_COMPRESS_BYTES = 1024
+
+
+def make_etag(doc_id: str, timestamp: str) -> str:
+    """Strong ETag for a stored analysis version"""
+    digest = hashlib.sha1(f"{doc_id}:{timestamp}".encode("utf-8")).hexdigest()[:20]
+    return f'"{digest}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag.removeprefix("W/") == etag for tag in candidates)
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Pick the best supported content coding from an Accept-Encoding header"""
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+
+    if brotli is not None and accepted.get("br", 0) > 0:
+        return "br"
+    if accepted.get("gzip", 0) > 0:
+        return "gzip"
+    return None
+
+
+def compress_body(body: bytes, accept_encoding: Optional[str]) -> tuple[bytes, Dict[str, str]]:
+    """Compress a response body if the client accepts it and it's large enough
+
+    Returns:
+        Tuple of (body, headers to add)
+    """
+    headers = {"Vary": "Accept-Encoding"}
+    if len(body) < MIN_COMPRESS_BYTES:
+        return body, headers
+
+    encoding = choose_encoding(accept_encoding)
+    if encoding == "br":
+        return brotli.compress(body, quality=5), {**headers, "Content-Encoding": "br"}
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=6), {**headers, "Content-Encoding": "gzip"}
+    return body, headers
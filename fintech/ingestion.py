@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHECKPOINT_DIR = ".ingestion"
+DEFAULT_MAX_IN_FLIGHT = 4
+
+# A stage is (name, function, workers); each function takes the previous stage's output
+Stage = Tuple[str, Callable[[Any], Any], int]
+
+
+class QuotaExhausted(Exception):
+    """Raised by a stage when an upstream API quota is used up; no new items are started"""
+
+
+class RateLimiter:
+    """Blocks callers so that at most `calls` start within any `period_seconds` window"""
+
+    def __init__(self, calls: int, period_seconds: float = 60.0):
+        self.calls = calls
+        self.period_seconds = period_seconds
+        self._starts: deque = deque()
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+
+    def backoff(self, seconds: float) -> None:
+        """Hold every caller for `seconds`, e.g. after the upstream API reports it is being called too often"""
+        # Not under the lock: a waiter may be sleeping while holding it
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    def acquire(self) -> None:
+        # Waiters queue on the lock, so they are released in arrival order
+        with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    time.sleep(self._paused_until - now)
+                    continue
+                while self._starts and now - self._starts[0] >= self.period_seconds:
+                    self._starts.popleft()
+                if len(self._starts) < self.calls:
+                    self._starts.append(now)
+                    return
+                time.sleep(self._starts[0] + self.period_seconds - now)
+
+
+class IngestionCheckpoint:
+    """Per-item progress of an ingestion run, saved to a JSON file after every change
+
+    Items recorded as done are skipped when the run is repeated; failed or
+    unfinished items are retried.
+    """
+
+    def __init__(self, path: str):
+        """Load the checkpoint at path, or start an empty one
+
+        Args:
+            path: JSON file holding the checkpoint
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self.items: Dict[str, Dict[str, Any]] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.items = json.load(f)
+
+    @classmethod
+    def for_run(cls, run_id: str = None, directory: str = None) -> "IngestionCheckpoint":
+        """Checkpoint for a named run (defaults to today's date, so each day starts fresh)"""
+        directory = directory or os.getenv("INGESTION_CHECKPOINT_DIR", DEFAULT_CHECKPOINT_DIR)
+        run_id = run_id or datetime.now().strftime("%Y%m%d")
+        return cls(os.path.join(directory, f"{run_id}.json"))
+
+    def completed(self, key: str) -> bool:
+        return self.items.get(key, {}).get("status") == "done"
+
+    def record(self, key: str, status: str, **details) -> None:
+        with self._lock:
+            self.items[key] = {"status": status, "updated": datetime.now().isoformat(), **details}
+            self._save()
+
+    def _save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Write then rename, so an interrupted save never leaves a truncated checkpoint
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(self.items, f, indent=2, default=str)
+        os.replace(temp_path, self.path)
+
+
+def run_pipeline(
+    items: List[str],
+    stages: List[Stage],
+    checkpoint: Optional[IngestionCheckpoint] = None,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT
+) -> Dict[str, Any]:
+    """Push items through a sequence of stages, overlapping stages across items
+
+    Each stage has its own thread pool, so while one item is being written
+    the next can be embedded and a third fetched. At most max_in_flight items
+    are between the first and last stage at once, which bounds memory. An
+    item that fails in any stage is recorded and the rest carry on; a
+    QuotaExhausted error stops new items from starting and leaves them for
+    the next run.
+
+    Args:
+        items: Item keys (e.g. tickers); duplicates are processed once
+        stages: (name, function, workers) for each stage, in order
+        checkpoint: Progress record; completed items are skipped
+        max_in_flight: Maximum number of items in the pipeline at once
+
+    Returns:
+        Dict with completed, skipped, pending (lists of items) and failed
+        (item to error message)
+    """
+    items = list(dict.fromkeys(items))
+    skipped = [item for item in items if checkpoint is not None and checkpoint.completed(item)]
+    queued = deque(item for item in items if item not in skipped)
+    summary = {"completed": [], "skipped": skipped, "failed": {}, "pending": []}
+    executors = [ThreadPoolExecutor(max_workers=workers, thread_name_prefix=name) for name, _, workers in stages]
+    futures = {}
+
+    def submit(stage_index: int, item: str, value: Any) -> None:
+        future = executors[stage_index].submit(stages[stage_index][1], value)
+        futures[future] = (stage_index, item)
+
+    try:
+        while queued or futures:
+            while queued and len(futures) < max_in_flight:
+                item = queued.popleft()
+                submit(0, item, item)
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage_index, item = futures.pop(future)
+                stage_name = stages[stage_index][0]
+                try:
+                    result = future.result()
+                except QuotaExhausted as e:
+                    logger.warning(f"Quota exhausted in {stage_name} for {item}, deferring remaining items: {str(e)}")
+                    summary["pending"].append(item)
+                    summary["pending"].extend(queued)
+                    queued.clear()
+                    continue
+                except Exception as e:
+                    logger.error(f"{item} failed in {stage_name}: {str(e)}")
+                    summary["failed"][item] = f"{stage_name}: {str(e)}"
+                    if checkpoint is not None:
+                        checkpoint.record(item, "failed", stage=stage_name, error=str(e))
+                    continue
+                if stage_index + 1 < len(stages):
+                    submit(stage_index + 1, item, result)
+                    continue
+                summary["completed"].append(item)
+                if checkpoint is not None:
+                    checkpoint.record(item, "done", **(result if isinstance(result, dict) else {}))
+    finally:
+        for executor in executors:
+            executor.shutdown(wait=True)
+    return summary
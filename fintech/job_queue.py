@@ -0,0 +1,471 @@
+import itertools
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+from google.cloud import firestore
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Firestore collection holding one document per analysis job
+JOB_COLLECTION = "analysis_jobs"
+
+DEFAULT_LEASE_SECONDS = 120  # A worker that stops heartbeating loses its job after this long
+DEFAULT_MAX_ATTEMPTS = 3
+
+JOBS_TOTAL = registry.counter("analysis_jobs_total", "Analysis job attempts by outcome")
+JOBS_IN_FLIGHT = registry.gauge("analysis_jobs_in_flight", "Analysis jobs currently executing on this instance")
+JOB_DURATION = registry.histogram("analysis_job_seconds", "Duration of analysis job attempts by outcome")
+
+# Job statuses
+QUEUED = "queued"
+LEASED = "leased"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+def utc_now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def is_claimable(job: Dict[str, Any], now: datetime) -> bool:
+    """A job can be claimed when it is queued or its worker's lease has expired"""
+    if job.get("status") == QUEUED:
+        return True
+    if job.get("status") == LEASED:
+        lease_expires_at = job.get("lease_expires_at")
+        lease_expired = lease_expires_at is None or lease_expires_at <= now
+        return lease_expired and job.get("attempts", 0) < job.get("max_attempts", DEFAULT_MAX_ATTEMPTS)
+    return False
+
+
+def is_dead(job: Dict[str, Any], now: datetime) -> bool:
+    """A leased job is dead when its lease expired on its last allowed attempt"""
+    if job.get("status") != LEASED:
+        return False
+    lease_expires_at = job.get("lease_expires_at")
+    lease_expired = lease_expires_at is None or lease_expires_at <= now
+    return lease_expired and job.get("attempts", 0) >= job.get("max_attempts", DEFAULT_MAX_ATTEMPTS)
+
+
+def is_active(job: Dict[str, Any], now: datetime) -> bool:
+    """A job is active while it is queued, leased, or waiting to be reclaimed"""
+    if job.get("status") == LEASED:
+        lease_expires_at = job.get("lease_expires_at")
+        return (lease_expires_at is not None and lease_expires_at > now) or is_claimable(job, now)
+    return job.get("status") == QUEUED
+
+
+def new_job(payload: Dict[str, Any], max_attempts: int) -> Dict[str, Any]:
+    now = utc_now()
+    return {
+        "status": QUEUED,
+        "payload": payload,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "last_error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+def lease_fields(job: Dict[str, Any], worker_id: str, lease_seconds: int) -> Dict[str, Any]:
+    now = utc_now()
+    return {
+        "status": LEASED,
+        "attempts": job.get("attempts", 0) + 1,
+        "lease_owner": worker_id,
+        "lease_expires_at": now + timedelta(seconds=lease_seconds),
+        "updated_at": now,
+    }
+
+
+def failure_fields(job: Dict[str, Any], error_message: str) -> Dict[str, Any]:
+    exhausted = job.get("attempts", 0) >= job.get("max_attempts", DEFAULT_MAX_ATTEMPTS)
+    return {
+        "status": FAILED if exhausted else QUEUED,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "last_error": error_message,
+        "updated_at": utc_now(),
+    }
+
+
+def became_queued(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> bool:
+    """Whether a write (re-)queued a job, rather than claiming, heartbeating or finishing it"""
+    return bool(after) and after.get("status") == QUEUED and (not before or before.get("status") != QUEUED)
+
+
+def lease_order(job: Dict[str, Any]) -> datetime:
+    return job.get("lease_expires_at") or job["created_at"]
+
+
+def dead_lease_fields() -> Dict[str, Any]:
+    return {
+        "status": FAILED,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "last_error": "Worker lease expired on the final attempt",
+        "updated_at": utc_now(),
+    }
+
+
+class InMemoryJobQueue:
+    """Job queue kept in process memory, for tests and local development
+
+    Has the same claim/lease semantics as FirestoreJobQueue, but jobs are
+    lost when the process exits.
+    """
+
+    def __init__(self, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, job_id: str, payload: Dict[str, Any]) -> bool:
+        """Add a job unless an active job with the same ID exists
+
+        Returns:
+            True if the job was (re-)queued
+        """
+        with self._lock:
+            existing = self.jobs.get(job_id)
+            if existing and is_active(existing, utc_now()):
+                return False
+            self.jobs[job_id] = {"id": job_id, **new_job(payload, self.max_attempts)}
+            return True
+
+    def depth(self) -> int:
+        """Number of jobs waiting to be claimed"""
+        with self._lock:
+            return sum(1 for job in self.jobs.values() if job["status"] == QUEUED)
+
+    def claim_job(self, job_id: str, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Lease a specific job if it is claimable"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job or not is_claimable(job, utc_now()):
+                return None
+            job.update(lease_fields(job, worker_id, lease_seconds))
+            return dict(job)
+
+    def claim(self, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Lease the oldest queued job, or else the job whose lease expired first"""
+        with self._lock:
+            now = utc_now()
+            candidates = sorted(
+                (job for job in self.jobs.values() if is_claimable(job, now)),
+                key=lambda job: (job["status"] != QUEUED, job["created_at"] if job["status"] == QUEUED else lease_order(job))
+            )
+            if not candidates:
+                return None
+            job = candidates[0]
+            job.update(lease_fields(job, worker_id, lease_seconds))
+            return dict(job)
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> bool:
+        """Extend the lease on a job; returns False if the worker no longer holds it"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job or job["status"] != LEASED or job["lease_owner"] != worker_id:
+                return False
+            job["lease_expires_at"] = utc_now() + timedelta(seconds=lease_seconds)
+            job["updated_at"] = utc_now()
+            return True
+
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        """Mark a leased job as completed"""
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job or job["lease_owner"] != worker_id:
+                return False
+            job.update({"status": COMPLETED, "lease_owner": None, "lease_expires_at": None, "updated_at": utc_now()})
+            return True
+
+    def fail(self, job_id: str, worker_id: str, error_message: str) -> Optional[str]:
+        """Record a failed attempt, re-queueing the job until it runs out of attempts
+
+        Returns:
+            The job's new status, or None if the worker no longer holds the job
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if not job or job["lease_owner"] != worker_id:
+                return None
+            job.update(failure_fields(job, error_message))
+            return job["status"]
+
+    def fail_dead_leases(self) -> List[Dict[str, Any]]:
+        """Mark jobs whose lease expired on their last attempt as failed
+
+        Returns:
+            The jobs marked failed
+        """
+        with self._lock:
+            now = utc_now()
+            dead = sorted((job for job in self.jobs.values() if is_dead(job, now)), key=lease_order)
+            for job in dead:
+                job.update(dead_lease_fields())
+            return [dict(job) for job in dead]
+
+
+class FirestoreJobQueue:
+    """Durable job queue backed by Firestore documents
+
+    Each job is a document in `analysis_jobs`. Workers lease jobs inside a
+    transaction and keep the lease alive with heartbeats; a job whose worker
+    disappears becomes claimable again once its lease expires, and is
+    marked failed after max_attempts leases.
+    """
+
+    def __init__(self, db=None, collection_name: str = JOB_COLLECTION, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        """Initialize the job queue
+
+        Args:
+            db: Firestore client to use (defaults to the app's client)
+            collection_name: Name of the Firestore collection to use
+            max_attempts: Number of leases a job gets before it is marked failed
+        """
+        if db is None:
+            from firebase.config import db
+        self.db = db
+        self.collection = self.db.collection(collection_name)
+        self.max_attempts = max_attempts
+
+    def _update_in_transaction(self, job_id: str, apply: Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]) -> Optional[Dict[str, Any]]:
+        """Read a job and write apply(job)'s updates atomically
+
+        apply returns the fields to update, or None to leave the job untouched.
+        Returns the updated job, or None if nothing was written.
+        """
+        doc_ref = self.collection.document(job_id)
+
+        @firestore.transactional
+        def run(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return None
+            job = snapshot.to_dict()
+            updates = apply(job)
+            if updates is None:
+                return None
+            transaction.update(doc_ref, updates)
+            return {"id": job_id, **job, **updates}
+
+        return run(self.db.transaction())
+
+    def enqueue(self, job_id: str, payload: Dict[str, Any]) -> bool:
+        """Add a job unless an active job with the same ID exists
+
+        Returns:
+            True if the job was (re-)queued
+        """
+        doc_ref = self.collection.document(job_id)
+        job = new_job(payload, self.max_attempts)
+
+        @firestore.transactional
+        def run(transaction):
+            snapshot = doc_ref.get(transaction=transaction)
+            if snapshot.exists and is_active(snapshot.to_dict(), utc_now()):
+                return False
+            transaction.set(doc_ref, job)
+            return True
+
+        return run(self.db.transaction())
+
+    def depth(self) -> int:
+        """Number of jobs waiting to be claimed (one aggregation query)"""
+        result = self.collection.where("status", "==", QUEUED).count().get()
+        return int(result[0][0].value)
+
+    def claim_job(self, job_id: str, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Lease a specific job if it is claimable"""
+        return self._update_in_transaction(
+            job_id,
+            lambda job: lease_fields(job, worker_id, lease_seconds) if is_claimable(job, utc_now()) else None
+        )
+
+    def claim(self, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS, scan_limit: int = 20) -> Optional[Dict[str, Any]]:
+        """Lease the oldest queued job, or else the job whose lease expired first
+
+        Args:
+            worker_id: Identifier of the claiming worker
+            lease_seconds: Lease duration
+            scan_limit: Number of candidate jobs of each kind to try before giving up
+        """
+        now = utc_now()
+        queued = self.collection.where("status", "==", QUEUED).order_by("created_at").limit(scan_limit).stream()
+        expired = self._expired_leases(now, scan_limit)
+        for doc in itertools.chain(queued, expired):
+            if not is_claimable(doc.to_dict(), now):
+                # Dead leases are left for fail_dead_leases
+                continue
+            # Another worker may win the race for this job; move on to the next one
+            job = self.claim_job(doc.id, worker_id, lease_seconds)
+            if job:
+                return job
+        return None
+
+    def _expired_leases(self, now: datetime, limit: int):
+        return (
+            self.collection.where("status", "==", LEASED)
+            .where("lease_expires_at", "<=", now)
+            .order_by("lease_expires_at")
+            .limit(limit)
+            .stream()
+        )
+
+    def heartbeat(self, job_id: str, worker_id: str, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> bool:
+        """Extend the lease on a job; returns False if the worker no longer holds it"""
+        def extend(job):
+            if job.get("status") != LEASED or job.get("lease_owner") != worker_id:
+                return None
+            return {"lease_expires_at": utc_now() + timedelta(seconds=lease_seconds), "updated_at": utc_now()}
+
+        return self._update_in_transaction(job_id, extend) is not None
+
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        """Mark a leased job as completed"""
+        def finish(job):
+            if job.get("lease_owner") != worker_id:
+                return None
+            return {"status": COMPLETED, "lease_owner": None, "lease_expires_at": None, "updated_at": utc_now()}
+
+        return self._update_in_transaction(job_id, finish) is not None
+
+    def fail(self, job_id: str, worker_id: str, error_message: str) -> Optional[str]:
+        """Record a failed attempt, re-queueing the job until it runs out of attempts
+
+        Returns:
+            The job's new status, or None if the worker no longer holds the job
+        """
+        job = self._update_in_transaction(
+            job_id,
+            lambda job: failure_fields(job, error_message) if job.get("lease_owner") == worker_id else None
+        )
+        return job["status"] if job else None
+
+    def fail_dead_leases(self, scan_limit: int = 20) -> List[Dict[str, Any]]:
+        """Mark jobs whose lease expired on their last attempt as failed
+
+        Without this a job whose worker died on its final attempt would stay
+        leased forever: it can't be claimed again and nothing records why.
+
+        Args:
+            scan_limit: Number of expired leases to check
+
+        Returns:
+            The jobs marked failed
+        """
+        failed = []
+        for doc in self._expired_leases(utc_now(), scan_limit):
+            # Re-checked in the transaction, in case a worker reclaimed or finished the job meanwhile
+            job = self._update_in_transaction(doc.id, lambda job: dead_lease_fields() if is_dead(job, utc_now()) else None)
+            if job:
+                failed.append(job)
+        return failed
+
+
+_job_queue = None
+
+
+def get_job_queue():
+    """Get the process-wide job queue
+
+    Uses Firestore by default; set ANALYSIS_QUEUE=memory for an in-process
+    queue (tests and local development).
+    """
+    global _job_queue
+    if _job_queue is None:
+        if os.getenv("ANALYSIS_QUEUE", "firestore").lower() == "memory":
+            _job_queue = InMemoryJobQueue()
+        else:
+            _job_queue = FirestoreJobQueue()
+    return _job_queue
+
+
+def new_worker_id() -> str:
+    return f"worker-{uuid.uuid4().hex[:12]}"
+
+
+def execute_job(queue, job: Dict[str, Any], worker_id: str, handler: Callable[[Dict[str, Any]], None],
+                lease_seconds: int = DEFAULT_LEASE_SECONDS) -> str:
+    """Run a leased job, heartbeating while the handler works
+
+    The handler gets the job with a `lease_lost` event, set once a heartbeat
+    finds another worker has taken the job over. A handler should check it
+    before writing results, which are then the new lease holder's to write.
+
+    Args:
+        queue: Queue the job was claimed from
+        job: The claimed job
+        worker_id: Identifier of the worker holding the lease
+        handler: Function doing the work; raising marks the attempt as failed
+        lease_seconds: Lease duration to renew on each heartbeat
+
+    Returns:
+        The job's final status for this attempt
+    """
+    job_id = job["id"]
+    stop_heartbeat = threading.Event()
+    lease_lost = threading.Event()
+    job = {**job, "lease_lost": lease_lost}
+
+    def keep_lease():
+        while not stop_heartbeat.wait(lease_seconds / 3):
+            if not queue.heartbeat(job_id, worker_id, lease_seconds):
+                logger.warning(f"Worker {worker_id} lost the lease on job {job_id}")
+                lease_lost.set()
+                return
+
+    heartbeat_thread = threading.Thread(target=keep_lease, daemon=True)
+    heartbeat_thread.start()
+    JOBS_IN_FLIGHT.inc()
+    start = time.perf_counter()
+    try:
+        handler(job)
+    except Exception as e:
+        logger.error(f"Job {job_id} failed on attempt {job.get('attempts')}: {str(e)}")
+        status = queue.fail(job_id, worker_id, str(e))
+        JOBS_TOTAL.inc(outcome="failed")
+        JOB_DURATION.observe(time.perf_counter() - start, outcome="failed")
+        # None means another worker took over the job after our lease expired
+        return status or LEASED
+    finally:
+        JOBS_IN_FLIGHT.dec()
+        stop_heartbeat.set()
+        heartbeat_thread.join()
+
+    if lease_lost.is_set():
+        JOBS_TOTAL.inc(outcome="lease_lost")
+        JOB_DURATION.observe(time.perf_counter() - start, outcome="lease_lost")
+        return LEASED
+
+    queue.complete(job_id, worker_id)
+    JOBS_TOTAL.inc(outcome="completed")
+    JOB_DURATION.observe(time.perf_counter() - start, outcome="completed")
+    return COMPLETED
+
+
+def drain(queue, handler: Callable[[Dict[str, Any]], None], worker_id: str = None,
+          max_jobs: int = None, lease_seconds: int = DEFAULT_LEASE_SECONDS) -> List[str]:
+    """Claim and execute jobs until the queue is empty or max_jobs have run
+
+    Returns:
+        IDs of the jobs this worker executed
+    """
+    worker_id = worker_id or new_worker_id()
+    executed = []
+    while max_jobs is None or len(executed) < max_jobs:
+        job = queue.claim(worker_id, lease_seconds)
+        if not job:
+            break
+        execute_job(queue, job, worker_id, handler, lease_seconds)
+        executed.append(job["id"])
+    return executed
@@ -0,0 +1,280 @@
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from local_index import FULL_RELOAD_SECONDS, SYNC_INTERVAL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+# Reciprocal-rank fusion constant; damps the influence of the very top ranks
+RRF_K = 60
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "in", "is", "it", "its",
+    "of", "on", "or", "that", "the", "this", "to", "was", "were", "will", "with"
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOPWORDS]
+
+
+def term_frequencies(text: str) -> Dict[str, int]:
+    """Term counts of a chunk, stored with it at ingestion time"""
+    return dict(Counter(tokenize(text)))
+
+
+def matches_filters(
+    metadata: Dict[str, Any],
+    metadata_filters: Dict[str, Any] = None,
+    date_range: Tuple[Optional[str], Optional[str]] = None
+) -> bool:
+    for field, value in (metadata_filters or {}).items():
+        if metadata.get(field) != value:
+            return False
+    if date_range:
+        start, end = date_range
+        date = str(metadata.get("date", ""))
+        if (start and date < start) or (end and date > end):
+            return False
+    return True
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict[str, Any]]], limit: int, k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Fuse ranked result lists by summing 1 / (k + rank) per document ID
+
+    Returns:
+        Results in fused order, each the first-seen result dict for its ID with
+        its fused score under "rrf_score"
+    """
+    scores: Dict[str, float] = {}
+    results: Dict[str, Dict[str, Any]] = {}
+    for result_list in result_lists:
+        for rank, result in enumerate(result_list, 1):
+            scores[result["id"]] = scores.get(result["id"], 0.0) + 1.0 / (k + rank)
+            results.setdefault(result["id"], result)
+    ranked = sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)[:limit]
+    return [{**results[doc_id], "rrf_score": scores[doc_id]} for doc_id in ranked]
+
+
+class LexicalIndex:
+    """In-process BM25 inverted index over a chunk collection
+
+    Postings are built from the `terms` map FirestoreVectorStore stores with
+    each chunk at ingestion, so loading and syncing don't re-tokenize and
+    embeddings are never read. Like LocalVectorIndex, it is synced
+    incrementally by `timestamp`. Full loads can run on a background thread
+    (see warm), and searches keep using the current postings until a reload
+    finishes, so only a search that finds the index never loaded waits for one.
+    """
+
+    def __init__(
+        self,
+        collection,
+        sync_interval_seconds: int = SYNC_INTERVAL_SECONDS,
+        full_reload_seconds: int = FULL_RELOAD_SECONDS
+    ):
+        """Initialize an empty index
+
+        Args:
+            collection: Firestore collection reference to index
+            sync_interval_seconds: Minimum time between incremental syncs
+            full_reload_seconds: Time between full rebuilds
+        """
+        self.collection = collection
+        self.sync_interval_seconds = sync_interval_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._loader: Optional[threading.Thread] = None
+        # Changes made while a load reads the collection, replayed onto the loaded index
+        self._pending: Optional[List[Tuple[str, tuple]]] = None
+        self._reset()
+        self.last_sync = 0.0
+        self.last_full_load = 0.0
+
+    def _reset(self) -> None:
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.documents: Dict[str, Dict[str, Any]] = {}
+        self.total_length = 0
+        self.last_timestamp = None
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def upsert(self, doc_id: str, content: str, metadata: Dict[str, Any], terms: Dict[str, int] = None) -> None:
+        """Add or replace a document's postings"""
+        if terms is None:
+            terms = term_frequencies(content)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("upsert", (doc_id, content, metadata, terms)))
+            self._upsert(doc_id, content, metadata, terms)
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("remove", (doc_id,)))
+            self._remove(doc_id)
+
+    def _upsert(self, doc_id: str, content: str, metadata: Dict[str, Any], terms: Dict[str, int]) -> None:
+        self._remove(doc_id)
+        length = sum(terms.values())
+        self.documents[doc_id] = {"content": content, "metadata": metadata, "terms": terms, "length": length}
+        self.total_length += length
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+
+    def _remove(self, doc_id: str) -> None:
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return
+        self.total_length -= document["length"]
+        for term in document["terms"]:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+
+    def _apply(self, snapshot) -> None:
+        data = snapshot.to_dict()
+        if not data:
+            return
+        terms = data.get("terms")
+        if terms is None:
+            terms = term_frequencies(data.get("content", ""))
+        self._upsert(snapshot.id, data.get("content", ""), data.get("metadata", {}), terms)
+        timestamp = data.get("timestamp")
+        if timestamp is not None and (self.last_timestamp is None or timestamp > self.last_timestamp):
+            self.last_timestamp = timestamp
+
+    def _fields(self, query):
+        return query.select(["content", "metadata", "terms", "timestamp"])
+
+    def load(self) -> None:
+        """Rebuild the index from the whole collection
+
+        The collection is read into a new index without holding the lock, so
+        searches are served from the current postings meanwhile; the rebuilt
+        postings replace them once the read completes.
+        """
+        # One load at a time; a second one would reset the first one's pending changes
+        with self._load_lock:
+            with self._lock:
+                self._pending = []
+            try:
+                loaded = LexicalIndex(self.collection)
+                for snapshot in self._fields(self.collection).stream():
+                    loaded._apply(snapshot)
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                for operation, args in self._pending:
+                    getattr(loaded, f"_{operation}")(*args)
+                self._pending = None
+                self.postings, self.documents = loaded.postings, loaded.documents
+                self.total_length, self.last_timestamp = loaded.total_length, loaded.last_timestamp
+                self.last_sync = self.last_full_load = time.monotonic()
+            logger.info(f"Loaded {len(self)} documents into the lexical index")
+
+    def warm(self) -> None:
+        """Load the index on a background thread, unless a load is already running"""
+        with self._lock:
+            if self._loader is not None and self._loader.is_alive():
+                return
+            self._loader = threading.Thread(target=self._load_in_background, name="lexical-index-load", daemon=True)
+            self._loader.start()
+
+    def _load_in_background(self) -> None:
+        try:
+            self.load()
+        except Exception as e:
+            logger.warning(f"Background lexical index load failed: {str(e)}")
+
+    def sync(self) -> int:
+        """Pull documents written since the last sync
+
+        Returns:
+            Number of documents added or updated
+        """
+        if self.last_timestamp is None:
+            self.load()
+            return len(self)
+        with self._lock:
+            query = self.collection.where("timestamp", ">=", self.last_timestamp).order_by("timestamp")
+            updated = 0
+            for snapshot in self._fields(query).stream():
+                self._apply(snapshot)
+                updated += 1
+            self.last_sync = time.monotonic()
+            return updated
+
+    def ensure_fresh(self) -> None:
+        """Load the index if it never was, and otherwise reload or sync it depending on how stale it is
+
+        Periodic full reloads run in the background (see warm); only the
+        first load blocks, joining a warm-up load if one is running.
+        """
+        now = time.monotonic()
+        if self.last_full_load == 0.0:
+            loader = self._loader
+            if loader is not None and loader.is_alive():
+                loader.join()
+            if self.last_full_load == 0.0:
+                self.load()
+        elif now - self.last_full_load >= self.full_reload_seconds:
+            self.warm()
+        elif now - self.last_sync >= self.sync_interval_seconds:
+            self.sync()
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Rank documents matching the filters by BM25 score
+
+        Returns:
+            List of results with id, content, metadata and score, best first
+        """
+        with self._lock:
+            if not self.documents:
+                return []
+            count = len(self.documents)
+            average_length = self.total_length / count or 1.0
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    document = self.documents[doc_id]
+                    if doc_id not in scores and not matches_filters(document["metadata"], metadata_filters, date_range):
+                        continue
+                    norm = K1 * (1 - B + B * document["length"] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (K1 + 1) / (frequency + norm)
+
+            ranked = sorted(scores, key=lambda doc_id: scores[doc_id], reverse=True)[:limit]
+            return [
+                {
+                    "id": doc_id,
+                    "content": self.documents[doc_id]["content"],
+                    "metadata": self.documents[doc_id]["metadata"],
+                    "score": scores[doc_id]
+                }
+                for doc_id in ranked
+            ]
@@ -0,0 +1,357 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# How often search() pulls new documents, and how often the index is rebuilt to drop deleted ones
+SYNC_INTERVAL_SECONDS = 60
+FULL_RELOAD_SECONDS = 3600
+INITIAL_CAPACITY = 1024
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class LocalVectorIndex:
+    """In-process mirror of a vector collection with brute-force cosine search
+
+    Embeddings are held in a normalized float32 matrix, so a search is one
+    matrix-vector product over the candidate rows. Metadata filters are
+    resolved before scoring from per-(field, value) boolean bitmaps.
+
+    The index is loaded from the collection on first use and kept in sync
+    incrementally by querying for documents with a newer `timestamp`.
+    Deletions made through FirestoreVectorStore are applied directly; the
+    periodic full reload, which runs in the background while searches use
+    the current rows, picks up anything deleted elsewhere.
+    """
+
+    def __init__(
+        self,
+        collection,
+        sync_interval_seconds: int = SYNC_INTERVAL_SECONDS,
+        full_reload_seconds: int = FULL_RELOAD_SECONDS
+    ):
+        """Initialize an empty index
+
+        Args:
+            collection: Firestore collection reference to mirror
+            sync_interval_seconds: Minimum time between incremental syncs
+            full_reload_seconds: Time between full rebuilds
+        """
+        self.collection = collection
+        self.sync_interval_seconds = sync_interval_seconds
+        self.full_reload_seconds = full_reload_seconds
+        self._lock = threading.RLock()
+        self._load_lock = threading.Lock()
+        self._loader: Optional[threading.Thread] = None
+        # Changes made while a load reads the collection, replayed onto the loaded index
+        self._pending: Optional[List[Tuple[str, tuple]]] = None
+        self._reset()
+        self.last_sync = 0.0
+        self.last_full_load = 0.0
+
+    # Attributes holding the indexed documents, swapped in together by load()
+    _STATE = ("matrix", "ids", "contents", "metadata", "dates", "encoded", "rows", "timestamps", "live", "bitmaps", "size", "last_timestamp")
+
+    def _reset(self) -> None:
+        self.matrix: Optional[np.ndarray] = None
+        self.ids: List[str] = []
+        self.contents: List[str] = []
+        self.metadata: List[Dict[str, Any]] = []
+        self.dates: List[str] = []
+        self.encoded: List[Tuple[Optional[bytes], Optional[Dict[str, Any]]]] = []
+        self.rows: Dict[str, int] = {}
+        # Stored `timestamp` of each document, so re-reading an unchanged one doesn't add a row
+        self.timestamps: Dict[str, Any] = {}
+        self.live: Optional[np.ndarray] = None
+        self.bitmaps: Dict[Tuple[str, str], np.ndarray] = {}
+        self.size = 0
+        self.last_timestamp = None
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def _grow(self, dimensions: int) -> None:
+        capacity = INITIAL_CAPACITY if self.matrix is None else self.matrix.shape[0] * 2
+        matrix = np.zeros((capacity, dimensions), dtype=np.float32)
+        live = np.zeros(capacity, dtype=bool)
+        if self.matrix is not None:
+            matrix[:self.size] = self.matrix[:self.size]
+            live[:self.size] = self.live[:self.size]
+            for key, bitmap in self.bitmaps.items():
+                grown = np.zeros(capacity, dtype=bool)
+                grown[:self.size] = bitmap[:self.size]
+                self.bitmaps[key] = grown
+        self.matrix = matrix
+        self.live = live
+
+    def _bitmap(self, field: str, value: Any) -> np.ndarray:
+        key = (field, str(value))
+        bitmap = self.bitmaps.get(key)
+        if bitmap is None:
+            bitmap = np.zeros(self.matrix.shape[0], dtype=bool)
+            self.bitmaps[key] = bitmap
+        return bitmap
+
+    def upsert(
+        self,
+        doc_id: str,
+        embedding,
+        content: str,
+        metadata: Dict[str, Any],
+        encoded: Tuple[Optional[bytes], Optional[Dict[str, Any]]] = (None, None)
+    ) -> None:
+        """Add or replace a document in the index
+
+        `encoded` is the document's quantized full embedding and its encoding,
+        kept compact and returned with results for rescoring.
+        """
+        vector = np.asarray(list(embedding), dtype=np.float32)
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("upsert", (doc_id, vector, content, metadata, encoded)))
+            self._upsert(doc_id, vector, content, metadata, encoded)
+
+    def remove(self, doc_id: str) -> None:
+        """Drop a document; its row is skipped until the next full reload"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("remove", (doc_id,)))
+            self._remove(doc_id)
+
+    def _upsert(
+        self,
+        doc_id: str,
+        vector: np.ndarray,
+        content: str,
+        metadata: Dict[str, Any],
+        encoded: Tuple[Optional[bytes], Optional[Dict[str, Any]]]
+    ) -> None:
+        self._remove(doc_id)
+        if self.matrix is None or self.size == self.matrix.shape[0]:
+            self._grow(vector.shape[0])
+        row = self.size
+        self.size += 1
+        self.matrix[row] = normalize_rows(vector)
+        self.live[row] = True
+        self.ids.append(doc_id)
+        self.contents.append(content)
+        self.metadata.append(metadata)
+        self.dates.append(str(metadata.get("date", "")))
+        self.encoded.append(encoded)
+        self.rows[doc_id] = row
+        for field, value in metadata.items():
+            self._bitmap(field, value)[row] = True
+
+    def _remove(self, doc_id: str) -> None:
+        row = self.rows.pop(doc_id, None)
+        self.timestamps.pop(doc_id, None)
+        if row is not None:
+            self.live[row] = False
+
+    @property
+    def dead_rows(self) -> int:
+        """Rows of removed or replaced documents still held in the matrix"""
+        return self.size - len(self.rows)
+
+    def compact(self) -> None:
+        """Rebuild the matrix and bitmaps from live rows only
+
+        Indexes that are never fully reloaded (the offline vector stores)
+        call this after deletions so memory tracks the live document count.
+        """
+        with self._lock:
+            if not self.dead_rows:
+                return
+            live = [
+                (doc_id, self.matrix[row].copy(), self.contents[row], self.metadata[row], self.encoded[row], self.timestamps.get(doc_id))
+                for doc_id, row in sorted(self.rows.items(), key=lambda item: item[1])
+            ]
+            last_timestamp = self.last_timestamp
+            self._reset()
+            self.last_timestamp = last_timestamp
+            for doc_id, vector, content, metadata, encoded, timestamp in live:
+                self._upsert(doc_id, vector, content, metadata, encoded)
+                if timestamp is not None:
+                    self.timestamps[doc_id] = timestamp
+
+    def _apply(self, snapshot) -> None:
+        data = snapshot.to_dict()
+        if not data or data.get("embedding") is None:
+            return
+        timestamp = data.get("timestamp")
+        if timestamp is not None and (self.last_timestamp is None or timestamp > self.last_timestamp):
+            self.last_timestamp = timestamp
+        if timestamp is not None and snapshot.id in self.rows and self.timestamps.get(snapshot.id) == timestamp:
+            # Already indexed as of this write
+            return
+        self.upsert(
+            snapshot.id,
+            data["embedding"],
+            data.get("content", ""),
+            data.get("metadata", {}),
+            (data.get("embedding_full"), data.get("embedding_encoding"))
+        )
+        if timestamp is not None:
+            self.timestamps[snapshot.id] = timestamp
+
+    def load(self) -> None:
+        """Rebuild the index from the whole collection
+
+        The collection is read into a new index without holding the lock, so
+        searches are served from the current rows meanwhile; the rebuilt
+        arrays replace them once the read completes.
+        """
+        # One load at a time; a second one would reset the first one's pending changes
+        with self._load_lock:
+            with self._lock:
+                self._pending = []
+            try:
+                loaded = LocalVectorIndex(self.collection)
+                for snapshot in self.collection.stream():
+                    loaded._apply(snapshot)
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+            with self._lock:
+                for operation, args in self._pending:
+                    getattr(loaded, f"_{operation}")(*args)
+                self._pending = None
+                for name in self._STATE:
+                    setattr(self, name, getattr(loaded, name))
+                self.last_sync = self.last_full_load = time.monotonic()
+            logger.info(f"Loaded {len(self)} documents into the local vector index")
+
+    def warm(self) -> None:
+        """Load the index on a background thread, unless a load is already running"""
+        with self._lock:
+            if self._loader is not None and self._loader.is_alive():
+                return
+            self._loader = threading.Thread(target=self._load_in_background, name="local-index-load", daemon=True)
+            self._loader.start()
+
+    def _load_in_background(self) -> None:
+        try:
+            self.load()
+        except Exception as e:
+            logger.warning(f"Background local index load failed: {str(e)}")
+
+    def sync(self) -> int:
+        """Pull documents written since the last sync
+
+        Documents newer than the last seen timestamp are read in full. Of
+        those sharing it (written in the same instant as the last one seen),
+        only IDs are read, and only ones not already indexed are fetched.
+
+        Returns:
+            Number of documents added or updated
+        """
+        if self.last_timestamp is None:
+            self.load()
+            return len(self)
+        with self._lock:
+            last_timestamp = self.last_timestamp
+            updated = 0
+            ties = self.collection.where("timestamp", "==", last_timestamp).select(["timestamp"]).stream()
+            for tie in ties:
+                if self.timestamps.get(tie.id) != last_timestamp:
+                    self._apply(self.collection.document(tie.id).get())
+                    updated += 1
+            query = self.collection.where("timestamp", ">", last_timestamp).order_by("timestamp")
+            for snapshot in query.stream():
+                self._apply(snapshot)
+                updated += 1
+            self.last_sync = time.monotonic()
+            return updated
+
+    def ensure_fresh(self) -> None:
+        """Load the index if it never was, and otherwise reload or sync it depending on how stale it is
+
+        Periodic full reloads run in the background (see warm); only the
+        first load blocks, joining a warm-up load if one is running.
+        """
+        now = time.monotonic()
+        if self.last_full_load == 0.0:
+            loader = self._loader
+            if loader is not None and loader.is_alive():
+                loader.join()
+            if self.last_full_load == 0.0:
+                self.load()
+        elif now - self.last_full_load >= self.full_reload_seconds:
+            self.warm()
+        elif now - self.last_sync >= self.sync_interval_seconds:
+            self.sync()
+
+    def candidate_mask(
+        self,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> np.ndarray:
+        """Rows that are live and match every metadata filter and the date range"""
+        mask = self.live[:self.size].copy()
+        for field, value in (metadata_filters or {}).items():
+            bitmap = self.bitmaps.get((field, str(value)))
+            if bitmap is None:
+                return np.zeros(self.size, dtype=bool)
+            mask &= bitmap[:self.size]
+        if date_range and mask.any():
+            start, end = date_range
+            dates = np.array(self.dates[:self.size])
+            if start:
+                mask &= dates >= start
+            if end:
+                mask &= dates <= end
+        return mask
+
+    def search(
+        self,
+        query_embedding: List[float],
+        limit: int = 10,
+        distance_threshold: float = None,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search for the nearest documents by cosine distance
+
+        Same arguments and result format as FirestoreVectorStore.search.
+        """
+        with self._lock:
+            if self.matrix is None:
+                return []
+            candidates = np.flatnonzero(self.candidate_mask(metadata_filters, date_range))
+            if candidates.size == 0:
+                return []
+
+            query = normalize_rows(np.asarray(query_embedding, dtype=np.float32))
+            distances = 1.0 - self.matrix[candidates] @ query
+            if limit < candidates.size:
+                top = np.argpartition(distances, limit)[:limit]
+            else:
+                top = np.arange(candidates.size)
+            top = top[np.argsort(distances[top], kind="stable")]
+
+            results = []
+            for i in top:
+                distance = float(distances[i])
+                if distance_threshold is not None and distance > distance_threshold:
+                    break
+                row = candidates[i]
+                embedding_full, embedding_encoding = self.encoded[row]
+                results.append({
+                    "id": self.ids[row],
+                    "content": self.contents[row],
+                    "metadata": self.metadata[row],
+                    "distance": distance,
+                    "embedding_full": embedding_full,
+                    "embedding_encoding": embedding_encoding
+                })
+            return results
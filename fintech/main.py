@@ -1,14 +1,20 @@
-from firebase_functions import https_fn
+from firebase_functions import https_fn, firestore_fn, scheduler_fn
 import logging
 import json
+import functools
+import hmac
+import os
+import time
 from firebase_functions.options import MemoryOption
-from financial_analysis import analyze_stock
-from concurrent.futures import ThreadPoolExecutor
 from typing import Any
 from datetime import datetime, timedelta
-import concurrent.futures
 from firebase.config import app, db, auth
 from google.cloud import firestore
+from auth_cache import start_certificate_warmer, token_cache
+from result_store import RESULTS_COLLECTION, load_section, normalize, store_result
+from http_utils import compress_body, etag_matches, make_etag
+from job_queue import JOB_COLLECTION, became_queued, drain, execute_job, get_job_queue, new_worker_id
+from metrics import registry, start_log_flusher
 
 # Configure logging
 logger = logging.getLogger('fintech')
@@ -18,135 +24,110 @@ logger.setLevel(logging.INFO)
 CORS_HEADERS = {
     "Access-Control-Allow-Origin": "https://fintech-ash-80b97.web.app",
     "Access-Control-Allow-Methods": "POST, OPTIONS",
-    "Access-Control-Allow-Headers": "Content-Type, Authorization",
+    "Access-Control-Allow-Headers": "Content-Type, Authorization, If-None-Match",
+    "Access-Control-Expose-Headers": "ETag",
     "Access-Control-Max-Age": "3600"
 }
 
-# Create a thread pool executor for running the analysis
-executor = ThreadPoolExecutor(max_workers=1)
-
 # Constants for timeouts
 FUNCTION_TIMEOUT = 540  # 9 minutes (matching the http function timeout)
-ANALYSIS_TIMEOUT = FUNCTION_TIMEOUT - 30  # Leave 30 seconds buffer for cleanup
+JOB_LEASE_SECONDS = 120  # Workers heartbeat every third of this while an analysis runs
+QUEUE_DEPTH_TTL_SECONDS = 300  # Queue depth is re-counted at most this often (the sweep's cadence)
+
+API_SECRETS = ["SERPER_API_KEY", "OPENAI_API_KEY", "ALPHA_VANTAGE_API_KEY", "CLAUDE_API_KEY"]
+
+ENDPOINT_REQUESTS = registry.counter("http_requests_total", "HTTP requests by endpoint and status code")
+ENDPOINT_LATENCY = registry.histogram("http_request_seconds", "HTTP request latency by endpoint and method")
+ANALYSIS_CACHE_LOOKUPS = registry.counter("analysis_cache_lookups_total", "Existing-analysis lookups by result")
+QUEUE_DEPTH = registry.gauge("analysis_queue_depth", "Analysis jobs waiting to be claimed")
+
+_queue_depth = None  # (depth, monotonic time it was counted)
+
+
+def collect_queue_depth() -> None:
+    """Set the queue depth gauge, counting jobs in Firestore at most every QUEUE_DEPTH_TTL_SECONDS
+
+    Runs on every metrics scrape and log flush; each count is a billed
+    aggregation query, so scrapes in between reuse the last one.
+    """
+    global _queue_depth
+    if _queue_depth is None or time.monotonic() - _queue_depth[1] >= QUEUE_DEPTH_TTL_SECONDS:
+        _queue_depth = (get_job_queue().depth(), time.monotonic())
+    QUEUE_DEPTH.set(_queue_depth[0])
+
+
+registry.add_collector(collect_queue_depth)
+
+
+def instrumented(endpoint: str):
+    """Record request count by status code and latency for an HTTP handler"""
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(req):
+            start = time.perf_counter()
+            response = handler(req)
+            ENDPOINT_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, method=req.method)
+            ENDPOINT_REQUESTS.inc(endpoint=endpoint, status=response.status_code)
+            return response
+        return wrapper
+    return decorator
 
 def process_analysis_result(result: Any, doc_id: str) -> dict:
-    """Process the analysis result and store it in Firestore"""
+    """Process the analysis result into plain JSON types for storage in Firestore"""
     try:
-        def process_value(value):
-            if isinstance(value, (int, float, bool)):
-                return value
-            elif isinstance(value, str):
-                # Try to parse string as JSON if it looks like JSON
-                if value.strip().startswith('{') or value.strip().startswith('['):
-                    try:
-                        import json
-                        return json.loads(value)
-                    except json.JSONDecodeError:
-                        return value
-                return value
-            elif isinstance(value, list):
-                return [process_value(item) for item in value]
-            elif isinstance(value, dict):
-                return {k: process_value(v) for k, v in value.items()}
-            elif hasattr(value, 'raw'):
-                return process_value(value.raw)
-            else:
-                return str(value)
-
-        def process_analysis_component(component):
-            """Special handling for analysis components that might be stringified JSON"""
-            if isinstance(component, str):
-                try:
-                    import json
-                    return json.loads(component)
-                except json.JSONDecodeError:
-                    return component
-            elif isinstance(component, dict):
-                return {k: process_value(v) for k, v in component.items()}
-            return component
-
-        if isinstance(result, dict):
-            processed_result = {}
-            
-            # Handle the analysis section specially
-            if 'analysis' in result:
-                analysis_data = {}
-                for key, value in result['analysis'].items():
-                    # Process each analysis component
-                    processed_value = process_analysis_component(value)
-                    analysis_data[key] = processed_value
-                processed_result['analysis'] = analysis_data
-            
-            # Handle other sections
-            for key, value in result.items():
-                if key != 'analysis':
-                    processed_result[key] = process_value(value)
-            
-            return processed_result
-        
-        # Handle other types of results
-        if isinstance(result, str):
-            return {"analysis_summary": result}
-        if isinstance(result, list):
-            return {"analysis_summary": [process_value(item) for item in result]}
-        
-        return {"analysis_summary": str(result)}
-        
+        # Single pass: unwraps raw outputs and parses stringified JSON from the agents
+        processed = normalize(result)
+        if isinstance(processed, dict):
+            return processed
+        return {"analysis_summary": processed}
+
     except Exception as e:
-        logger.error(f"Error processing analysis result: {str(e)}")
+        logger.error(f"Error processing analysis result for {doc_id}: {str(e)}")
         return {"error": str(e)}
-    
 
 
+def run_analysis_job(job: dict) -> None:
+    """Run a claimed analysis job and store its result
 
-def analysis_callback(future, doc_id: str, ticker: str) -> None:
-    """Callback function to handle the analysis result"""
+    Raises on failure so the job queue retries it; completed agents are
+    checkpointed, so a retry resumes where the previous attempt stopped.
+    """
+    # Imported here so OPTIONS, polling and cache-hit requests don't pay for
+    # langgraph/langchain/pandas and the RAG clients on a cold start
+    from financial_analysis import analyze_stock
+    from checkpointing import get_checkpointer
+
+    doc_id = job["id"]
+    ticker = job["payload"]["ticker"]
 
     try:
-        # Get the result from the future
-        
-        try:
-            # Set timeout slightly less than the function timeout to allow for cleanup
-            result = future.result(timeout=ANALYSIS_TIMEOUT)
-        except Exception as future_error:
-            error_msg = f"Analysis failed: {str(future_error)}"
-            logger.error(f"Analysis failed for ticker {ticker}: {error_msg}")
-            update_firestore_error(doc_id, error_msg, ticker)
-            return
-            
-        if not future.done():                
-            error_msg = "Analysis incomplete - process did not complete"
-            logger.error(f"Analysis incomplete for ticker {ticker}")
-            update_firestore_error(doc_id, error_msg, ticker)
-            return
-            
-        if result is None:            
-            error_msg = "Analysis returned no results - check API connections and data availability"
-            logger.error(f"No results returned for ticker {ticker}")
-            update_firestore_error(doc_id, error_msg, ticker)
+        result = analyze_stock(ticker, doc_id)
+        if result is None:
+            raise Exception("Analysis returned no results - check API connections and data availability")
+
+        if job["lease_lost"].is_set():
+            # Another worker holds the job now; the result and checkpoints are its to write and clean up
+            logger.warning(f"Dropping result for doc_id {doc_id}: the job's lease was lost")
             return
 
-        try:
-            # Store in Firestore           
-            analysis_ref = db.collection("analysis_results").document(doc_id)
-            analysis_ref.set({
-                "ticker": ticker,
-                "result": result,  # result is already in the correct format from analyze_stock
-                "status": "completed",
-                "timestamp": firestore.SERVER_TIMESTAMP
-            })
-            logger.info(f"Successfully stored result in Firestore for doc_id: {doc_id}")
-        except Exception as process_error:
-            error_msg = f"Error processing or storing result: {str(process_error)}"
-            logger.error(f"Error storing results for ticker {ticker}: {error_msg}")
-            update_firestore_error(doc_id, error_msg, ticker)
-            
+        # Store in Firestore; large sections are compressed into the sections subcollection
+        store_result(db, doc_id, ticker, process_analysis_result(result, doc_id))
+        logger.info(f"Successfully stored result in Firestore for doc_id: {doc_id}")
     except Exception as e:
-        error_msg = f"Unexpected error in analysis: {str(e)}"
-        logger.error(f"Unexpected error for ticker {ticker}: {error_msg}")
-        update_firestore_error(doc_id, error_msg, ticker)
+        error_msg = f"Analysis failed: {str(e)}"
+        logger.error(f"Analysis attempt {job.get('attempts')} failed for ticker {ticker}: {error_msg}")
+        if job.get("attempts", 0) >= job.get("max_attempts", 1):
+            # Out of retries; the next request for this ticker resumes from the checkpoints
+            update_firestore_error(doc_id, error_msg, ticker, resumable=True)
+        raise
 
-def update_firestore_error(doc_id: str, error_message: str, ticker: str) -> None:
+    try:
+        # The result is stored, the checkpoints are no longer needed
+        get_checkpointer().delete_thread(doc_id)
+    except Exception as cleanup_error:
+        logger.warning(f"Failed to delete checkpoints for doc_id {doc_id}: {cleanup_error}")
+
+def update_firestore_error(doc_id: str, error_message: str, ticker: str, resumable: bool = False) -> None:
     """Helper function to update Firestore with error status"""
     try:
       
@@ -155,17 +136,29 @@ def update_firestore_error(doc_id: str, error_message: str, ticker: str) -> None
             "ticker": ticker,
             "status": "error",
             "error_message": error_message,
+            "resumable": resumable,
             "timestamp": firestore.SERVER_TIMESTAMP
         })
     except Exception as store_error:
         logger.error(f"Failed to store error in Firestore: {store_error}")
 
 
+def to_naive_datetime(timestamp) -> datetime | None:
+    """Convert a Firestore timestamp to a naive datetime"""
+    if not timestamp:
+        return None
+    if isinstance(timestamp, datetime):
+        return timestamp.replace(tzinfo=None)
+    return timestamp.datetime.replace(tzinfo=None)
+
+
 def check_existing_analysis(ticker: str) -> tuple[bool, dict | None]:
     """
     Check for existing analysis results for a given ticker.
     Returns a tuple of (should_proceed, response_data).
     If should_proceed is False, response_data contains the response to return.
+    If should_proceed is True and the latest analysis was interrupted, response_data
+    contains the "resume_document_id" of the checkpointed analysis to continue.
     """
     try:
         # Query for any analysis of this ticker
@@ -178,8 +171,13 @@ def check_existing_analysis(ticker: str) -> tuple[bool, dict | None]:
         doc = docs[0]  # Get the most recent analysis
         data = doc.to_dict()
         status = data.get("status")
+        doc_timestamp = to_naive_datetime(data.get("timestamp"))
  
         if status == "in_progress":
+            # An in-progress analysis older than the function timeout was lost with its instance
+            if doc_timestamp and datetime.now() - doc_timestamp > timedelta(seconds=FUNCTION_TIMEOUT):
+                logger.info(f"Analysis {doc.id} for {ticker} is stale, resuming from checkpoint")
+                return True, {"resume_document_id": doc.id}
             return False, {
                 "message": "Analysis already in progress",
                 "status": status,
@@ -187,22 +185,21 @@ def check_existing_analysis(ticker: str) -> tuple[bool, dict | None]:
                 "document_id": doc.id
             }
         
+        if status == "error" and data.get("resumable"):
+            return True, {"resume_document_id": doc.id}
+
         if status == "completed":
-            timestamp = data.get("timestamp")
-            if timestamp:
-                # Convert Firestore timestamp to naive datetime
-                if isinstance(timestamp, datetime):
-                    doc_timestamp = timestamp.replace(tzinfo=None)
-                else:
-                    doc_timestamp = timestamp.datetime.replace(tzinfo=None)
-                
+            if doc_timestamp:
                 # Check if analysis is less than 24 hours old
                 if datetime.now() - doc_timestamp < timedelta(hours=24):
                     return False, {
                         "message": "Retrieved existing analysis",
                         "status": status,
                         "ticker": ticker,
+                        "document_id": doc.id,
                         "result": data.get("result", {}),
+                        # Large sections are loaded on demand with a "section" request
+                        "offloaded_sections": data.get("offloaded_sections", []),
                         "timestamp": doc_timestamp.isoformat()
                     }
         
@@ -215,7 +212,123 @@ def check_existing_analysis(ticker: str) -> tuple[bool, dict | None]:
 
 
 
-@https_fn.on_request(memory=MemoryOption.GB_1, timeout_sec=540, secrets=["SERPER_API_KEY", "OPENAI_API_KEY", "ALPHA_VANTAGE_API_KEY", "CLAUDE_API_KEY"])
+def cached_json_response(req: https_fn.Request, payload: dict, status: int = 200, etag: str | None = None) -> https_fn.Response:
+    """JSON response tagged with an ETag and compressed when the client accepts it
+
+    Answers 304 Not Modified without a body when the client already holds this version.
+    """
+    headers = {**CORS_HEADERS}
+    if etag:
+        headers.update({"ETag": etag, "Cache-Control": "private, no-cache"})
+        if etag_matches(req.headers.get("If-None-Match"), etag):
+            return https_fn.Response(status=304, headers=headers)
+
+    body, encoding_headers = compress_body(json.dumps(payload).encode("utf-8"), req.headers.get("Accept-Encoding"))
+    return https_fn.Response(
+        body,
+        status=status,
+        headers={**headers, **encoding_headers, "Content-Type": "application/json"}
+    )
+
+
+def get_analysis_section(req: https_fn.Request, doc_id: str | None, section: str) -> https_fn.Response:
+    """Return one section of a stored analysis"""
+    if not doc_id:
+        return https_fn.Response(
+            json.dumps({"error": "document_id is required"}),
+            status=400,
+            headers={**CORS_HEADERS, "Content-Type": "application/json"}
+        )
+    try:
+        snapshot = db.collection(RESULTS_COLLECTION).document(doc_id).get()
+        if not snapshot.exists:
+            raise KeyError(f"Analysis {doc_id} not found")
+        summary = snapshot.to_dict()
+        doc_timestamp = to_naive_datetime(summary.get("timestamp"))
+        etag = make_etag(doc_id, f"{section}@{doc_timestamp.isoformat() if doc_timestamp else ''}")
+        # Check before loading so an unchanged section costs no chunk reads
+        if etag_matches(req.headers.get("If-None-Match"), etag):
+            return cached_json_response(req, {}, etag=etag)
+        data = load_section(db, doc_id, section, summary)
+    except KeyError as missing:
+        logger.error(f"Section lookup failed: {missing}")
+        return https_fn.Response(
+            json.dumps({"error": "Section not found"}),
+            status=404,
+            headers={**CORS_HEADERS, "Content-Type": "application/json"}
+        )
+    return cached_json_response(req, {"document_id": doc_id, "section": section, "data": data}, etag=etag)
+
+
+@firestore_fn.on_document_written(document=f"{JOB_COLLECTION}/{{jobId}}", memory=MemoryOption.GB_1, timeout_sec=FUNCTION_TIMEOUT, secrets=API_SECRETS)
+def process_analysis_job(event: firestore_fn.Event) -> None:
+    """Worker entry point: claim and run a job as soon as it is (re-)queued"""
+    # Every claim, heartbeat and completion also fires this trigger; only a
+    # transition into the queued status has work to do
+    if not event.data:
+        return
+    before, after = event.data.before, event.data.after
+    if not became_queued(before.to_dict() if before and before.exists else None,
+                         after.to_dict() if after and after.exists else None):
+        return
+
+    queue = get_job_queue()
+    worker_id = new_worker_id()
+    job = queue.claim_job(event.params["jobId"], worker_id, JOB_LEASE_SECONDS)
+    if not job:
+        # Another worker already claimed it
+        return
+    logger.info(f"Worker {worker_id} claimed job {job['id']} (attempt {job['attempts']})")
+    execute_job(queue, job, worker_id, run_analysis_job, JOB_LEASE_SECONDS)
+    # Worker instances aren't scraped, so their metrics go to the logs
+    registry.log_snapshot()
+
+
+@scheduler_fn.on_schedule(schedule="every 5 minutes", memory=MemoryOption.GB_1, timeout_sec=FUNCTION_TIMEOUT, secrets=API_SECRETS)
+def sweep_analysis_jobs(event: scheduler_fn.ScheduledEvent) -> None:
+    """Worker entry point: pick up jobs whose worker died before finishing"""
+    queue = get_job_queue()
+    for job in queue.fail_dead_leases():
+        # The worker died on the final attempt, so run_analysis_job never recorded the failure
+        logger.error(f"Job {job['id']} failed: {job['last_error']}")
+        update_firestore_error(job["id"], f"Analysis failed: {job['last_error']}", job["payload"]["ticker"], resumable=True)
+    executed = drain(queue, run_analysis_job, max_jobs=1, lease_seconds=JOB_LEASE_SECONDS)
+    if executed:
+        logger.info(f"Sweeper executed jobs: {executed}")
+        registry.log_snapshot()
+
+
+@scheduler_fn.on_schedule(schedule="every day 03:00", memory=MemoryOption.GB_1, timeout_sec=FUNCTION_TIMEOUT)
+def compact_vector_store(event: scheduler_fn.ScheduledEvent) -> None:
+    """Delete RAG documents past their retention policy (stale news) and compact the store"""
+    # Imported here so the HTTP endpoints' cold start doesn't load the vector store and numpy
+    from retention import apply_retention
+    deleted = apply_retention()
+    logger.info(f"Vector store compaction deleted: {deleted}")
+    registry.log_snapshot()
+
+
+def metrics_response(req: https_fn.Request) -> https_fn.Response:
+    """Prometheus text exposition of this instance's metrics
+
+    Disabled unless METRICS_TOKEN is set; scrapers authenticate with
+    `Authorization: Bearer <METRICS_TOKEN>`.
+    """
+    metrics_token = os.getenv("METRICS_TOKEN")
+    if not metrics_token:
+        return https_fn.Response("Not found", status=404)
+    auth_header = req.headers.get("Authorization") or ""
+    if not hmac.compare_digest(auth_header, f"Bearer {metrics_token}"):
+        return https_fn.Response("Unauthorized", status=401)
+    return https_fn.Response(
+        registry.render_prometheus(),
+        status=200,
+        headers={"Content-Type": "text/plain; version=0.0.4"}
+    )
+
+
+@https_fn.on_request(memory=MemoryOption.GB_1, timeout_sec=FUNCTION_TIMEOUT, secrets=API_SECRETS)
+@instrumented("analyze_stock_endpoint")
 def analyze_stock_endpoint(req: https_fn.Request) -> https_fn.Response:
     logger.info("Received request to analyze_stock_endpoint")
     if req.method == "OPTIONS":
@@ -225,6 +338,10 @@ def analyze_stock_endpoint(req: https_fn.Request) -> https_fn.Response:
             headers=CORS_HEADERS
         )
 
+    start_log_flusher()
+    if req.method == "GET" and req.path.rstrip("/").endswith("/metrics"):
+        return metrics_response(req)
+
     try:
         # Verify Firebase ID token
         auth_header = req.headers.get('Authorization')
@@ -237,11 +354,18 @@ def analyze_stock_endpoint(req: https_fn.Request) -> https_fn.Response:
             )
         
         id_token = auth_header.split("Bearer ")[1]
-        decoded_token = auth.verify_id_token(id_token)
+        start_certificate_warmer()
+        # Repeat requests from the same session (polling, cache hits) skip re-verification
+        decoded_token = token_cache.verify(id_token, auth.verify_id_token)
         uid = decoded_token["uid"]
         logger.info(f"Authenticated user: {uid}")
 
         body = req.get_json(silent=True)
+
+        # Lazy loading of a single section of a stored analysis
+        if body and body.get("section"):
+            return get_analysis_section(req, body.get("document_id"), body["section"])
+
         ticker = body.get("ticker") if body else None
         logger.info(f"Analyzing ticker: {ticker}")
         
@@ -255,42 +379,57 @@ def analyze_stock_endpoint(req: https_fn.Request) -> https_fn.Response:
 
         # Check for existing analysis results
         should_proceed, response_data = check_existing_analysis(ticker)
+        if not should_proceed:
+            ANALYSIS_CACHE_LOOKUPS.inc(result="hit" if response_data["status"] == "completed" else "in_progress")
+        else:
+            ANALYSIS_CACHE_LOOKUPS.inc(result="resume" if response_data else "miss")
         
         if not should_proceed:
             logger.info(f"Using existing analysis for ticker: {ticker}")
-            status_code = 202 if response_data["status"] == "in_progress" else 200
-            return https_fn.Response(
-                json.dumps(response_data),
-                status=status_code,
-                headers={**CORS_HEADERS, "Content-Type": "application/json"}
-            )
+            if response_data["status"] == "in_progress":
+                return https_fn.Response(
+                    json.dumps(response_data),
+                    status=202,
+                    headers={**CORS_HEADERS, "Content-Type": "application/json"}
+                )
+            # A completed analysis only changes when a new document replaces it
+            etag = make_etag(response_data["document_id"], response_data["timestamp"])
+            return cached_json_response(req, response_data, etag=etag)
 
         # Create initial Firestore document
         try:
-            logger.info(f"Starting new analysis for ticker: {ticker}")
-            # Create a new document with auto-generated ID
-            analysis_ref = db.collection("analysis_results").document()
+            resume_doc_id = response_data.get("resume_document_id") if response_data else None
+            if resume_doc_id:
+                # Reuse the interrupted analysis document so its checkpoints are picked up
+                logger.info(f"Resuming analysis {resume_doc_id} for ticker: {ticker}")
+                analysis_ref = db.collection("analysis_results").document(resume_doc_id)
+            else:
+                logger.info(f"Starting new analysis for ticker: {ticker}")
+                # Create a new document with auto-generated ID
+                analysis_ref = db.collection("analysis_results").document()
             doc_id = analysis_ref.id  # Get the ID before setting the document
             
-            # Set the initial document data
-            analysis_ref.set({
-                "ticker": ticker,
-                "status": "in_progress",
-                "timestamp": firestore.SERVER_TIMESTAMP
-            })
-            
-            logger.info(f"Created Firestore document with ID: {doc_id}")
-            
-            # Submit the analysis task with a callback
-            logger.info(f"Submitting analysis task for uid: {uid}")
+            # Queue the analysis; workers pick it up independently of this instance
+            logger.info(f"Queueing analysis job for uid: {uid}")
             try:
-                future = executor.submit(analyze_stock, ticker)
-                future.add_done_callback(lambda f: analysis_callback(f, doc_id, ticker))
-                logger.info("Analysis task submitted successfully")
+                queued = get_job_queue().enqueue(doc_id, {"ticker": ticker, "uid": uid})
             except Exception as submit_error:
-                logger.error(f"Error submitting analysis task: {str(submit_error)}")
+                logger.error(f"Error queueing analysis job: {str(submit_error)}")
                 raise submit_error
             
+            if queued:
+                logger.info("Analysis job queued successfully")
+                # Set the initial document data
+                analysis_ref.set({
+                    "ticker": ticker,
+                    "status": "in_progress",
+                    "timestamp": firestore.SERVER_TIMESTAMP
+                })
+                logger.info(f"Created Firestore document with ID: {doc_id}")
+            else:
+                # A worker is still running this analysis; leave its document alone
+                logger.info(f"Analysis job {doc_id} is already active")
+            
             # Return immediate response indicating analysis is in progress
             return https_fn.Response(
                 json.dumps({
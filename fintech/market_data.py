@@ -0,0 +1,303 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple, TypedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ingestion import QuotaExhausted, RateLimiter
+from metrics import registry
+from utils import get_alpha_vantage_api_key
+
+logger = logging.getLogger(__name__)
+
+ALPHA_VANTAGE_URL = "https://www.alphavantage.co/query"
+# Free tier limits; raise both for a premium key
+ALPHA_VANTAGE_CALLS_PER_MINUTE = int(os.getenv("ALPHA_VANTAGE_CALLS_PER_MINUTE", "5"))
+ALPHA_VANTAGE_DAILY_QUOTA = int(os.getenv("ALPHA_VANTAGE_DAILY_QUOTA", "25"))
+REQUEST_TIMEOUT_SECONDS = 30
+# How long every caller is held after Alpha Vantage reports too many calls per minute
+THROTTLE_BACKOFF_SECONDS = 60
+POOL_SIZE = 10
+DEFAULT_MAX_ENTRIES = 512
+
+ALPHA_VANTAGE_LATENCY = registry.histogram("alpha_vantage_request_seconds", "Alpha Vantage API request latency by function")
+ALPHA_VANTAGE_LOOKUPS = registry.counter("alpha_vantage_lookups_total", "Market data lookups by function and source (cache or api)")
+
+
+class AlphaVantageError(Exception):
+    """Alpha Vantage rejected a request (e.g. an unknown symbol)"""
+
+
+class AlphaVantageThrottled(Exception):
+    """Alpha Vantage rejected a request for exceeding its per-minute or per-second rate; retry later"""
+
+
+def is_throttle_message(message: str) -> bool:
+    """Whether a Note/Information response is a short-term rate limit rather than the daily quota
+
+    Alpha Vantage's burst message reads "... API call frequency is 5 calls per
+    minute and 500 calls per day" or "... more sparingly (1 request per
+    second)", while the daily one reads "... rate limit is 25 requests per day".
+    """
+    message = message.lower()
+    return "per minute" in message or "per second" in message
+
+
+class CompanyOverview(TypedDict):
+    symbol: str
+    name: Optional[str]
+    sector: Optional[str]
+    industry: Optional[str]
+    description: Optional[str]
+    market_cap: Optional[float]
+    pe_ratio: Optional[float]
+    forward_pe: Optional[float]
+    trailing_pe: Optional[float]
+    dividend_yield: Optional[float]
+    beta: Optional[float]
+    week_52_high: Optional[float]
+    week_52_low: Optional[float]
+    average_volume: Optional[float]
+    return_on_equity: Optional[float]
+    profit_margin: Optional[float]
+    revenue_growth: Optional[float]
+    debt_to_equity: Optional[float]
+    quick_ratio: Optional[float]
+    current_ratio: Optional[float]
+    full_time_employees: Optional[int]
+    analyst_target_price: Optional[float]
+
+
+class DailyBar(TypedDict):
+    date: str
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+
+class NewsArticle(TypedDict):
+    title: str
+    summary: str
+    source: str
+    url: Optional[str]
+    time_published: Optional[str]
+
+
+def parse_float(value: Any) -> Optional[float]:
+    """Alpha Vantage number string to float; "None", "-" and empty values become None"""
+    if value is None or value in ("None", "-", ""):
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def parse_overview(data: Dict[str, Any]) -> CompanyOverview:
+    employees = parse_float(data.get("FullTimeEmployees"))
+    return CompanyOverview(
+        symbol=data.get("Symbol", ""),
+        name=data.get("Name"),
+        sector=data.get("Sector"),
+        industry=data.get("Industry"),
+        description=data.get("Description"),
+        market_cap=parse_float(data.get("MarketCapitalization")),
+        pe_ratio=parse_float(data.get("PERatio")),
+        forward_pe=parse_float(data.get("ForwardPE")),
+        trailing_pe=parse_float(data.get("TrailingPE")),
+        dividend_yield=parse_float(data.get("DividendYield")),
+        beta=parse_float(data.get("Beta")),
+        week_52_high=parse_float(data.get("52WeekHigh")),
+        week_52_low=parse_float(data.get("52WeekLow")),
+        average_volume=parse_float(data.get("AverageVolume")),
+        return_on_equity=parse_float(data.get("ReturnOnEquityTTM")),
+        profit_margin=parse_float(data.get("ProfitMargin")),
+        revenue_growth=parse_float(data.get("RevenueGrowth")),
+        debt_to_equity=parse_float(data.get("DebtToEquityRatio")),
+        quick_ratio=parse_float(data.get("QuickRatio")),
+        current_ratio=parse_float(data.get("CurrentRatio")),
+        full_time_employees=int(employees) if employees is not None else None,
+        analyst_target_price=parse_float(data.get("AnalystTargetPrice"))
+    )
+
+
+def parse_daily_series(data: Dict[str, Any]) -> List[DailyBar]:
+    """TIME_SERIES_DAILY response as bars, oldest first"""
+    series = data.get("Time Series (Daily)", {})
+    return [
+        DailyBar(
+            date=date,
+            open=float(values["1. open"]),
+            high=float(values["2. high"]),
+            low=float(values["3. low"]),
+            close=float(values["4. close"]),
+            volume=float(values["5. volume"])
+        )
+        for date, values in sorted(series.items())
+    ]
+
+
+def parse_news(data: Dict[str, Any]) -> List[NewsArticle]:
+    return [
+        NewsArticle(
+            title=item.get("title", ""),
+            summary=item.get("summary", ""),
+            source=item.get("source", "Alpha Vantage"),
+            url=item.get("url"),
+            time_published=item.get("time_published")
+        )
+        for item in data.get("feed", [])
+    ]
+
+
+class MarketDataClient:
+    """Alpha Vantage client shared by analysis and RAG ingestion
+
+    Requests go through one pooled HTTP session, are throttled to
+    ALPHA_VANTAGE_CALLS_PER_MINUTE and counted against
+    ALPHA_VANTAGE_DAILY_QUOTA. Parsed responses are cached in process by
+    function, symbol, day and parameters, so the same data is fetched at
+    most once a day per instance, even by concurrent callers.
+    """
+
+    def __init__(
+        self,
+        api_key: str = None,
+        session: requests.Session = None,
+        calls_per_minute: int = ALPHA_VANTAGE_CALLS_PER_MINUTE,
+        daily_quota: int = ALPHA_VANTAGE_DAILY_QUOTA,
+        max_size: int = DEFAULT_MAX_ENTRIES
+    ):
+        """Initialize the client
+
+        Args:
+            api_key: Alpha Vantage API key (defaults to get_alpha_vantage_api_key() on first request)
+            session: HTTP session (defaults to a pooled requests.Session)
+            calls_per_minute: Maximum API calls started per minute
+            daily_quota: Maximum API calls per UTC day
+            max_size: Maximum number of cached responses
+        """
+        self.api_key = api_key
+        if session is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE))
+        self.session = session
+        self.limiter = RateLimiter(calls_per_minute)
+        self.daily_quota = daily_quota
+        self.max_size = max_size
+        self._entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._key_locks: Dict[Tuple, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._quota_day = None
+        self._calls_today = 0
+
+    def quota_status(self) -> Dict[str, Any]:
+        """API calls made and remaining in the current UTC day"""
+        with self._lock:
+            self._roll_quota_day()
+            return {
+                "day": self._quota_day,
+                "calls": self._calls_today,
+                "limit": self.daily_quota,
+                "remaining": max(0, self.daily_quota - self._calls_today)
+            }
+
+    def _roll_quota_day(self) -> str:
+        today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+        if today != self._quota_day:
+            self._quota_day, self._calls_today = today, 0
+        return today
+
+    def _reserve_call(self) -> None:
+        with self._lock:
+            self._roll_quota_day()
+            if self._calls_today >= self.daily_quota:
+                raise QuotaExhausted(f"Alpha Vantage daily quota of {self.daily_quota} calls used")
+            self._calls_today += 1
+
+    def _request(self, function: str, symbol_param: str, symbol: str, **params) -> Dict[str, Any]:
+        self._reserve_call()
+        self.limiter.acquire()
+        query = {"function": function, symbol_param: symbol, "apikey": self.api_key or get_alpha_vantage_api_key(), **params}
+        with ALPHA_VANTAGE_LATENCY.time(function=function):
+            response = self.session.get(ALPHA_VANTAGE_URL, params=query, timeout=REQUEST_TIMEOUT_SECONDS)
+        response.raise_for_status()
+        data = response.json()
+        if "Error Message" in data:
+            raise AlphaVantageError(data["Error Message"])
+        # Rate limits come back as a 200 with a message instead of data
+        message = data.get("Note") or data.get("Information")
+        if message:
+            if is_throttle_message(message):
+                self.limiter.backoff(THROTTLE_BACKOFF_SECONDS)
+                raise AlphaVantageThrottled(message)
+            if "per day" in message.lower():
+                with self._lock:
+                    self._calls_today = max(self._calls_today, self.daily_quota)
+                raise QuotaExhausted(message)
+            # Anything else, e.g. a premium-only endpoint
+            raise AlphaVantageError(message)
+        return data
+
+    def _cached(self, function: str, symbol_param: str, symbol: str, parse, **params):
+        with self._lock:
+            key = (function, symbol.upper(), self._roll_quota_day(), tuple(sorted(params.items())))
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # Concurrent callers for the same key wait for one request instead of each making it
+        with key_lock:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    ALPHA_VANTAGE_LOOKUPS.inc(function=function, source="cache")
+                    return self._entries[key]
+            ALPHA_VANTAGE_LOOKUPS.inc(function=function, source="api")
+            value = parse(self._request(function, symbol_param, symbol.upper(), **params))
+            with self._lock:
+                self._entries[key] = value
+                while len(self._entries) > self.max_size:
+                    evicted, _ = self._entries.popitem(last=False)
+                    self._key_locks.pop(evicted, None)
+            return value
+
+    def get_company_overview(self, symbol: str) -> Optional[CompanyOverview]:
+        """Company overview (OVERVIEW), or None if Alpha Vantage has none for the symbol"""
+        return self._cached("OVERVIEW", "symbol", symbol, lambda data: parse_overview(data) if data else None)
+
+    def get_daily_series(self, symbol: str) -> List[DailyBar]:
+        """Daily prices (TIME_SERIES_DAILY, latest 100 trading days), oldest first"""
+        return self._cached("TIME_SERIES_DAILY", "symbol", symbol, parse_daily_series)
+
+    def get_news(self, ticker: str, time_from: str = None, limit: int = None) -> List[NewsArticle]:
+        """News and sentiment articles mentioning a ticker (NEWS_SENTIMENT)
+
+        Args:
+            ticker: Stock ticker
+            time_from: Earliest publication time, YYYYMMDDTHHMM
+            limit: Maximum number of articles (Alpha Vantage defaults to 50)
+        """
+        params = {}
+        if time_from:
+            params["time_from"] = time_from
+        if limit:
+            params["limit"] = limit
+        return self._cached("NEWS_SENTIMENT", "tickers", ticker, parse_news, **params)
+
+
+_market_data_client = None
+_market_data_client_lock = threading.Lock()
+
+
+def get_market_data_client() -> MarketDataClient:
+    """Get the process-wide market data client, so analysis and ingestion share its cache and quota"""
+    global _market_data_client
+    if _market_data_client is None:
+        with _market_data_client_lock:
+            if _market_data_client is None:
+                _market_data_client = MarketDataClient()
+    return _market_data_client
@@ -1,37 +1,60 @@
 import os
 import json
+import functools
 from datetime import datetime
 from typing import List, Dict, Any
-from firestore_vector_store import FirestoreVectorStore
+from vector_store import VectorStore, chunk_id, get_vector_store
+from retention import apply_retention, prune_snapshot, snapshot_types
+from ingestion import IngestionCheckpoint, QuotaExhausted, run_pipeline
+from market_data import AlphaVantageThrottled, get_market_data_client
+from embedding_pipeline import default_text_splitter, embed_and_store, iter_chunks
 from langchain_openai import OpenAIEmbeddings
-import requests
 from dotenv import load_dotenv
-from utils import get_alpha_vantage_api_key, get_openai_api_key
+from utils import get_openai_api_key
 
 load_dotenv()
 
-def fetch_market_news(ticker: str) -> List[Dict[str, Any]]:
-    """Fetch market news for a given ticker using Alpha Vantage"""
-    api_key = get_alpha_vantage_api_key()
-    url = f"https://www.alphavantage.co/query?function=NEWS_SENTIMENT&tickers={ticker}&apikey={api_key}"
+# NEWS_SENTIMENT's maximum page size, used when fetching only articles newer than a watermark
+NEWS_INCREMENTAL_LIMIT = 1000
+
+def format_metric(value) -> str:
+    """Overview metric as the document text shows it; whole numbers print without a decimal point"""
+    if value is None:
+        return "N/A"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+def fetch_market_news(ticker: str, since: str = None) -> List[Dict[str, Any]]:
+    """Fetch market news for a given ticker using Alpha Vantage
     
+    Args:
+        ticker: Stock ticker
+        since: Only fetch articles published at or after this time_published
+            (YYYYMMDDTHHMMSS), e.g. the ticker's news watermark
+    """
     try:
-        response = requests.get(url)
-        data = response.json()
-        
-        if "feed" not in data:
-            return []
+        if since:
+            # time_from has minute precision; the default limit of 50 could drop part of a backlog
+            articles = get_market_data_client().get_news(ticker, time_from=since[:13], limit=NEWS_INCREMENTAL_LIMIT)
+        else:
+            articles = get_market_data_client().get_news(ticker)
         
         documents = []
-        for item in data["feed"]:
+        for article in articles:
+            if since and (article["time_published"] or "") < since:
+                continue
             documents.append({
-                "text": f"{item['title']}\n\n{item['summary']}",
-                "source": item.get("source", "Alpha Vantage"),
-                "date": item.get("time_published", datetime.now().strftime("%Y%m%d")),
-                "type": "market_news"
+                "text": f"{article['title']}\n\n{article['summary']}",
+                "source": article["source"],
+                "date": article["time_published"] or datetime.now().strftime("%Y%m%d"),
+                "type": "market_news",
+                "ticker": ticker
             })
         
         return documents
+    except (QuotaExhausted, AlphaVantageThrottled):
+        raise
     except Exception as e:
         print(f"Error fetching market news: {str(e)}")
         return []
@@ -78,86 +101,185 @@ def fetch_historical_patterns(ticker: str) -> List[Dict[str, Any]]:
 
 def fetch_company_specific_info(ticker: str) -> List[Dict[str, Any]]:
     """Fetch company-specific information for a given ticker"""
-    api_key = get_alpha_vantage_api_key()
-    url = f"https://www.alphavantage.co/query?function=OVERVIEW&symbol={ticker}&apikey={api_key}"
-    
     try:
-        response = requests.get(url)
-        data = response.json()
+        overview = get_market_data_client().get_company_overview(ticker)
         
-        if not data:
+        if not overview:
             return []
         
         # Format company overview into a document
         overview_text = f"""
         Company Overview:
-        Name: {data.get('Name', 'N/A')}
-        Sector: {data.get('Sector', 'N/A')}
-        Industry: {data.get('Industry', 'N/A')}
-        Description: {data.get('Description', 'N/A')}
+        Name: {overview['name'] or 'N/A'}
+        Sector: {overview['sector'] or 'N/A'}
+        Industry: {overview['industry'] or 'N/A'}
+        Description: {overview['description'] or 'N/A'}
         
         Key Metrics:
-        Market Cap: {data.get('MarketCapitalization', 'N/A')}
-        P/E Ratio: {data.get('PERatio', 'N/A')}
-        Dividend Yield: {data.get('DividendYield', 'N/A')}
-        Beta: {data.get('Beta', 'N/A')}
+        Market Cap: {format_metric(overview['market_cap'])}
+        P/E Ratio: {format_metric(overview['pe_ratio'])}
+        Dividend Yield: {format_metric(overview['dividend_yield'])}
+        Beta: {format_metric(overview['beta'])}
         
         Financial Performance:
-        Revenue Growth: {data.get('RevenueGrowth', 'N/A')}
-        Profit Margin: {data.get('ProfitMargin', 'N/A')}
-        Return on Equity: {data.get('ReturnOnEquityTTM', 'N/A')}
+        Revenue Growth: {format_metric(overview['revenue_growth'])}
+        Profit Margin: {format_metric(overview['profit_margin'])}
+        Return on Equity: {format_metric(overview['return_on_equity'])}
         """
         
         return [{
             "text": overview_text,
             "source": "Alpha Vantage",
             "date": datetime.now().strftime("%Y%m%d"),
-            "type": "company_info"
+            "type": "company_info",
+            "ticker": ticker,
+            "sector": overview["sector"]
         }]
+    except (QuotaExhausted, AlphaVantageThrottled):
+        raise
     except Exception as e:
         print(f"Error fetching company info: {str(e)}")
         return []
 
-def populate_database(ticker: str):
-    """Populate the Firestore vector database with various types of information for a given ticker"""
-    print(f"Populating Firestore vector database for {ticker}...")
-    
-    # Initialize Firestore vector store and embedding model
-    vector_store = FirestoreVectorStore(collection_name="financial_data")
-    embedding_model = OpenAIEmbeddings(api_key=get_openai_api_key())
-    
-    # Fetch and add different types of documents
+def news_watermark_key(ticker: str) -> str:
+    return f"news_{ticker.upper()}"
+
+def fetch_documents(ticker: str, news_since: str = None) -> List[Dict[str, Any]]:
+    """Fetch every type of document for a ticker, tagged with the ticker and sector"""
     documents = []
     
     # Market news
-    print("Fetching market news...")
-    documents.extend(fetch_market_news(ticker))
+    print(f"Fetching market news for {ticker}" + (f" published since {news_since}..." if news_since else "..."))
+    documents.extend(fetch_market_news(ticker, since=news_since))
     
     # Regulatory documents
-    print("Fetching regulatory documents...")
     documents.extend(fetch_regulatory_documents(ticker))
     
     # Historical patterns
-    print("Fetching historical patterns...")
     documents.extend(fetch_historical_patterns(ticker))
     
     # Company-specific information
-    print("Fetching company-specific information...")
+    print(f"Fetching company-specific information for {ticker}...")
     documents.extend(fetch_company_specific_info(ticker))
     
-    # Generate embeddings for all documents
-    print("Generating embeddings...")
-    texts = [doc["text"] for doc in documents]
-    embeddings = embedding_model.embed_documents(texts)
+    # Tag every document with the ticker (and sector, when known) so retrieval can be scoped to it
+    sector = next((doc["sector"] for doc in documents if doc.get("sector")), None)
+    for doc in documents:
+        doc["ticker"] = ticker
+        if sector:
+            doc.setdefault("sector", sector)
+    return documents
+
+def fetch_ticker(vector_store: VectorStore, ticker: str) -> Dict[str, Any]:
+    """Fetch a ticker's documents, requesting only news newer than its watermark
+    
+    Returns:
+        Ingestion batch: ticker, documents, fetched count and the news watermark
+        to record once the documents are written
+    """
+    news_since = vector_store.get_watermark(news_watermark_key(ticker))
+    documents = fetch_documents(ticker, news_since)
+    # Only full time_published values; undated articles fall back to a bare day
+    published = [doc["date"] for doc in documents if doc["type"] == "market_news" and "T" in doc["date"]]
+    return {
+        "ticker": ticker,
+        "documents": documents,
+        "fetched": len(documents),
+        "news_watermark": max(published + ([news_since] if news_since else []), default=None)
+    }
+
+def store_documents(vector_store: VectorStore, embedding_model, text_splitter, batch: Dict[str, Any]) -> Dict[str, Any]:
+    """Chunk, embed and write a ticker's documents, then advance its news watermark
+    
+    Chunks stream through token-bounded embedding batches that are written
+    as they complete (see embed_and_store). The watermark only moves after
+    every batch is written, so a failed run re-fetches the same articles
+    next time. Chunks left over from an earlier snapshot of a document that
+    is replaced wholesale (the company overview) are then deleted.
     
-    # Add all documents to the vector store
-    print(f"Adding {len(documents)} documents to the vector store...")
-    vector_store.add_documents(documents, embeddings)
+    Returns:
+        Counts of documents fetched, chunks and chunks written, and the watermark,
+        recorded in the checkpoint
+    """
+    snapshots = {doc_type: set() for doc_type in snapshot_types() if any(doc["type"] == doc_type for doc in batch["documents"])}
+
+    def track_snapshots(chunks):
+        # Unchanged chunks aren't rewritten, so the full snapshot is only known here
+        for chunk in chunks:
+            if chunk["type"] in snapshots:
+                snapshots[chunk["type"]].add(chunk_id(chunk))
+            yield chunk
+
+    stats = embed_and_store(track_snapshots(iter_chunks(batch["documents"], text_splitter)), embedding_model, vector_store)
+    for doc_type, current_ids in snapshots.items():
+        prune_snapshot(vector_store, doc_type, batch["ticker"], current_ids)
+    if batch["news_watermark"]:
+        vector_store.set_watermark(news_watermark_key(batch["ticker"]), batch["news_watermark"])
+    return {
+        "fetched": batch["fetched"],
+        "chunks": stats["chunks"],
+        "written": stats["written"],
+        "news_watermark": batch["news_watermark"]
+    }
+
+def populate_database(ticker: str):
+    """Populate the vector database with various types of information for a given ticker
     
+    The backend is chosen by VECTOR_STORE_BACKEND (see get_vector_store).
+    """
+    vector_store = get_vector_store(collection_name="financial_data")
+    print(f"Populating {vector_store.backend} vector database for {ticker}...")
+    embedding_model = OpenAIEmbeddings(api_key=get_openai_api_key())
+    
+    stats = store_documents(vector_store, embedding_model, default_text_splitter(), fetch_ticker(vector_store, ticker))
+    print(f"{stats['chunks'] - stats['written']} of {stats['chunks']} chunks already stored, wrote {stats['written']}")
     print("Database population complete!")
 
+def run_ingestion(
+    tickers: List[str],
+    checkpoint: IngestionCheckpoint = None,
+    fetch_workers: int = 2,
+    store_workers: int = 2
+) -> Dict[str, Any]:
+    """Populate the vector database for many tickers as a pipeline
+    
+    Fetching and storing (chunking, embedding and writing) run in separate
+    worker pools, so one ticker's Alpha Vantage calls overlap another's
+    embedding, and each ticker's embedding batches overlap their writes.
+    Alpha Vantage calls go through the shared market data client, which
+    throttles them and stops the run when the daily quota is used, and
+    news is fetched only from each ticker's watermark on.
+    Progress is checkpointed per ticker; rerunning the same day skips
+    tickers already done and retries the rest.
+    
+    Args:
+        tickers: Tickers to ingest; case and duplicates are ignored
+        checkpoint: Progress record (defaults to today's run checkpoint)
+        fetch_workers: Tickers fetched at once
+        store_workers: Tickers chunked, embedded and written at once
+    
+    Returns:
+        Pipeline summary (see run_pipeline)
+    """
+    vector_store = get_vector_store(collection_name="financial_data")
+    embedding_model = OpenAIEmbeddings(api_key=get_openai_api_key())
+    checkpoint = checkpoint if checkpoint is not None else IngestionCheckpoint.for_run()
+    
+    stages = [
+        ("fetch", functools.partial(fetch_ticker, vector_store), fetch_workers),
+        ("store", functools.partial(store_documents, vector_store, embedding_model, default_text_splitter()), store_workers),
+    ]
+    summary = run_pipeline([ticker.upper() for ticker in tickers], stages, checkpoint, max_in_flight=fetch_workers + store_workers)
+    print(
+        f"Ingested {len(summary['completed'])} tickers, skipped {len(summary['skipped'])} already done, "
+        f"{len(summary['failed'])} failed, {len(summary['pending'])} left for the next run"
+    )
+    return summary
+
 if __name__ == "__main__":
     # Example usage
     tickers = ["AAPL", "TSLA", "NVDA", "MSFT", "GOOG", "AMZN", "META", "NFLX", "TSM", "WMT", "JNJ", "VZ", "IBM", "MMM", "PFE", "BA", "CAT", "CSCO", "TM", "V", "WBA", "DIS", "GS", "JPM", "MS", "NKE", "ORCL", "QCOM", "TXN", "WMT", "XOM", "BA", "CAT", "CSCO", "TM", "V", "WBA", "DIS", "GS", "JPM", "MS", "NKE", "ORCL", "QCOM", "TXN", "WMT", "XOM"]   # You can change this to any ticker
-    for ticker in tickers:
-        populate_database(ticker) 
\ No newline at end of file
+    run_ingestion(tickers)
+    
+    # Drop news past its retention window
+    print(f"Retention removed: {apply_retention()}")
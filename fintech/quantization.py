@@ -0,0 +1,75 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+QUANTIZATIONS = ("float16", "int8")
+# Candidates fetched per requested result when rescoring with the full-dimension vectors
+RESCORE_OVERSAMPLE = 4
+
+
+def normalize(vector: np.ndarray) -> np.ndarray:
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def truncate_embedding(embedding, dimensions: Optional[int]) -> np.ndarray:
+    """Keep the leading dimensions of an embedding and renormalize
+
+    Only meaningful for models trained to support shortening (e.g. OpenAI
+    text-embedding-3-*); for older models it just degrades recall.
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    if dimensions and dimensions < vector.shape[0]:
+        vector = normalize(vector[:dimensions])
+    return vector
+
+
+def quantize(embedding, dtype: str) -> Tuple[bytes, Dict[str, Any]]:
+    """Encode an embedding compactly
+
+    Args:
+        embedding: The embedding vector
+        dtype: "float16", or "int8" for symmetric scalar quantization with a per-vector scale
+
+    Returns:
+        Tuple of (encoded bytes, encoding parameters needed by dequantize)
+    """
+    vector = np.asarray(embedding, dtype=np.float32)
+    if dtype == "float16":
+        return vector.astype(np.float16).tobytes(), {"dtype": "float16"}
+    if dtype == "int8":
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        return np.round(vector / scale).astype(np.int8).tobytes(), {"dtype": "int8", "scale": scale}
+    raise ValueError(f"Unsupported quantization: {dtype}")
+
+
+def dequantize(data: bytes, encoding: Dict[str, Any]) -> np.ndarray:
+    if encoding["dtype"] == "float16":
+        return np.frombuffer(data, dtype=np.float16).astype(np.float32)
+    if encoding["dtype"] == "int8":
+        return np.frombuffer(data, dtype=np.int8).astype(np.float32) * encoding["scale"]
+    raise ValueError(f"Unsupported quantization: {encoding['dtype']}")
+
+
+def rescore(
+    query_embedding,
+    candidates: List[Dict[str, Any]],
+    limit: int,
+    distance_threshold: float = None
+) -> List[Dict[str, Any]]:
+    """Re-rank coarse search candidates by cosine distance to their full-dimension vectors
+
+    Candidates carry `embedding_full`/`embedding_encoding` as stored by
+    FirestoreVectorStore; those without them keep their coarse distance.
+    The encoded fields are removed from the returned results.
+    """
+    query = normalize(np.asarray(query_embedding, dtype=np.float32))
+    for candidate in candidates:
+        data = candidate.pop("embedding_full", None)
+        encoding = candidate.pop("embedding_encoding", None)
+        if data is not None and encoding:
+            candidate["distance"] = float(1.0 - normalize(dequantize(data, encoding)) @ query)
+    ranked = sorted(candidates, key=lambda candidate: candidate["distance"])
+    if distance_threshold is not None:
+        ranked = [candidate for candidate in ranked if candidate["distance"] <= distance_threshold]
+    return ranked[:limit]
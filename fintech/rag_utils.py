@@ -1,109 +1,249 @@
+import asyncio
+import logging
 import os
-from typing import List, Dict, Any
+import threading
+from typing import List, Dict, Any, Optional, Tuple
 import numpy as np
 from langchain_openai import OpenAIEmbeddings
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from langchain.retrievers import ContextualCompressionRetriever
-from langchain.retrievers.document_compressors import LLMChainExtractor
-from langchain_anthropic import ChatAnthropic
 from dotenv import load_dotenv
-from firestore_vector_store import FirestoreVectorStore
-from utils import get_openai_api_key, get_claude_api_key
+from vector_store import get_vector_store
+from utils import get_openai_api_key
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from context_packer import pack_context, token_budget_for
+from lexical_index import reciprocal_rank_fusion
+from retrieval_cache import RetrievalCache, retrieval_key
+from embedding_pipeline import CHUNK_OVERLAP, CHUNK_SIZE, embed_and_store, iter_chunks
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_LIMIT = 5
+# Results taken from each retriever before fusion
+FUSION_CANDIDATES = 10
+
+
 class RAGManager:
-    def __init__(self):
-        """Initialize RAG manager with vector store and embedding model"""
-        self.embedding_model = OpenAIEmbeddings(api_key=get_openai_api_key())
+    def __init__(self, hybrid: bool = None, backend: str = None):
+        """Initialize RAG manager with vector store and embedding model
         
-        # Initialize text splitter
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200
+        Args:
+            hybrid: Fuse BM25 keyword results with vector results
+                (defaults to HYBRID_RETRIEVAL, which is on unless set to 0)
+            backend: Vector store backend, "firestore", "memory" or "local"
+                (defaults to VECTOR_STORE_BACKEND, see get_vector_store)
+        """
+        # Initialize the configured vector store
+        self.vector_store = get_vector_store(backend)
+        
+        # Query embeddings are cached by model and text, so repeat analyses don't call the API;
+        # only Firestore-backed runs keep the cache in Firestore
+        self.embedding_model = CachedEmbeddings(
+            OpenAIEmbeddings(api_key=get_openai_api_key()),
+            EmbeddingCache(persistent=self.vector_store.backend == "firestore")
         )
         
-        # Initialize LLM for compression
-        self.llm = ChatAnthropic(
-            model_name="claude-3-5-sonnet-latest",
-            temperature=0.7,
-            max_tokens_to_sample=4000,
-            api_key=get_claude_api_key()
+        # Initialize text splitter
+        self.text_splitter = RecursiveCharacterTextSplitter(
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP
         )
         
-        # Initialize Firestore vector store
-        self.vector_store = FirestoreVectorStore()
+        if hybrid is None:
+            hybrid = os.getenv("HYBRID_RETRIEVAL", "1") != "0"
+        self.hybrid = hybrid
+        if hybrid:
+            # Load the keyword index now rather than on the first hybrid query
+            self.vector_store.warm()
+        self.retrieval_cache = RetrievalCache()
     
-    def add_documents(self, documents: List[Dict[str, Any]]) -> None:
+    def add_documents(self, documents: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Add documents to the vector store
         
+        Chunks are embedded in token-bounded batches and written as each
+        batch completes; chunks already stored are skipped.
+        
         Args:
             documents: List of dictionaries containing document data
+            
+        Returns:
+            Stats dict with chunks, written, batches and seconds
         """
-        # Convert documents to LangChain Document objects and split into chunks
-        docs = []
-        for doc in documents:
-            texts = self.text_splitter.split_text(doc["text"])
-            for text in texts:
-                docs.append(Document(
-                    page_content=text,
-                    metadata={
-                        "source": doc.get("source", "unknown"),
-                        "date": doc.get("date", "unknown"),
-                        "type": doc.get("type", "unknown")
-                    }
-                ))
-        
-        # Generate embeddings for all chunks
-        texts = [doc.page_content for doc in docs]
-        embeddings = self.embedding_model.embed_documents(texts)
-        
-        # Add to Firestore
-        self.vector_store.add_documents(docs, embeddings)
+        return embed_and_store(iter_chunks(documents, self.text_splitter), self.embedding_model, self.vector_store)
     
-    def retrieve_relevant_context(self, query: str, context_type: str = None) -> List[Document]:
+    def retrieve_relevant_context(
+        self,
+        query: str,
+        context_type: str = None,
+        ticker: str = None,
+        sector: str = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Document]:
         """Retrieve relevant documents from the vector store
         
+        Filters narrow the candidate set before the nearest-neighbour search.
+        In hybrid mode, vector and BM25 keyword results are fused with
+        reciprocal-rank fusion, so exact terms like tickers and "liquidity"
+        count even where embeddings blur them.
+        
         Args:
             query: The query string
             context_type: Optional filter for document type
+            ticker: Optional filter for documents about this ticker
+            sector: Optional filter for documents about this sector
+            date_range: Optional inclusive (start, end) bounds on the document date
             
         Returns:
             List of relevant documents
         """
-        # Generate embedding for query
-        query_embedding = self.embedding_model.embed_query(query)
-        
-        # Set up metadata filters if context_type is specified
-        metadata_filters = {"type": context_type} if context_type else None
-        
-        # Search Firestore
-        results = self.vector_store.search(
-            query_embedding=query_embedding,
-            limit=5,
-            metadata_filters=metadata_filters
-        )
+        metadata_filters = self._metadata_filters(context_type, ticker, sector)
+        cache_key = self._cache_key(query, metadata_filters, date_range)
+        results = self.retrieval_cache.get(cache_key)
+        if results is None:
+            results = self._search(query, metadata_filters, date_range)
+            self.retrieval_cache.put(cache_key, results)
         
         # Convert results to Document objects
         docs = []
         for result in results:
             docs.append(Document(
                 page_content=result["content"],
-                metadata=result["metadata"]
+                metadata=dict(result["metadata"])
             ))
             
         return docs
     
-    def format_context_for_prompt(self, docs: List[Document]) -> str:
+    def prefetch_context(self, requests: List[Dict[str, Any]]) -> None:
+        """Retrieve context for several queries concurrently and cache the results
+        
+        The vector searches are issued together on the async Firestore client;
+        later retrieve_relevant_context calls with the same arguments are then
+        served from the retrieval cache. Failures are logged and left to the
+        individual calls to retry.
+        
+        Args:
+            requests: Keyword arguments for retrieve_relevant_context, one dict per retrieval
+        """
+        pending = []
+        for request in requests:
+            metadata_filters = self._metadata_filters(request.get("context_type"), request.get("ticker"), request.get("sector"))
+            cache_key = self._cache_key(request["query"], metadata_filters, request.get("date_range"))
+            if self.retrieval_cache.get(cache_key) is None:
+                pending.append((request, metadata_filters, cache_key))
+        if not pending:
+            return
+        
+        try:
+            if not self.vector_store.concurrent_search:
+                # In-process search is already sub-millisecond; nothing to overlap
+                for request, metadata_filters, cache_key in pending:
+                    self.retrieval_cache.put(cache_key, self._search(request["query"], metadata_filters, request.get("date_range")))
+                return
+            
+            searches = [
+                {
+                    "query_embedding": self.embedding_model.embed_query(request["query"]),
+                    "limit": FUSION_CANDIDATES if self.hybrid else RETRIEVAL_LIMIT,
+                    "metadata_filters": metadata_filters,
+                    "date_range": request.get("date_range")
+                }
+                for request, metadata_filters, _ in pending
+            ]
+            vector_results = asyncio.run(self._search_many(searches))
+            for (request, metadata_filters, cache_key), results in zip(pending, vector_results):
+                self.retrieval_cache.put(
+                    cache_key, self._fuse(request["query"], results, metadata_filters, request.get("date_range"))
+                )
+        except Exception as e:
+            logger.warning(f"Context prefetch failed, retrieving per agent instead: {str(e)}")
+    
+    async def _search_many(self, searches: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+        from async_vector_store import AsyncFirestoreVectorStore
+        
+        # A fresh async client per event loop, closed when search_many finishes; see create_async_client
+        return await AsyncFirestoreVectorStore(self.vector_store).search_many(searches)
+    
+    def _metadata_filters(self, context_type: str = None, ticker: str = None, sector: str = None) -> Optional[Dict[str, Any]]:
+        metadata_filters = {}
+        if context_type:
+            metadata_filters["type"] = context_type
+        if ticker:
+            metadata_filters["ticker"] = ticker.upper()
+        if sector:
+            metadata_filters["sector"] = sector
+        return metadata_filters or None
+    
+    def _cache_key(
+        self,
+        query: str,
+        metadata_filters: Optional[Dict[str, Any]],
+        date_range: Optional[Tuple[Optional[str], Optional[str]]]
+    ) -> str:
+        # The corpus only changes on ingestion, which bumps its version and so the cache key
+        return retrieval_key(
+            query,
+            self.vector_store.corpus_version(),
+            filters=metadata_filters,
+            date_range=date_range,
+            limit=RETRIEVAL_LIMIT,
+            hybrid=self.hybrid
+        )
+    
+    def _search(
+        self,
+        query: str,
+        metadata_filters: Optional[Dict[str, Any]],
+        date_range: Optional[Tuple[Optional[str], Optional[str]]]
+    ) -> List[Dict[str, Any]]:
+        """Run vector (and in hybrid mode, keyword) search for a query"""
+        # Generate embedding for query
+        query_embedding = self.embedding_model.embed_query(query)
+        
+        # Search Firestore
+        results = self.vector_store.search(
+            query_embedding=query_embedding,
+            limit=FUSION_CANDIDATES if self.hybrid else RETRIEVAL_LIMIT,
+            metadata_filters=metadata_filters,
+            date_range=date_range
+        )
+        return self._fuse(query, results, metadata_filters, date_range)
+    
+    def _fuse(
+        self,
+        query: str,
+        vector_results: List[Dict[str, Any]],
+        metadata_filters: Optional[Dict[str, Any]],
+        date_range: Optional[Tuple[Optional[str], Optional[str]]]
+    ) -> List[Dict[str, Any]]:
+        """In hybrid mode, fuse vector results with keyword results"""
+        if not self.hybrid:
+            return vector_results
+        lexical_results = self.vector_store.lexical_search(
+            query,
+            limit=FUSION_CANDIDATES,
+            metadata_filters=metadata_filters,
+            date_range=date_range
+        )
+        return reciprocal_rank_fusion([vector_results, lexical_results], limit=RETRIEVAL_LIMIT)
+    
+    def format_context_for_prompt(self, docs: List[Document], context_type: str = None, query: str = None) -> str:
         """Format retrieved documents into a prompt-friendly string
         
+        Documents are packed first: near-duplicates are dropped, overlapping
+        chunks merged, sentences unrelated to the query removed, and the rest
+        fitted to the agent's token budget.
+        
         Args:
-            docs: List of retrieved documents
+            docs: List of retrieved documents, most relevant first
+            context_type: Context type used for retrieval, selects the token budget
+            query: Query used for retrieval, used to compress the documents
             
         Returns:
             Formatted context string
         """
+        docs = pack_context(docs, token_budget_for(context_type), query)
         context = "Relevant Context:\n\n"
         for i, doc in enumerate(docs, 1):
             context += f"Context {i}:\n"
@@ -113,5 +253,19 @@ class RAGManager:
             context += f"Content: {doc.page_content}\n\n"
         return context
 
-# Initialize global RAG manager instance
-rag_manager = RAGManager() 
\ No newline at end of file
+_rag_manager = None
+_rag_manager_lock = threading.Lock()
+
+
+def get_rag_manager() -> RAGManager:
+    """Get the global RAG manager instance, creating it on first use
+
+    Construction creates the embedding/LLM clients and the Firestore vector
+    store, so it is deferred until an analysis actually needs retrieval.
+    """
+    global _rag_manager
+    if _rag_manager is None:
+        with _rag_manager_lock:
+            if _rag_manager is None:
+                _rag_manager = RAGManager()
+    return _rag_manager
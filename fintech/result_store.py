@@ -0,0 +1,203 @@
+import json
+import logging
+import zlib
+from typing import Any, Dict, List, Tuple
+
+from google.cloud import firestore
+
+try:
+    import orjson
+except ImportError:  # Fall back to the standard library encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+RESULTS_COLLECTION = "analysis_results"
+SECTIONS_SUBCOLLECTION = "sections"
+
+# Sections larger than this (serialized) are compressed and moved out of the summary document
+INLINE_SECTION_LIMIT = 64 * 1024
+# Compressed sections are split into chunks well under Firestore's 1 MiB document limit
+CHUNK_BYTES = 512 * 1024
+
+
+def normalize(value: Any) -> Any:
+    """Convert an analysis result into plain JSON types in a single pass
+
+    Strings that hold JSON objects or arrays (LLM output) are parsed, objects
+    exposing `raw` are unwrapped, and anything else is stringified.
+    """
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    if isinstance(value, str):
+        stripped = value.lstrip()
+        if stripped[:1] in ("{", "["):
+            try:
+                return normalize(loads(stripped))
+            except ValueError:
+                return value
+        return value
+    if isinstance(value, dict):
+        return {str(k): normalize(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    if hasattr(value, "raw"):
+        return normalize(value.raw)
+    return str(value)
+
+
+def dumps(value: Any) -> bytes:
+    """Serialize normalized data to compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(value, default=str)
+    return json.dumps(value, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def loads(data) -> Any:
+    """Parse JSON from bytes or str"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def split_sections(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a result into named sections: top-level keys, plus one per analysis agent"""
+    sections = {}
+    for key, value in result.items():
+        if key == "analysis" and isinstance(value, dict):
+            for agent, output in value.items():
+                sections[f"analysis.{agent}"] = output
+        else:
+            sections[key] = value
+    return sections
+
+
+def set_section(result: Dict[str, Any], name: str, value: Any) -> None:
+    """Put a section back at its place in a result (inverse of split_sections)"""
+    *parents, leaf = name.split(".")
+    target = result
+    for parent in parents:
+        target = target.setdefault(parent, {})
+    target[leaf] = value
+
+
+def encode_section(value: Any) -> Tuple[List[bytes], int]:
+    """Compress a section and split it into chunks
+
+    Returns:
+        Tuple of (chunks, uncompressed size in bytes)
+    """
+    raw = dumps(value)
+    compressed = zlib.compress(raw, 6)
+    chunks = [compressed[i:i + CHUNK_BYTES] for i in range(0, len(compressed), CHUNK_BYTES)]
+    return chunks, len(raw)
+
+
+def decode_section(chunks: List[bytes]) -> Any:
+    return loads(zlib.decompress(b"".join(chunks)))
+
+
+def store_result(db, doc_id: str, ticker: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """Store a completed analysis, keeping the summary document small
+
+    Small sections are stored inline under `result` so clients can render
+    them straight from the document. Sections larger than
+    INLINE_SECTION_LIMIT are compressed into chunk documents in the
+    `sections` subcollection and listed in `offloaded_sections`.
+
+    Args:
+        db: Firestore client
+        doc_id: ID of the analysis document
+        ticker: Ticker the analysis is for
+        result: Normalized analysis result (see normalize)
+
+    Returns:
+        The summary document data that was written
+    """
+    analysis_ref = db.collection(RESULTS_COLLECTION).document(doc_id)
+    batch = db.batch()
+    inline_result: Dict[str, Any] = {}
+    offloaded: Dict[str, Dict[str, int]] = {}
+
+    for name, value in split_sections(result).items():
+        serialized_size = len(dumps(value))
+        if serialized_size <= INLINE_SECTION_LIMIT:
+            set_section(inline_result, name, value)
+            continue
+
+        chunks, size = encode_section(value)
+        for index, chunk in enumerate(chunks):
+            batch.set(analysis_ref.collection(SECTIONS_SUBCOLLECTION).document(f"{name}-{index}"), {
+                "section": name,
+                "index": index,
+                "data": chunk
+            })
+        offloaded[name] = {"chunks": len(chunks), "size": size}
+        logger.info(f"Offloaded section {name} of {doc_id}: {size} bytes in {len(chunks)} chunk(s)")
+
+    summary = {
+        "ticker": ticker,
+        "result": inline_result,
+        "offloaded_sections": sorted(offloaded),
+        "section_sizes": offloaded,
+        "status": "completed",
+        "timestamp": firestore.SERVER_TIMESTAMP
+    }
+    # The batch is atomic, so clients never see "completed" before the chunks exist
+    batch.set(analysis_ref, summary)
+    batch.commit()
+    return summary
+
+
+def load_section(db, doc_id: str, name: str, data: Dict[str, Any] = None) -> Any:
+    """Load one section of a stored analysis, inline or offloaded
+
+    Args:
+        db: Firestore client
+        doc_id: ID of the analysis document
+        name: Section name, e.g. "quantitative_data" or "analysis.risk_assessment"
+        data: Summary document data if it was already read
+
+    Raises:
+        KeyError: If the analysis or section doesn't exist
+    """
+    analysis_ref = db.collection(RESULTS_COLLECTION).document(doc_id)
+    if data is None:
+        snapshot = analysis_ref.get()
+        if not snapshot.exists:
+            raise KeyError(f"Analysis {doc_id} not found")
+        data = snapshot.to_dict()
+
+    section_info = data.get("section_sizes", {}).get(name)
+    if section_info is None:
+        value = data.get("result", {})
+        for part in name.split("."):
+            if not isinstance(value, dict) or part not in value:
+                raise KeyError(f"Section {name} not found in analysis {doc_id}")
+            value = value[part]
+        return value
+
+    chunk_refs = [
+        analysis_ref.collection(SECTIONS_SUBCOLLECTION).document(f"{name}-{index}")
+        for index in range(section_info["chunks"])
+    ]
+    chunks = {snap.id: snap.to_dict()["data"] for snap in db.get_all(chunk_refs) if snap.exists}
+    if len(chunks) != section_info["chunks"]:
+        raise KeyError(f"Section {name} of analysis {doc_id} is incomplete")
+    return decode_section([chunks[ref.id] for ref in chunk_refs])
+
+
+def load_result(db, doc_id: str, data: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Load a full analysis result, fetching any offloaded sections
+
+    Args:
+        db: Firestore client
+        doc_id: ID of the analysis document
+        data: Summary document data if it was already read
+    """
+    if data is None:
+        data = db.collection(RESULTS_COLLECTION).document(doc_id).get().to_dict() or {}
+    result = dict(data.get("result", {}))
+    for name in data.get("offloaded_sections", []):
+        set_section(result, name, load_section(db, doc_id, name, data))
+    return result
@@ -0,0 +1,119 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List
+
+from metrics import registry
+from vector_store import VectorStore, get_vector_store
+
+logger = logging.getLogger(__name__)
+
+NEWS_RETENTION_DAYS = int(os.getenv("NEWS_RETENTION_DAYS", "30"))
+
+# Per document type: "max_age_days" drops documents dated before the cutoff;
+# "latest_snapshot" keeps only the chunks of each ticker's most recently
+# ingested document, pruned at ingestion time by prune_snapshot (unchanged
+# chunks are deduplicated and keep their first date, so dates can't tell
+# snapshots apart). Types without a policy (the regulatory and historical
+# samples) are kept indefinitely.
+RETENTION_POLICIES: Dict[str, Dict[str, int]] = {
+    "market_news": {"max_age_days": NEWS_RETENTION_DAYS},
+    "company_info": {"latest_snapshot": True},
+}
+
+RETENTION_DELETES = registry.counter("retention_deleted_documents_total", "Documents deleted by retention policies by type")
+
+
+def _date_key(metadata: Dict[str, Any]) -> str:
+    # Dates are YYYYMMDD or Alpha Vantage's YYYYMMDDTHHMMSS, so string order is chronological
+    return str(metadata.get("date", ""))[:8]
+
+
+def expired_documents(documents: List[Dict[str, Any]], policy: Dict[str, int], now: datetime = None) -> List[str]:
+    """IDs of the listed documents that a policy no longer retains
+
+    Documents without a YYYYMMDD date are never expired.
+
+    Args:
+        documents: Results of VectorStore.list_documents for one document type
+        policy: Retention policy (see RETENTION_POLICIES)
+        now: Reference time for max_age_days (defaults to the current time)
+
+    Returns:
+        List of document IDs to delete
+    """
+    if "max_age_days" not in policy:
+        return []
+    cutoff = ((now or datetime.now()) - timedelta(days=policy["max_age_days"])).strftime("%Y%m%d")
+    return [
+        doc["id"] for doc in documents
+        if _date_key(doc["metadata"]).isdigit() and _date_key(doc["metadata"]) < cutoff
+    ]
+
+
+def snapshot_types(policies: Dict[str, Dict[str, int]] = None) -> List[str]:
+    """Document types whose latest ingested snapshot replaces the previous one"""
+    policies = policies if policies is not None else RETENTION_POLICIES
+    return [doc_type for doc_type, policy in policies.items() if policy.get("latest_snapshot")]
+
+
+def prune_snapshot(vector_store: VectorStore, doc_type: str, ticker: str, current_ids: Iterable[str]) -> int:
+    """Delete a ticker's documents of a type that aren't part of its latest snapshot
+
+    Call after every chunk of the snapshot has been written, with the IDs of
+    all of them (including chunks that were already stored).
+
+    Args:
+        vector_store: Store holding the documents
+        doc_type: Document type with a latest_snapshot policy
+        ticker: Ticker the snapshot was ingested for
+        current_ids: Chunk IDs of the latest snapshot
+
+    Returns:
+        Number of documents deleted
+    """
+    current_ids = set(current_ids)
+    documents = vector_store.list_documents({"type": doc_type, "ticker": ticker.upper()})
+    superseded = [doc["id"] for doc in documents if doc["id"] not in current_ids]
+    if superseded:
+        vector_store.delete_documents(superseded)
+        RETENTION_DELETES.inc(len(superseded), type=doc_type)
+        logger.info(f"Removed {len(superseded)} superseded {doc_type} chunks for {ticker}")
+    return len(superseded)
+
+
+def apply_retention(
+    vector_store: VectorStore = None,
+    policies: Dict[str, Dict[str, int]] = None,
+    now: datetime = None
+) -> Dict[str, int]:
+    """Delete documents that have outlived their type's retention policy, then compact the store
+
+    Args:
+        vector_store: Store to compact (defaults to get_vector_store())
+        policies: Policies by document type (defaults to RETENTION_POLICIES)
+        now: Reference time for max_age_days
+
+    Returns:
+        Number of documents deleted per document type
+    """
+    vector_store = vector_store if vector_store is not None else get_vector_store()
+    policies = policies if policies is not None else RETENTION_POLICIES
+    now = now or datetime.now()
+    deleted = {}
+    for doc_type, policy in policies.items():
+        if "max_age_days" not in policy:
+            # Snapshot types are pruned as they are ingested (see prune_snapshot)
+            continue
+        # Only documents up to the cutoff day can be expired; don't read the rest
+        date_range = (None, (now - timedelta(days=policy["max_age_days"])).strftime("%Y%m%d"))
+        documents = vector_store.list_documents({"type": doc_type}, date_range)
+        expired = expired_documents(documents, policy, now)
+        if expired:
+            vector_store.delete_documents(expired)
+            RETENTION_DELETES.inc(len(expired), type=doc_type)
+        deleted[doc_type] = len(expired)
+        logger.info(f"Retention removed {len(expired)} of {len(documents)} listed {doc_type} documents")
+    # Local stores keep deleted rows on disk until compacted
+    vector_store.compact()
+    return deleted
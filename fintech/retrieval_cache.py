@@ -0,0 +1,51 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Optional
+
+from metrics import registry
+
+DEFAULT_MAX_ENTRIES = 512
+
+RETRIEVAL_CACHE_LOOKUPS = registry.counter("retrieval_cache_lookups_total", "Retrieval result cache lookups by result")
+
+
+def retrieval_key(query: str, corpus_version: int, **params) -> str:
+    """Cache key for a retrieval: query hash, search parameters and corpus version
+
+    Because the corpus version is part of the key, every ingestion or
+    deletion makes earlier entries unreachable; they age out of the LRU.
+    """
+    payload = json.dumps({"query": query, "version": corpus_version, **params}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class RetrievalCache:
+    """Bounded LRU of retrieval results"""
+
+    def __init__(self, max_size: int = DEFAULT_MAX_ENTRIES):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                RETRIEVAL_CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self._entries.move_to_end(key)
+        RETRIEVAL_CACHE_LOOKUPS.inc(result="hit")
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
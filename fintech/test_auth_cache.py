@@ -0,0 +1,48 @@
+import time
+import pytest
+from unittest.mock import MagicMock
+from auth_cache import VerifiedTokenCache
+
+@pytest.fixture
+def verifier():
+    verify = MagicMock()
+    verify.side_effect = lambda token: {"uid": f"user-{token}", "exp": time.time() + 3600}
+    return verify
+
+
+def test_repeat_token_skips_verification(verifier):
+    cache = VerifiedTokenCache()
+
+    assert cache.verify("token-a", verifier)["uid"] == "user-token-a"
+    assert cache.verify("token-a", verifier)["uid"] == "user-token-a"
+    assert verifier.call_count == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_expired_token_is_verified_again():
+    cache = VerifiedTokenCache(clock_skew_seconds=30)
+    verifier = MagicMock(return_value={"uid": "user", "exp": time.time() + 10})
+
+    cache.verify("token-a", verifier)
+    cache.verify("token-a", verifier)
+
+    # Within the clock skew of `exp`, so never cached
+    assert verifier.call_count == 2
+
+
+def test_cache_is_bounded(verifier):
+    cache = VerifiedTokenCache(max_size=2)
+    for token in ("token-a", "token-b", "token-c"):
+        cache.verify(token, verifier)
+
+    assert cache.get("token-a") is None
+    assert cache.get("token-c")["uid"] == "user-token-c"
+
+
+def test_verification_errors_are_not_cached():
+    cache = VerifiedTokenCache()
+    verifier = MagicMock(side_effect=ValueError("invalid token"))
+
+    with pytest.raises(ValueError):
+        cache.verify("token-a", verifier)
+    assert cache.get("token-a") is None
@@ -0,0 +1,76 @@
+import pytest
+from unittest.mock import MagicMock, patch
+from google.api_core import exceptions as google_exceptions
+import bulk_writer
+from google.cloud.firestore_v1.vector import Vector
+from bulk_writer import bulk_write, estimate_size, split_batches
+
+@pytest.fixture
+def db():
+    db = MagicMock()
+    db.committed = []
+
+    def batch():
+        writes = []
+        batch = MagicMock()
+        batch.set.side_effect = lambda ref, data: writes.append(ref)
+        batch.delete.side_effect = lambda ref: writes.append(ref)
+        batch.commit.side_effect = lambda: db.committed.append(list(writes))
+        return batch
+
+    db.batch.side_effect = batch
+    return db
+
+
+def test_batches_stay_under_write_and_size_limits():
+    writes = [("set", f"doc-{i}", {"content": "x"}) for i in range(1201)]
+    assert [len(batch) for batch in split_batches(writes)] == [500, 500, 201]
+
+    large = [("set", f"doc-{i}", {"content": "x" * 1000}) for i in range(10)]
+    assert [len(batch) for batch in split_batches(large, max_bytes=3000)] == [2, 2, 2, 2, 2]
+
+
+def test_embedding_vectors_count_toward_batch_size():
+    assert estimate_size(Vector([0.1] * 1536)) == 1536 * 8
+    writes = [("set", f"doc-{i}", {"embedding": Vector([0.1] * 1536)}) for i in range(10)]
+    assert [len(batch) for batch in split_batches(writes, max_bytes=30_000)] == [2, 2, 2, 2, 2]
+
+
+def test_bulk_write_commits_every_document(db):
+    stats = bulk_write(db, [("set", f"doc-{i}", {"n": i}) for i in range(1234)], max_workers=4)
+
+    assert stats["documents"] == 1234
+    assert stats["batches"] == 3
+    assert sorted(len(batch) for batch in db.committed) == [234, 500, 500]
+    assert stats["docs_per_second"] > 0
+
+
+def test_throttled_batches_are_retried(db):
+    failures = [google_exceptions.ResourceExhausted("quota")]
+    original = db.batch.side_effect
+
+    def flaky_batch():
+        batch = original()
+        commit = batch.commit.side_effect
+
+        def maybe_fail():
+            if failures:
+                raise failures.pop()
+            commit()
+        batch.commit.side_effect = maybe_fail
+        return batch
+
+    db.batch.side_effect = flaky_batch
+    with patch.object(bulk_writer.time, "sleep") as sleep:
+        stats = bulk_write(db, [("delete", "doc-1", None)])
+
+    assert stats["retries"] == 1
+    assert sleep.call_count == 1
+    assert db.committed == [["doc-1"]]
+
+
+def test_non_retryable_errors_propagate(db):
+    db.batch.side_effect = None
+    db.batch.return_value.commit.side_effect = google_exceptions.PermissionDenied("denied")
+    with pytest.raises(google_exceptions.PermissionDenied):
+        bulk_write(db, [("delete", "doc-1", None)])
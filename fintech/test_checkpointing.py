@@ -0,0 +1,239 @@
+import pytest
+from typing import TypedDict
+from google.api_core.exceptions import Aborted
+from langgraph.graph import StateGraph, START, END
+from langgraph.checkpoint.memory import MemorySaver
+from checkpointing import FirestoreCheckpointSaver, invoke_with_checkpoint
+
+
+OPERATORS = {
+    "==": lambda a, b: a == b,
+    "<": lambda a, b: a is not None and a < b,
+    "<=": lambda a, b: a is not None and a <= b,
+    ">": lambda a, b: a is not None and a > b,
+    ">=": lambda a, b: a is not None and a >= b,
+}
+
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self.db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def collection(self, name):
+        return FakeCollection(self.db, f"{self.path}/{name}")
+
+    def get(self, transaction=None):
+        data = self.db.data.get(self.path)
+        if transaction is not None:
+            transaction.reads[self.path] = dict(data) if data is not None else None
+        return FakeSnapshot(self, data)
+
+
+class FakeCollection:
+    def __init__(self, db, path, filters=(), order=None, max_results=None):
+        self.db = db
+        self.path = path
+        self.filters = filters
+        self.order = order
+        self.max_results = max_results
+
+    def document(self, doc_id):
+        return FakeDocument(self.db, f"{self.path}/{doc_id}")
+
+    def where(self, field, op, value):
+        return FakeCollection(self.db, self.path, self.filters + ((field, OPERATORS[op], value),), self.order, self.max_results)
+
+    def order_by(self, field):
+        return FakeCollection(self.db, self.path, self.filters, field, self.max_results)
+
+    def limit(self, count):
+        return FakeCollection(self.db, self.path, self.filters, self.order, count)
+
+    def stream(self):
+        matches = [
+            (path, data) for path, data in list(self.db.data.items())
+            if path.rsplit("/", 1)[0] == self.path and all(match(data.get(f), v) for f, match, v in self.filters)
+        ]
+        if self.order:
+            matches.sort(key=lambda item: item[1][self.order])
+        for path, data in matches[:self.max_results]:
+            yield FakeSnapshot(FakeDocument(self.db, path), data)
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self.db = db
+        self.operations = []
+
+    def set(self, ref, data, merge=False):
+        def apply():
+            if merge and ref.path in self.db.data:
+                current = self.db.data[ref.path]
+                for key, value in data.items():
+                    current[key] = {**current.get(key, {}), **value} if isinstance(value, dict) else value
+            else:
+                self.db.data[ref.path] = dict(data)
+        self.operations.append(apply)
+
+    def update(self, ref, data):
+        self.operations.append(lambda: self.db.data[ref.path].update(data))
+
+    def delete(self, ref):
+        self.operations.append(lambda: self.db.data.pop(ref.path, None))
+
+    def commit(self):
+        # Firestore rejects commits with more than 500 writes
+        assert len(self.operations) <= 500
+        for apply in self.operations:
+            apply()
+
+
+class FakeTransaction(FakeBatch):
+    """Optimistic transaction: aborts the commit if a document it read has changed since
+
+    Has the private hooks google.cloud.firestore.transactional drives, so the
+    real decorator runs (and retries) the transaction function.
+    """
+
+    _read_only = False
+    _max_attempts = 5
+
+    def __init__(self, db):
+        super().__init__(db)
+        self.reads = {}
+        self._id = None
+
+    def _clean_up(self):
+        self.operations = []
+        self.reads = {}
+        self._id = None
+
+    def _begin(self, retry_id=None):
+        self._id = b"fake-transaction"
+
+    def _commit(self):
+        if self.db.before_commit:
+            self.db.before_commit()
+        if any(self.db.data.get(path) != data for path, data in self.reads.items()):
+            raise Aborted("Document changed during the transaction")
+        self.commit()
+        self._clean_up()
+
+    def _rollback(self):
+        self._clean_up()
+
+
+class FakeFirestore:
+    """Dict-backed stand-in for the parts of the Firestore client the saver and job queue use"""
+
+    def __init__(self):
+        self.data = {}
+        # Called before each transaction commit, to simulate a concurrent writer
+        self.before_commit = None
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+
+class CountingState(TypedDict):
+    steps: list
+
+
+def build_graph(calls: dict, fail_on: str = None):
+    def make_node(name):
+        def node(state: CountingState):
+            calls[name] = calls.get(name, 0) + 1
+            if name == fail_on:
+                raise RuntimeError(f"{name} interrupted")
+            return {"steps": state["steps"] + [name]}
+        return node
+
+    workflow = StateGraph(CountingState)
+    for name in ("first", "second", "third"):
+        workflow.add_node(name, make_node(name))
+    workflow.add_edge(START, "first")
+    workflow.add_edge("first", "second")
+    workflow.add_edge("second", "third")
+    workflow.add_edge("third", END)
+    return workflow
+
+
+def test_resume_skips_completed_nodes():
+    checkpointer = MemorySaver()
+    calls = {}
+
+    with pytest.raises(RuntimeError):
+        app = build_graph(calls, fail_on="second").compile(checkpointer=checkpointer)
+        invoke_with_checkpoint(app, {"steps": []}, "doc-1")
+
+    app = build_graph(calls).compile(checkpointer=checkpointer)
+    final_state = invoke_with_checkpoint(app, {"steps": []}, "doc-1")
+
+    assert final_state["steps"] == ["first", "second", "third"]
+    assert calls == {"first": 1, "second": 2, "third": 1}
+
+
+def test_completed_thread_returns_saved_state():
+    checkpointer = MemorySaver()
+    calls = {}
+    app = build_graph(calls).compile(checkpointer=checkpointer)
+
+    invoke_with_checkpoint(app, {"steps": []}, "doc-2")
+    final_state = invoke_with_checkpoint(app, {"steps": []}, "doc-2")
+
+    assert final_state["steps"] == ["first", "second", "third"]
+    assert calls == {"first": 1, "second": 1, "third": 1}
+
+
+def test_firestore_saver_resumes_from_saved_checkpoint():
+    db = FakeFirestore()
+    calls = {}
+
+    with pytest.raises(RuntimeError):
+        app = build_graph(calls, fail_on="second").compile(checkpointer=FirestoreCheckpointSaver(db))
+        invoke_with_checkpoint(app, {"steps": []}, "doc-3")
+
+    # A fresh saver, as on another instance, picks up the stored progress
+    app = build_graph(calls).compile(checkpointer=FirestoreCheckpointSaver(db))
+    final_state = invoke_with_checkpoint(app, {"steps": []}, "doc-3")
+
+    assert final_state["steps"] == ["first", "second", "third"]
+    assert calls == {"first": 1, "second": 2, "third": 1}
+    saver = FirestoreCheckpointSaver(db)
+    history = list(saver.list({"configurable": {"thread_id": "doc-3"}}))
+    assert history[0].checkpoint["id"] == saver.get_tuple({"configurable": {"thread_id": "doc-3"}}).checkpoint["id"]
+
+
+def test_firestore_saver_deletes_threads_larger_than_one_batch():
+    db = FakeFirestore()
+    saver = FirestoreCheckpointSaver(db)
+    thread = db.collection("analysis_checkpoints").document("doc-4")
+    for i in range(700):
+        db.data[f"{thread.path}/writes/w{i}"] = {"checkpoint_key": "k"}
+    app = build_graph({}).compile(checkpointer=saver)
+    invoke_with_checkpoint(app, {"steps": []}, "doc-4")
+    invoke_with_checkpoint(app, {"steps": []}, "other")
+
+    saver.delete_thread("doc-4")
+
+    assert not any(path.startswith(thread.path) for path in db.data)
+    assert saver.get_tuple({"configurable": {"thread_id": "other"}}) is not None
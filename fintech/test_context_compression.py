@@ -0,0 +1,40 @@
+from langchain_core.documents import Document
+from context_compression import compress_documents, compress_text
+from context_packer import pack_context
+
+QUERY = "Identify AAPL risk factors, volatility patterns, and potential market threats"
+ARTICLE = (
+    "Apple shares slip ahead of earnings. "
+    "The company unveiled a new colour for its phone cases at an event in Cupertino. "
+    "Analysts flagged rising volatility in options markets ahead of the report. "
+    "Attendees praised the catering and the keynote stage design. "
+    "Regulatory risk in the EU remains a threat to App Store margins. "
+    "The weather on the day was sunny and mild across the region."
+)
+
+
+def test_keeps_headline_and_query_relevant_sentences():
+    compressed = compress_text(ARTICLE, QUERY)
+
+    assert compressed.startswith("Apple shares slip ahead of earnings.")
+    assert "volatility in options markets" in compressed
+    assert "Regulatory risk in the EU" in compressed
+    assert "catering" not in compressed
+    assert "weather" not in compressed
+
+
+def test_sentences_with_figures_are_kept():
+    text = ARTICLE + " Revenue was 94.8 billion dollars for the period."
+    assert "94.8 billion" in compress_text(text, QUERY)
+
+
+def test_short_documents_are_unchanged():
+    assert compress_text("Apple shares slip. Catering was good. Weather was sunny.", QUERY) == \
+        "Apple shares slip. Catering was good. Weather was sunny."
+
+
+def test_packing_with_query_compresses_documents():
+    docs = [Document(page_content=ARTICLE, metadata={"source": "Reuters"})]
+    packed = pack_context(docs, query=QUERY)
+    assert packed[0].page_content == compress_documents(docs, QUERY)[0].page_content
+    assert len(packed[0].page_content) < len(ARTICLE)
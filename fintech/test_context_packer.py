@@ -0,0 +1,45 @@
+import pytest
+from langchain_core.documents import Document
+from context_packer import count_tokens, drop_near_duplicates, merge_adjacent_chunks, pack_context
+
+NEWS = (
+    "Apple reported record services revenue for the quarter, driven by growth in subscriptions "
+    "and the App Store, while iPhone sales were flat compared with the same period last year."
+)
+
+
+def doc(text, source="Reuters"):
+    return Document(page_content=text, metadata={"source": source, "date": "20240301", "type": "market_news"})
+
+
+def test_syndicated_copies_are_dropped():
+    docs = [doc(NEWS), doc(NEWS + " (syndicated)", source="Yahoo"), doc("Tesla deliveries fell.")]
+    kept = drop_near_duplicates(docs)
+    assert [d.metadata["source"] for d in kept] == ["Reuters", "Reuters"]
+    assert kept[1].page_content == "Tesla deliveries fell."
+
+
+def test_overlapping_chunks_of_one_source_are_merged():
+    first, second = NEWS[:120], NEWS[60:]
+    merged = merge_adjacent_chunks([doc(second), doc(first), doc(first, source="Other")])
+
+    assert len(merged) == 2
+    assert merged[0].page_content == NEWS
+    assert merged[1].metadata["source"] == "Other"
+
+
+def test_packing_respects_token_budget():
+    docs = [doc(f"Chunk {i}: " + " ".join(f"word{i}{j}" for j in range(200)), source=str(i)) for i in range(5)]
+    budget = 1000
+    packed = pack_context(docs, token_budget=budget)
+
+    assert 0 < len(packed) < len(docs)
+    total = sum(count_tokens(d.page_content) + count_tokens(
+        f"Source: {d.metadata['source']}\nDate: 20240301\nType: market_news\n") for d in packed)
+    assert total <= budget + 1
+    assert packed[0].page_content == docs[0].page_content
+
+
+def test_small_context_is_unchanged():
+    docs = [doc("Short note one.", source="a"), doc("Short note two.", source="b")]
+    assert pack_context(docs) == docs
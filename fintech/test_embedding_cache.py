@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+from embedding_cache import CachedEmbeddings, EmbeddingCache, cache_key
+
+@pytest.fixture
+def model():
+    embeddings = MagicMock()
+    embeddings.model = "text-embedding-test"
+    embeddings.embed_query.side_effect = lambda text: [float(len(text)), 0.5, 0.25]
+    return embeddings
+
+
+def test_repeat_queries_make_one_api_call(model):
+    cached = CachedEmbeddings(model, EmbeddingCache(persistent=False))
+
+    first = cached.embed_query("Market analysis for AAPL")
+    second = cached.embed_query("Market analysis for AAPL")
+
+    assert first == second == [24.0, 0.5, 0.25]
+    assert model.embed_query.call_count == 1
+
+
+def test_lru_evicts_least_recently_used():
+    cache = EmbeddingCache(max_size=2, persistent=False)
+    cache.put("m", "a", [1.0])
+    cache.put("m", "b", [2.0])
+    cache.get("m", "a")
+    cache.put("m", "c", [3.0])
+
+    assert cache.get("m", "b") is None
+    assert cache.get("m", "a") is not None
+
+
+def test_persistent_layer_stores_float32_bytes(model):
+    stored = {}
+    db = MagicMock()
+    collection = db.collection.return_value
+
+    def document(key):
+        ref = MagicMock()
+        ref.set.side_effect = lambda data: stored.__setitem__(key, data)
+        snapshot = MagicMock(exists=key in stored)
+        snapshot.to_dict.return_value = stored.get(key)
+        ref.get.return_value = snapshot
+        return ref
+
+    collection.document.side_effect = document
+
+    CachedEmbeddings(model, EmbeddingCache(db=db)).embed_query("query")
+    data = stored[cache_key("text-embedding-test", "query")]
+    assert data["dimensions"] == 3
+    assert data["embedding"] == np.array([5.0, 0.5, 0.25], dtype=np.float32).tobytes()
+
+    # A fresh instance (cold start) is answered from Firestore
+    assert CachedEmbeddings(model, EmbeddingCache(db=db)).embed_query("query") == [5.0, 0.5, 0.25]
+    assert model.embed_query.call_count == 1
+
+
+def test_models_do_not_share_entries():
+    cache = EmbeddingCache(persistent=False)
+    cache.put("model-a", "text", [1.0])
+    assert cache.get("model-b", "text") is None
@@ -0,0 +1,94 @@
+import threading
+import pytest
+from embedding_pipeline import embed_and_store, iter_chunks, token_batches
+from vector_store import InMemoryVectorStore
+
+
+class SentenceSplitter:
+    def split_text(self, text):
+        return [sentence.strip() for sentence in text.split(".") if sentence.strip()]
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self.lock:
+            self.calls.append(list(texts))
+        return [[1.0, float(len(text))] for text in texts]
+
+
+def chunks(count, words=10):
+    return [{"text": f"chunk {i} " + "word " * words, "type": "market_news", "ticker": "AAPL"} for i in range(count)]
+
+
+def test_iter_chunks_keeps_document_metadata():
+    documents = [{"text": "First part. Second part.", "ticker": "AAPL", "type": "company_info"}]
+    result = list(iter_chunks(documents, SentenceSplitter()))
+    assert [chunk["text"] for chunk in result] == ["First part", "Second part"]
+    assert all(chunk["ticker"] == "AAPL" and chunk["type"] == "company_info" for chunk in result)
+
+
+def test_token_batches_respect_token_and_input_limits():
+    batches = list(token_batches(chunks(10), max_tokens=30))
+    assert sum(len(batch) for batch in batches) == 10
+    assert all(len(batch) == 2 for batch in batches)
+
+    batches = list(token_batches(chunks(10), max_tokens=10_000, max_inputs=4))
+    assert [len(batch) for batch in batches] == [4, 4, 2]
+
+
+def test_embed_and_store_writes_new_chunks_in_batches():
+    store = InMemoryVectorStore()
+    embeddings = FakeEmbeddings()
+    store.add_documents(chunks(1), [[1.0, 0.0]])
+
+    stats = embed_and_store(iter(chunks(10)), embeddings, store, max_tokens=30, max_in_flight=2)
+
+    assert stats["chunks"] == 10
+    assert stats["written"] == 9
+    assert stats["batches"] == 5
+    assert sum(len(call) for call in embeddings.calls) == 9
+    assert len(store.list_documents()) == 10
+
+
+def test_embed_and_store_bounds_batches_in_flight():
+    store = InMemoryVectorStore()
+    in_flight = []
+    active = [0]
+    lock = threading.Lock()
+
+    class SlowEmbeddings(FakeEmbeddings):
+        def embed_documents(self, texts):
+            with lock:
+                active[0] += 1
+                in_flight.append(active[0])
+            try:
+                return super().embed_documents(texts)
+            finally:
+                with lock:
+                    active[0] -= 1
+
+    consumed = []
+
+    def generate():
+        for chunk in chunks(12):
+            consumed.append(chunk)
+            yield chunk
+
+    embed_and_store(generate(), SlowEmbeddings(), store, max_tokens=30, max_in_flight=2)
+    assert max(in_flight) <= 2
+    assert len(consumed) == 12
+
+
+def test_embed_and_store_raises_first_error():
+    store = InMemoryVectorStore()
+
+    class FailingEmbeddings(FakeEmbeddings):
+        def embed_documents(self, texts):
+            raise RuntimeError("rate limited")
+
+    with pytest.raises(RuntimeError, match="rate limited"):
+        embed_and_store(iter(chunks(4)), FailingEmbeddings(), store, max_tokens=30)
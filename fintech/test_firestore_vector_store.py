@@ -0,0 +1,76 @@
+import asyncio
+import importlib
+import sys
+import types
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+
+class FakeVectorQuery:
+    """Records a projected find_nearest query and returns only the projected fields, like Firestore"""
+
+    def __init__(self, documents):
+        self.documents = documents
+        self.fields = None
+        self.filters = []
+        self.nearest = None
+
+    def select(self, fields):
+        self.fields = list(fields)
+        return self
+
+    def where(self, field, op, value):
+        self.filters.append((field, op, value))
+        return self
+
+    def find_nearest(self, **kwargs):
+        self.nearest = kwargs
+        return self
+
+    def stream(self):
+        for doc_id, data, distance in self.documents:
+            data = {**data, self.nearest["distance_result_field"]: distance}
+            snapshot = MagicMock(id=doc_id)
+            snapshot.to_dict.return_value = {field: data[field] for field in self.fields if field in data}
+            yield snapshot
+
+
+@pytest.fixture
+def firestore_vector_store(monkeypatch):
+    for name in ("VECTOR_INDEX", "EMBEDDING_DIMENSIONS", "EMBEDDING_QUANTIZATION"):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setitem(sys.modules, "firebase.config", types.SimpleNamespace(db=MagicMock()))
+    monkeypatch.delitem(sys.modules, "firestore_vector_store", raising=False)
+    return importlib.import_module("firestore_vector_store")
+
+
+def test_search_projects_the_distance_field(firestore_vector_store):
+    store = firestore_vector_store.FirestoreVectorStore("financial_data", use_local_index=False)
+    query = FakeVectorQuery([
+        ("a", {"content": "Apple beat estimates", "metadata": {"ticker": "AAPL"}, "embedding": [1.0, 0.0]}, 0.12),
+    ])
+    store.collection = query
+
+    results = store.search([1.0, 0.0], limit=3, metadata_filters={"ticker": "AAPL"})
+
+    assert query.fields == ["content", "metadata", firestore_vector_store.DISTANCE_FIELD]
+    assert query.filters == [("metadata.ticker", "==", "AAPL")]
+    assert query.nearest["limit"] == 3
+    assert results == [{"id": "a", "content": "Apple beat estimates", "metadata": {"ticker": "AAPL"}, "distance": 0.12}]
+
+
+def test_async_search_many_closes_the_client_it_created(firestore_vector_store, monkeypatch):
+    async_vector_store = importlib.reload(importlib.import_module("async_vector_store"))
+    async_client = MagicMock()
+    async_client._firestore_api.transport.close = AsyncMock()
+    monkeypatch.setattr(async_vector_store, "create_async_client", lambda: async_client)
+    store = async_vector_store.AsyncFirestoreVectorStore(
+        firestore_vector_store.FirestoreVectorStore("financial_data", use_local_index=False)
+    )
+    store.search = AsyncMock(side_effect=RuntimeError("deadline exceeded"))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(store.search_many([{"query_embedding": [1.0, 0.0]}]))
+
+    async_client._firestore_api.transport.close.assert_awaited_once()
+    async_client.close.assert_called_once()
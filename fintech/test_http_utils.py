@@ -0,0 +1,32 @@
+import gzip
+from http_utils import choose_encoding, compress_body, etag_matches, make_etag
+
+def test_etag_changes_with_version():
+    etag = make_etag("doc-1", "2024-03-01T10:00:00")
+    assert etag == make_etag("doc-1", "2024-03-01T10:00:00")
+    assert etag != make_etag("doc-1", "2024-03-02T10:00:00")
+    assert etag != make_etag("doc-2", "2024-03-01T10:00:00")
+
+
+def test_if_none_match():
+    etag = make_etag("doc-1", "2024-03-01T10:00:00")
+    assert etag_matches(etag, etag)
+    assert etag_matches(f'"other", W/{etag}', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches(None, etag)
+    assert not etag_matches('"other"', etag)
+
+
+def test_large_bodies_are_gzipped():
+    body = b'{"analysis": "' + b"x" * 5000 + b'"}'
+
+    compressed, headers = compress_body(body, "gzip, deflate")
+
+    assert headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(compressed) == body
+
+
+def test_small_or_unaccepted_bodies_are_left_alone():
+    assert compress_body(b"{}", "gzip") == (b"{}", {"Vary": "Accept-Encoding"})
+    assert choose_encoding("identity") is None
+    assert choose_encoding("gzip;q=0") is None
@@ -0,0 +1,106 @@
+import threading
+import pytest
+from ingestion import IngestionCheckpoint, QuotaExhausted, RateLimiter, run_pipeline
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    return IngestionCheckpoint(str(tmp_path / "run.json"))
+
+
+def test_pipeline_runs_items_through_stages_once(checkpoint):
+    stages = [
+        ("fetch", lambda ticker: [ticker.lower()], 2),
+        ("write", lambda docs: {"written": len(docs)}, 1),
+    ]
+    summary = run_pipeline(["AAPL", "MSFT", "AAPL"], stages, checkpoint)
+
+    assert sorted(summary["completed"]) == ["AAPL", "MSFT"]
+    assert checkpoint.items["AAPL"]["status"] == "done"
+    assert checkpoint.items["AAPL"]["written"] == 1
+
+
+def test_rerun_skips_completed_and_retries_failed(tmp_path):
+    path = str(tmp_path / "run.json")
+    calls = []
+    broken = {"BAD"}
+
+    def fetch(ticker):
+        calls.append(ticker)
+        if ticker in broken:
+            raise ValueError("boom")
+        return ticker
+
+    summary = run_pipeline(["AAPL", "BAD"], [("fetch", fetch, 1)], IngestionCheckpoint(path))
+    assert summary["failed"] == {"BAD": "fetch: boom"}
+
+    calls.clear()
+    broken.clear()
+    summary = run_pipeline(["AAPL", "BAD"], [("fetch", fetch, 1)], IngestionCheckpoint(path))
+    assert calls == ["BAD"]
+    assert summary["skipped"] == ["AAPL"]
+    assert summary["completed"] == ["BAD"]
+
+
+def test_quota_exhausted_defers_remaining_items(checkpoint):
+    def fetch(ticker):
+        if ticker == "B":
+            raise QuotaExhausted("25 requests per day")
+        return ticker
+
+    summary = run_pipeline(["A", "B", "C", "D"], [("fetch", fetch, 1)], checkpoint, max_in_flight=1)
+
+    assert summary["completed"] == ["A"]
+    assert summary["pending"] == ["B", "C", "D"]
+    assert not checkpoint.completed("C")
+
+
+def test_stages_overlap_across_items(checkpoint):
+    # The write of the first item blocks until the second item has been fetched
+    second_fetched = threading.Event()
+
+    def fetch(ticker):
+        if ticker == "B":
+            second_fetched.set()
+        return ticker
+
+    def write(ticker):
+        if ticker == "A":
+            assert second_fetched.wait(timeout=5)
+        return {}
+
+    summary = run_pipeline(["A", "B"], [("fetch", fetch, 1), ("write", write, 2)], checkpoint)
+    assert sorted(summary["completed"]) == ["A", "B"]
+
+
+def test_rate_limiter_spaces_calls(monkeypatch):
+    now = [0.0]
+    sleeps = []
+    monkeypatch.setattr("ingestion.time.monotonic", lambda: now[0])
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr("ingestion.time.sleep", sleep)
+    limiter = RateLimiter(2, period_seconds=60)
+    for _ in range(3):
+        limiter.acquire()
+    assert sleeps == [60.0]
+
+
+def test_rate_limiter_backoff_holds_callers(monkeypatch):
+    now = [100.0]
+    sleeps = []
+    monkeypatch.setattr("ingestion.time.monotonic", lambda: now[0])
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    monkeypatch.setattr("ingestion.time.sleep", sleep)
+    limiter = RateLimiter(5, period_seconds=60)
+    limiter.acquire()
+    limiter.backoff(30)
+    limiter.acquire()
+    assert sleeps == [30.0]
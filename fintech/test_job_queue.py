@@ -0,0 +1,188 @@
+import pytest
+from datetime import timedelta
+from job_queue import (
+    FirestoreJobQueue, InMemoryJobQueue, COMPLETED, FAILED, LEASED, QUEUED,
+    became_queued, drain, execute_job, utc_now
+)
+from test_checkpointing import FakeFirestore
+
+@pytest.fixture
+def queue():
+    return InMemoryJobQueue(max_attempts=2)
+
+
+def test_enqueue_is_idempotent_while_active(queue):
+    assert queue.enqueue("doc-1", {"ticker": "AAPL"})
+    assert not queue.enqueue("doc-1", {"ticker": "AAPL"})
+    assert len(queue.jobs) == 1
+
+
+def test_leased_job_is_reclaimed_after_lease_expires(queue):
+    queue.enqueue("doc-1", {"ticker": "AAPL"})
+    job = queue.claim("worker-a")
+    assert job["status"] == LEASED
+    assert queue.claim("worker-b") is None
+
+    # Simulate worker-a dying without heartbeating
+    queue.jobs["doc-1"]["lease_expires_at"] = utc_now() - timedelta(seconds=1)
+    job = queue.claim("worker-b")
+    assert job["lease_owner"] == "worker-b"
+    assert job["attempts"] == 2
+    assert not queue.heartbeat("doc-1", "worker-a")
+    assert not queue.complete("doc-1", "worker-a")
+
+
+def test_failed_job_is_retried_until_max_attempts(queue):
+    queue.enqueue("doc-1", {"ticker": "AAPL"})
+
+    def handler(job):
+        raise RuntimeError("upstream timeout")
+
+    assert execute_job(queue, queue.claim("worker-a"), "worker-a", handler) == QUEUED
+    assert execute_job(queue, queue.claim("worker-a"), "worker-a", handler) == FAILED
+    assert queue.claim("worker-a") is None
+    assert queue.jobs["doc-1"]["last_error"] == "upstream timeout"
+
+    # A failed job can be queued again
+    assert queue.enqueue("doc-1", {"ticker": "AAPL"})
+
+
+def test_drain_runs_jobs_in_order(queue):
+    for doc_id in ("doc-1", "doc-2", "doc-3"):
+        queue.enqueue(doc_id, {"ticker": "AAPL"})
+    seen = []
+
+    executed = drain(queue, lambda job: seen.append(job["id"]), worker_id="worker-a", max_jobs=2)
+
+    assert executed == seen == ["doc-1", "doc-2"]
+    assert queue.jobs["doc-1"]["status"] == COMPLETED
+    assert queue.jobs["doc-3"]["status"] == QUEUED
+
+
+def test_lease_expiring_on_last_attempt_is_marked_failed(queue):
+    queue.enqueue("doc-1", {"ticker": "AAPL"})
+    for worker_id in ("worker-a", "worker-b"):
+        assert queue.claim(worker_id)["lease_owner"] == worker_id
+        queue.jobs["doc-1"]["lease_expires_at"] = utc_now() - timedelta(seconds=1)
+
+    # Out of attempts: not claimable, and failed by the sweep instead of staying leased
+    assert queue.claim("worker-c") is None
+    failed = queue.fail_dead_leases()
+    assert [job["id"] for job in failed] == ["doc-1"]
+    assert failed[0]["payload"] == {"ticker": "AAPL"}
+    assert queue.jobs["doc-1"]["status"] == FAILED
+    assert queue.fail_dead_leases() == []
+    assert queue.enqueue("doc-1", {"ticker": "AAPL"})
+
+
+def test_queued_jobs_are_claimed_before_expired_leases(queue):
+    queue.enqueue("doc-1", {"ticker": "AAPL"})
+    queue.claim("worker-a")
+    queue.jobs["doc-1"]["lease_expires_at"] = utc_now() - timedelta(seconds=1)
+    queue.enqueue("doc-2", {"ticker": "MSFT"})
+
+    assert queue.claim("worker-b")["id"] == "doc-2"
+    assert queue.claim("worker-b")["id"] == "doc-1"
+
+
+def test_only_transitions_into_queued_trigger_a_worker():
+    queued = {"status": QUEUED}
+    leased = {"status": LEASED}
+    assert became_queued(None, queued)
+    assert became_queued({"status": FAILED}, queued)
+    assert became_queued(leased, queued)
+    assert not became_queued(queued, leased)
+    assert not became_queued(leased, leased)  # heartbeat
+    assert not became_queued(queued, queued)
+    assert not became_queued(leased, None)
+
+
+def test_result_is_dropped_once_the_lease_is_lost(queue):
+    queue.enqueue("doc-1", {"ticker": "AAPL"})
+    stored = []
+
+    def handler(job):
+        # worker-b takes over while worker-a is still working
+        queue.jobs["doc-1"]["lease_expires_at"] = utc_now() - timedelta(seconds=1)
+        queue.claim("worker-b")
+        assert job["lease_lost"].wait(1)
+        if not job["lease_lost"].is_set():
+            stored.append(job["id"])
+
+    assert execute_job(queue, queue.claim("worker-a"), "worker-a", handler, lease_seconds=0.03) == LEASED
+    assert stored == []
+    assert queue.jobs["doc-1"]["lease_owner"] == "worker-b"
+    assert "lease_lost" not in queue.jobs["doc-1"]
+
+
+@pytest.fixture
+def firestore_queue():
+    return FirestoreJobQueue(db=FakeFirestore(), max_attempts=2)
+
+
+def test_firestore_claim_moves_on_when_a_concurrent_worker_wins(firestore_queue):
+    db = firestore_queue.db
+    firestore_queue.enqueue("doc-1", {"ticker": "AAPL"})
+    firestore_queue.enqueue("doc-2", {"ticker": "MSFT"})
+    contended = []
+
+    def worker_b_claims_first():
+        # worker-b's claim of doc-1 commits between worker-a's read and commit
+        if not contended:
+            contended.append(True)
+            job = db.data["analysis_jobs/doc-1"]
+            db.data["analysis_jobs/doc-1"] = {**job, "status": LEASED, "attempts": 1, "lease_owner": "worker-b",
+                                              "lease_expires_at": utc_now() + timedelta(seconds=60)}
+
+    db.before_commit = worker_b_claims_first
+    job = firestore_queue.claim("worker-a")
+
+    # The aborted transaction was retried, found doc-1 taken and moved on
+    assert job["id"] == "doc-2"
+    assert job["lease_owner"] == "worker-a"
+    assert db.data["analysis_jobs/doc-1"]["lease_owner"] == "worker-b"
+    assert db.data["analysis_jobs/doc-2"]["status"] == LEASED
+    assert firestore_queue.claim("worker-c") is None
+
+
+def test_firestore_claim_reclaims_expired_leases(firestore_queue):
+    db = firestore_queue.db
+    firestore_queue.enqueue("doc-1", {"ticker": "AAPL"})
+    firestore_queue.claim("worker-a")
+    db.data["analysis_jobs/doc-1"]["lease_expires_at"] = utc_now() - timedelta(seconds=1)
+
+    job = firestore_queue.claim("worker-b")
+
+    assert job["id"] == "doc-1"
+    assert job["attempts"] == 2
+    assert not firestore_queue.heartbeat("doc-1", "worker-a")
+    assert firestore_queue.heartbeat("doc-1", "worker-b")
+
+
+def test_firestore_fail_dead_leases_skips_jobs_renewed_meanwhile(firestore_queue):
+    db = firestore_queue.db
+    for doc_id in ("doc-1", "doc-2", "doc-3"):
+        firestore_queue.enqueue(doc_id, {"ticker": "AAPL"})
+        db.data[f"analysis_jobs/{doc_id}"].update({
+            "status": LEASED, "attempts": 2, "lease_owner": "worker-a",
+            "lease_expires_at": utc_now() - timedelta(seconds=1),
+        })
+    # doc-3 still has an attempt left, so it is reclaimable rather than dead
+    db.data["analysis_jobs/doc-3"]["attempts"] = 1
+
+    renewed = []
+
+    def worker_renews_doc_2():
+        # A heartbeat on doc-2 commits between the sweep's scan and its transaction
+        if not renewed:
+            renewed.append(True)
+            db.data["analysis_jobs/doc-2"]["lease_expires_at"] = utc_now() + timedelta(seconds=60)
+
+    db.before_commit = worker_renews_doc_2
+    failed = firestore_queue.fail_dead_leases()
+
+    assert [job["id"] for job in failed] == ["doc-1"]
+    assert failed[0]["payload"] == {"ticker": "AAPL"}
+    assert db.data["analysis_jobs/doc-1"]["status"] == FAILED
+    assert db.data["analysis_jobs/doc-2"]["status"] == LEASED
+    assert db.data["analysis_jobs/doc-3"]["status"] == LEASED
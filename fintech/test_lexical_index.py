@@ -0,0 +1,85 @@
+import threading
+import pytest
+from unittest.mock import MagicMock
+from lexical_index import LexicalIndex, reciprocal_rank_fusion, term_frequencies
+
+DOCS = {
+    "liquidity": ("AAPL liquidity remains strong with record cash reserves.", {"ticker": "AAPL", "type": "market_news", "date": "20240301"}),
+    "regulatory": ("New regulatory disclosure rules for technology companies.", {"ticker": "AAPL", "type": "regulatory", "date": "20240215"}),
+    "tsla": ("TSLA liquidity tightened after heavy capital spending.", {"ticker": "TSLA", "type": "market_news", "date": "20240301"}),
+}
+
+
+@pytest.fixture
+def index():
+    snapshots = []
+    for i, (doc_id, (content, metadata)) in enumerate(DOCS.items()):
+        snapshot = MagicMock(id=doc_id)
+        snapshot.to_dict.return_value = {
+            "content": content,
+            "metadata": metadata,
+            "terms": term_frequencies(content),
+            "timestamp": i
+        }
+        snapshots.append(snapshot)
+    collection = MagicMock()
+    collection.select.return_value.stream.return_value = snapshots
+    index = LexicalIndex(collection)
+    index.load()
+    return index
+
+
+def test_exact_terms_rank_matching_chunks(index):
+    results = index.search("AAPL liquidity risk")
+    assert [r["id"] for r in results] == ["liquidity", "tsla"]
+    assert results[0]["score"] > results[1]["score"]
+
+
+def test_filters_restrict_candidates(index):
+    results = index.search("liquidity", metadata_filters={"ticker": "TSLA"})
+    assert [r["id"] for r in results] == ["tsla"]
+    assert index.search("liquidity", date_range=("20240101", "20240220")) == []
+
+
+def test_removed_documents_leave_the_index(index):
+    index.remove("liquidity")
+    assert [r["id"] for r in index.search("liquidity")] == ["tsla"]
+    assert "record" not in index.postings
+    assert len(index) == 2
+
+
+def test_documents_without_stored_terms_are_tokenized(index):
+    index.upsert("new", "Regulatory fines announced", {"type": "regulatory"})
+    assert index.search("fines")[0]["id"] == "new"
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    vector = [{"id": "a"}, {"id": "b"}, {"id": "c"}]
+    lexical = [{"id": "c"}, {"id": "d"}]
+    fused = reciprocal_rank_fusion([vector, lexical], limit=3)
+    assert [r["id"] for r in fused] == ["c", "a", "b"]
+    assert fused[0]["rrf_score"] == pytest.approx(1 / 63 + 1 / 61)
+
+
+def test_reload_keeps_serving_and_replays_concurrent_changes(index):
+    loading = threading.Event()
+    release = threading.Event()
+    snapshots = list(index.collection.select.return_value.stream.return_value)
+
+    def slow_stream():
+        loading.set()
+        release.wait(5)
+        return iter(snapshots)
+
+    index.collection.select.return_value.stream.side_effect = slow_stream
+    index.warm()
+    assert loading.wait(5)
+
+    # Searches use the current postings while the reload reads the collection
+    assert [r["id"] for r in index.search("liquidity", metadata_filters={"ticker": "TSLA"})] == ["tsla"]
+    index.remove("tsla")
+    index.upsert("new", "Liquidity outlook upgraded", {"ticker": "MSFT"})
+    release.set()
+    index._loader.join(5)
+
+    assert sorted(index.documents) == ["liquidity", "new", "regulatory"]
@@ -0,0 +1,153 @@
+import threading
+import pytest
+from unittest.mock import MagicMock
+from local_index import LocalVectorIndex
+
+def make_snapshot(doc_id, embedding, doc_type, timestamp):
+    snapshot = MagicMock(id=doc_id)
+    snapshot.to_dict.return_value = {
+        "content": f"content {doc_id}",
+        "embedding": embedding,
+        "metadata": {"source": "test", "type": doc_type},
+        "timestamp": timestamp
+    }
+    return snapshot
+
+
+@pytest.fixture
+def collection():
+    collection = MagicMock()
+    collection.stream.return_value = [
+        make_snapshot("news-1", [1.0, 0.0], "market_news", 1),
+        make_snapshot("news-2", [0.6, 0.8], "market_news", 2),
+        make_snapshot("reg-1", [1.0, 0.1], "regulatory", 3),
+    ]
+    return collection
+
+
+def test_search_orders_by_cosine_distance(collection):
+    index = LocalVectorIndex(collection)
+    index.load()
+
+    results = index.search([2.0, 0.0], limit=2)
+    assert [r["id"] for r in results] == ["news-1", "reg-1"]
+    assert results[0]["distance"] == pytest.approx(0.0, abs=1e-6)
+    assert results[0]["content"] == "content news-1"
+
+
+def test_metadata_filters_apply_before_top_k(collection):
+    index = LocalVectorIndex(collection)
+    index.load()
+
+    results = index.search([1.0, 0.0], limit=5, metadata_filters={"type": "market_news"})
+    assert [r["id"] for r in results] == ["news-1", "news-2"]
+    assert index.search([1.0, 0.0], metadata_filters={"type": "unknown"}) == []
+
+    thresholded = index.search([1.0, 0.0], distance_threshold=0.1, metadata_filters={"type": "market_news"})
+    assert [r["id"] for r in thresholded] == ["news-1"]
+
+
+def test_incremental_sync_and_removal(collection):
+    index = LocalVectorIndex(collection)
+    index.load()
+
+    query = collection.where.return_value.order_by.return_value
+    query.stream.return_value = [make_snapshot("news-3", [0.0, 1.0], "market_news", 4)]
+    assert index.sync() == 1
+    collection.where.assert_called_with("timestamp", ">", 3)
+    assert index.last_timestamp == 4
+    assert len(index) == 4
+
+    assert index.search([0.0, 1.0], limit=1)[0]["id"] == "news-3"
+    index.remove("news-3")
+    assert index.search([0.0, 1.0], limit=1)[0]["id"] == "news-2"
+    assert len(index) == 3
+
+
+def test_index_grows_past_initial_capacity():
+    collection = MagicMock()
+    collection.stream.return_value = [
+        make_snapshot(f"doc-{i}", [float(i), 1.0], "market_news", i) for i in range(1500)
+    ]
+    index = LocalVectorIndex(collection)
+    index.load()
+
+    assert len(index) == 1500
+    assert len(index.search([1.0, 0.0], limit=3, metadata_filters={"type": "market_news"})) == 3
+
+
+def test_ticker_and_date_range_filters():
+    collection = MagicMock()
+    snapshots = []
+    for doc_id, ticker, date in [("aapl-old", "AAPL", "20240101"), ("aapl-new", "AAPL", "20240315"), ("tsla-new", "TSLA", "20240315")]:
+        snapshot = make_snapshot(doc_id, [1.0, 0.0], "market_news", 1)
+        snapshot.to_dict.return_value["metadata"].update({"ticker": ticker, "date": date})
+        snapshots.append(snapshot)
+    collection.stream.return_value = snapshots
+    index = LocalVectorIndex(collection)
+    index.load()
+
+    results = index.search([1.0, 0.0], metadata_filters={"ticker": "AAPL"}, date_range=("20240301", None))
+    assert [r["id"] for r in results] == ["aapl-new"]
+
+
+def test_compact_drops_removed_rows(collection):
+    index = LocalVectorIndex(collection)
+    index.load()
+    index.remove("news-1")
+    assert index.dead_rows == 1
+
+    index.compact()
+    assert index.dead_rows == 0
+    assert index.size == 2
+    results = index.search([1.0, 0.0], metadata_filters={"type": "market_news"})
+    assert [r["id"] for r in results] == ["news-2"]
+
+
+def test_sync_reads_only_missing_documents_sharing_the_last_timestamp():
+    collection = MagicMock()
+    batch = [make_snapshot(f"doc-{i}", [1.0, float(i)], "market_news", 7) for i in range(500)]
+    collection.stream.return_value = batch
+    index = LocalVectorIndex(collection)
+    index.load()
+
+    # A document committed in the same instant as the batch, but after the load read it
+    late = make_snapshot("late", [0.0, 1.0], "market_news", 7)
+    ties = [MagicMock(id=snapshot.id) for snapshot in batch + [late]]
+    collection.where.return_value.select.return_value.stream.side_effect = lambda: iter(ties)
+    collection.where.return_value.order_by.return_value.stream.side_effect = lambda: iter([])
+    collection.document.return_value.get.return_value = late
+
+    assert index.sync() == 1
+    collection.document.assert_called_once_with("late")
+    for _ in range(10):
+        assert index.sync() == 0
+    assert len(index) == 501
+    assert index.dead_rows == 0
+
+
+def test_reload_keeps_serving_and_replays_concurrent_changes(collection):
+    index = LocalVectorIndex(collection)
+    index.load()
+    loading = threading.Event()
+    release = threading.Event()
+    snapshots = list(collection.stream.return_value)
+
+    def slow_stream():
+        loading.set()
+        release.wait(5)
+        return iter(snapshots)
+
+    collection.stream.side_effect = slow_stream
+    index.warm()
+    assert loading.wait(5)
+
+    # Searches use the current rows while the reload reads the collection
+    assert index.search([1.0, 0.0], limit=1)[0]["id"] == "news-1"
+    index.remove("news-1")
+    index.upsert("news-3", [0.0, 1.0], "content news-3", {"type": "market_news"})
+    release.set()
+    index._loader.join(5)
+
+    assert sorted(index.rows) == ["news-2", "news-3", "reg-1"]
+    assert index.search([0.0, 1.0], limit=1)[0]["id"] == "news-3"
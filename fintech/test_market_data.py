@@ -0,0 +1,113 @@
+import threading
+import time
+import pytest
+from unittest.mock import MagicMock
+from ingestion import QuotaExhausted
+from market_data import AlphaVantageError, AlphaVantageThrottled, MarketDataClient
+
+OVERVIEW = {
+    "Symbol": "AAPL", "Name": "Apple Inc", "Sector": "TECHNOLOGY", "MarketCapitalization": "3000000000000",
+    "PERatio": "31.5", "DividendYield": "None", "FullTimeEmployees": "161000"
+}
+DAILY = {"Time Series (Daily)": {
+    "2024-06-03": {"1. open": "192.9", "2. high": "194.9", "3. low": "192.2", "4. close": "194.0", "5. volume": "50080500"},
+    "2024-05-31": {"1. open": "191.4", "2. high": "192.5", "3. low": "189.1", "4. close": "192.2", "5. volume": "75158300"},
+}}
+
+
+def make_client(responses, **kwargs):
+    session = MagicMock()
+
+    def get(url, params, timeout):
+        response = MagicMock()
+        response.json.return_value = responses[params["function"]]
+        return response
+
+    session.get.side_effect = get
+    return MarketDataClient(api_key="test", session=session, calls_per_minute=100, **kwargs), session
+
+
+def test_responses_are_parsed_into_typed_results():
+    client, _ = make_client({"OVERVIEW": OVERVIEW, "TIME_SERIES_DAILY": DAILY})
+
+    overview = client.get_company_overview("aapl")
+    assert overview["market_cap"] == 3e12
+    assert overview["pe_ratio"] == 31.5
+    assert overview["dividend_yield"] is None
+    assert overview["full_time_employees"] == 161000
+
+    bars = client.get_daily_series("AAPL")
+    assert [bar["date"] for bar in bars] == ["2024-05-31", "2024-06-03"]
+    assert bars[-1]["close"] == 194.0
+
+
+def test_repeat_lookups_are_served_from_cache():
+    client, session = make_client({"OVERVIEW": OVERVIEW})
+
+    assert client.get_company_overview("AAPL") == client.get_company_overview("aapl")
+    assert session.get.call_count == 1
+    assert client.quota_status()["calls"] == 1
+
+
+def test_concurrent_lookups_make_one_request():
+    client, session = make_client({"OVERVIEW": OVERVIEW})
+    original = session.get.side_effect
+
+    def slow_get(*args, **kwargs):
+        time.sleep(0.05)
+        return original(*args, **kwargs)
+
+    session.get.side_effect = slow_get
+    threads = [threading.Thread(target=client.get_company_overview, args=("AAPL",)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert session.get.call_count == 1
+
+
+def test_daily_quota_is_enforced():
+    client, session = make_client({"OVERVIEW": OVERVIEW}, daily_quota=1)
+    client.get_company_overview("AAPL")
+
+    with pytest.raises(QuotaExhausted):
+        client.get_company_overview("MSFT")
+    assert session.get.call_count == 1
+    assert client.quota_status()["remaining"] == 0
+
+
+def test_rate_limit_message_exhausts_quota_and_errors_raise():
+    client, _ = make_client({"OVERVIEW": {"Information": "Our standard API rate limit is 25 requests per day."}}, daily_quota=10)
+
+    with pytest.raises(QuotaExhausted):
+        client.get_company_overview("AAPL")
+    assert client.quota_status()["remaining"] == 0
+
+    client, _ = make_client({"TIME_SERIES_DAILY": {"Error Message": "Invalid API call."}})
+    with pytest.raises(AlphaVantageError):
+        client.get_daily_series("NOPE")
+
+
+def test_per_minute_note_backs_off_without_using_up_quota():
+    note = "Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute and 500 calls per day."
+    responses = {"OVERVIEW": {"Note": note}}
+    client, session = make_client(responses, daily_quota=10)
+
+    with pytest.raises(AlphaVantageThrottled):
+        client.get_company_overview("AAPL")
+    assert client.quota_status()["remaining"] == 9
+    assert client.limiter._paused_until > time.monotonic()
+
+    # Throttled responses aren't cached, so the retry reaches the API
+    client.limiter._paused_until = 0.0
+    responses["OVERVIEW"] = OVERVIEW
+    assert client.get_company_overview("AAPL")["name"] == "Apple Inc"
+    assert session.get.call_count == 2
+
+
+def test_other_information_messages_are_errors():
+    client, _ = make_client({"NEWS_SENTIMENT": {"Information": "This is a premium endpoint."}}, daily_quota=10)
+
+    with pytest.raises(AlphaVantageError):
+        client.get_news("AAPL")
+    assert client.quota_status()["remaining"] == 9
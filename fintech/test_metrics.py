@@ -0,0 +1,53 @@
+import pytest
+from metrics import MetricsRegistry
+
+
+@pytest.fixture
+def registry():
+    return MetricsRegistry()
+
+
+def test_counter_renders_per_label_set(registry):
+    requests = registry.counter("http_requests_total", "HTTP requests")
+    requests.inc(endpoint="analyze", status=200)
+    requests.inc(endpoint="analyze", status=200)
+    requests.inc(endpoint="analyze", status=401)
+
+    text = registry.render_prometheus()
+    assert "# TYPE http_requests_total counter" in text
+    assert 'http_requests_total{endpoint="analyze",status="200"} 2' in text
+    assert 'http_requests_total{endpoint="analyze",status="401"} 1' in text
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    latency = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+
+    text = registry.render_prometheus()
+    assert 'latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "latency_seconds_count 3" in text
+    assert latency.count() == 3
+
+
+def test_collectors_refresh_gauges_and_failures_are_ignored(registry):
+    depth = registry.gauge("queue_depth", "Queue depth")
+    registry.add_collector(lambda: depth.set(7))
+    registry.add_collector(lambda: 1 / 0)
+
+    assert "queue_depth 7" in registry.render_prometheus()
+    assert registry.snapshot()["queue_depth"] == {"{}": 7}
+
+
+def test_label_values_are_escaped(registry):
+    registry.counter("errors_total", "Errors").inc(reason='bad "quote"\n')
+    assert 'errors_total{reason="bad \\"quote\\"\\n"} 1' in registry.render_prometheus()
+
+
+def test_metric_kind_conflict(registry):
+    registry.counter("jobs", "Jobs")
+    with pytest.raises(ValueError):
+        registry.gauge("jobs", "Jobs")
@@ -0,0 +1,122 @@
+import pytest
+from unittest.mock import MagicMock, patch
+import populate_rag
+from market_data import MarketDataClient
+from vector_store import InMemoryVectorStore
+
+
+class FakeEmbeddings:
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[1.0, float(i)] for i in range(len(texts))]
+
+
+class WholeTextSplitter:
+    def split_text(self, text):
+        return [text]
+
+
+class LineSplitter:
+    def split_text(self, text):
+        return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def news_feed(*items):
+    return {"feed": [{"title": title, "summary": "summary", "time_published": published} for title, published in items]}
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.data
+
+
+@pytest.fixture
+def alpha_vantage():
+    responses = {"NEWS_SENTIMENT": [], "OVERVIEW": {"Name": "Apple", "Sector": "Technology"}}
+    requests = []
+
+    def get(url, params, timeout):
+        requests.append(params)
+        if params["function"] == "NEWS_SENTIMENT":
+            return FakeResponse(responses["NEWS_SENTIMENT"].pop(0))
+        return FakeResponse(responses["OVERVIEW"])
+
+    session = MagicMock()
+    session.get.side_effect = get
+    client = MarketDataClient(api_key="test", session=session, calls_per_minute=100)
+    with patch.object(populate_rag, "get_market_data_client", return_value=client):
+        yield responses, requests
+
+
+def ingest(store, embeddings, ticker="AAPL"):
+    return populate_rag.store_documents(store, embeddings, WholeTextSplitter(), populate_rag.fetch_ticker(store, ticker))
+
+
+def test_news_is_fetched_incrementally_from_watermark(alpha_vantage):
+    responses, requests = alpha_vantage
+    store = InMemoryVectorStore()
+    embeddings = FakeEmbeddings()
+    responses["NEWS_SENTIMENT"] = [
+        news_feed(("Older story", "20240601T090000"), ("Latest story", "20240602T143000")),
+        news_feed(("Latest story", "20240602T143000"), ("Breaking story", "20240603T080000")),
+    ]
+
+    stats = ingest(store, embeddings)
+    assert "time_from" not in requests[0]
+    assert stats["news_watermark"] == "20240602T143000"
+    assert store.get_watermark("news_AAPL") == "20240602T143000"
+
+    embeddings.texts.clear()
+    stats = ingest(store, embeddings)
+    assert requests[2]["time_from"] == "20240602T1430"
+    assert embeddings.texts == ["Breaking story\n\nsummary"]
+    assert store.get_watermark("news_AAPL") == "20240603T080000"
+
+
+def test_watermark_is_kept_when_no_new_news(alpha_vantage):
+    responses, _ = alpha_vantage
+    store = InMemoryVectorStore()
+    store.set_watermark("news_AAPL", "20240602T143000")
+    responses["NEWS_SENTIMENT"] = [news_feed()]
+
+    stats = ingest(store, FakeEmbeddings())
+    assert stats["news_watermark"] == "20240602T143000"
+
+
+def test_watermark_is_not_advanced_when_write_fails(alpha_vantage):
+    responses, _ = alpha_vantage
+    store = InMemoryVectorStore()
+    responses["NEWS_SENTIMENT"] = [news_feed(("Story", "20240602T143000"))]
+    with patch.object(store, "add_documents", side_effect=RuntimeError("unavailable")):
+        with pytest.raises(RuntimeError):
+            ingest(store, FakeEmbeddings())
+    assert store.get_watermark("news_AAPL") is None
+
+
+def test_overview_reingest_keeps_unchanged_chunks_and_drops_replaced_ones():
+    store = InMemoryVectorStore()
+    embeddings = FakeEmbeddings()
+
+    def overview_batch(beta, date):
+        text = f"Name: Apple\nSector: Technology\nBeta: {beta}"
+        document = {"text": text, "type": "company_info", "ticker": "AAPL", "date": date}
+        return {"ticker": "AAPL", "documents": [document], "fetched": 1, "news_watermark": None}
+
+    populate_rag.store_documents(store, embeddings, LineSplitter(), overview_batch("1.20", "20240601"))
+    embeddings.texts.clear()
+    populate_rag.store_documents(store, embeddings, LineSplitter(), overview_batch("1.25", "20240602"))
+
+    # Only the changed chunk is re-embedded; the unchanged ones keep their first date but are still current
+    assert embeddings.texts == ["Beta: 1.25"]
+    remaining = store.list_documents({"type": "company_info"})
+    assert sorted(doc["metadata"]["date"] for doc in remaining) == ["20240601", "20240601", "20240602"]
+    assert {r["content"] for r in store.search([1.0, 0.0], limit=10)} == {"Name: Apple", "Sector: Technology", "Beta: 1.25"}
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+from quantization import dequantize, quantize, rescore, truncate_embedding
+
+@pytest.fixture
+def embedding():
+    return np.random.default_rng(0).normal(size=1536).astype(np.float32)
+
+
+@pytest.mark.parametrize("dtype, size", [("float16", 1536 * 2), ("int8", 1536)])
+def test_quantization_round_trip(embedding, dtype, size):
+    data, encoding = quantize(embedding, dtype)
+    restored = dequantize(data, encoding)
+
+    assert len(data) == size
+    cosine = restored @ embedding / (np.linalg.norm(restored) * np.linalg.norm(embedding))
+    assert cosine > 0.999
+
+
+def test_truncation_renormalizes(embedding):
+    truncated = truncate_embedding(embedding, 256)
+    assert truncated.shape == (256,)
+    assert np.linalg.norm(truncated) == pytest.approx(1.0, abs=1e-5)
+    assert truncate_embedding(embedding, None).shape == (1536,)
+
+
+def test_rescore_reorders_by_full_embedding(embedding):
+    near, near_encoding = quantize(embedding + 0.1, "int8")
+    far, far_encoding = quantize(-embedding, "int8")
+    candidates = [
+        {"id": "far", "distance": 0.1, "embedding_full": far, "embedding_encoding": far_encoding},
+        {"id": "near", "distance": 0.2, "embedding_full": near, "embedding_encoding": near_encoding},
+        {"id": "unencoded", "distance": 0.5},
+    ]
+
+    results = rescore(embedding, candidates, limit=2, distance_threshold=1.0)
+    assert [r["id"] for r in results] == ["near", "unencoded"]
+    assert "embedding_full" not in results[0]
+
+
+def test_unknown_quantization_is_rejected(embedding):
+    with pytest.raises(ValueError):
+        quantize(embedding, "int4")
@@ -0,0 +1,48 @@
+import pytest
+import result_store
+from result_store import decode_section, encode_section, normalize, set_section, split_sections
+
+class RawOutput:
+    def __init__(self, raw):
+        self.raw = raw
+
+
+def test_normalize_parses_stringified_json_in_one_pass():
+    result = {
+        "quantitative_data": {"RSI": "55.20"},
+        "analysis": {
+            "trading_strategy": '{"trading_strategy": {"entry_points": [1, 2]}}',
+            "risk_assessment": RawOutput('{"risk_assessment": {"beta": 1.2}}'),
+            "notes": "{not json",
+        },
+    }
+
+    normalized = normalize(result)
+
+    assert normalized["quantitative_data"] == {"RSI": "55.20"}
+    assert normalized["analysis"]["trading_strategy"] == {"trading_strategy": {"entry_points": [1, 2]}}
+    assert normalized["analysis"]["risk_assessment"] == {"risk_assessment": {"beta": 1.2}}
+    assert normalized["analysis"]["notes"] == "{not json"
+
+
+def test_sections_round_trip():
+    result = {"quantitative_data": {"Beta": "1.1"}, "analysis": {"execution_plan": {"plan": "x"}}}
+    sections = split_sections(result)
+    assert sorted(sections) == ["analysis.execution_plan", "quantitative_data"]
+
+    rebuilt = {}
+    for name, value in sections.items():
+        set_section(rebuilt, name, value)
+    assert rebuilt == result
+
+
+def test_large_section_is_compressed_into_chunks(monkeypatch):
+    monkeypatch.setattr(result_store, "CHUNK_BYTES", 64)
+    section = {"rows": [f"row {i} with some text" for i in range(200)]}
+
+    chunks, size = encode_section(section)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= 64 for chunk in chunks)
+    assert sum(len(chunk) for chunk in chunks) < size
+    assert decode_section(chunks) == section
@@ -0,0 +1,67 @@
+from datetime import datetime
+from retention import apply_retention, expired_documents, prune_snapshot
+from vector_store import InMemoryVectorStore, LocalFileVectorStore, chunk_id
+
+NOW = datetime(2024, 6, 30)
+
+
+def news(text, date, ticker="AAPL"):
+    return {"text": text, "type": "market_news", "ticker": ticker, "date": date}
+
+
+def overview(text, date, ticker="AAPL"):
+    return {"text": text, "type": "company_info", "ticker": ticker, "date": date}
+
+
+def test_max_age_expires_documents_before_cutoff():
+    documents = [
+        {"id": "old", "metadata": {"date": "20240501T093000"}},
+        {"id": "recent", "metadata": {"date": "20240620T170000"}},
+        {"id": "undated", "metadata": {"date": "unknown"}},
+    ]
+    assert expired_documents(documents, {"max_age_days": 30}, NOW) == ["old"]
+
+
+def test_prune_snapshot_deletes_only_superseded_chunks_of_the_ticker():
+    store = InMemoryVectorStore()
+    documents = [
+        overview("name: Apple", "20240601"),
+        overview("beta: 1.20", "20240601"),
+        overview("beta: 1.25", "20240628"),
+        overview("name: Microsoft", "20240101", ticker="MSFT"),
+    ]
+    store.add_documents(documents, [[1.0, float(i)] for i in range(len(documents))])
+
+    current = [chunk_id(documents[0]), chunk_id(documents[2])]
+    assert prune_snapshot(store, "company_info", "aapl", current) == 1
+    remaining = {doc["id"] for doc in store.list_documents()}
+    assert remaining == set(current) | {chunk_id(documents[3])}
+
+
+def test_apply_retention_deletes_expired_documents():
+    store = InMemoryVectorStore()
+    documents = [
+        news("stale headline", "20240301T120000"),
+        news("fresh headline", "20240625T120000"),
+        overview("overview v1", "20240601"),
+        overview("overview v2", "20240628"),
+        {"text": "filing rules", "type": "regulatory", "date": "20200101"},
+    ]
+    store.add_documents(documents, [[1.0, float(i)] for i in range(len(documents))])
+
+    deleted = apply_retention(store, now=NOW)
+
+    # Overviews are snapshots, pruned at ingestion rather than by age
+    assert deleted == {"market_news": 1}
+    remaining = {doc["id"] for doc in store.list_documents()}
+    assert remaining == {chunk_id(doc) for doc in documents[1:]}
+    assert len(store.search([1.0, 0.0], limit=10)) == 4
+
+
+def test_apply_retention_compacts_local_store(tmp_path):
+    store = LocalFileVectorStore(str(tmp_path / "store"))
+    store.add_documents([news("stale headline", "20240301T120000"), news("fresh headline", "20240625T120000")], [[1.0, 0.0], [0.0, 1.0]])
+
+    assert apply_retention(store, now=NOW) == {"market_news": 1}
+    assert store.rows == 1
+    assert store.tombstones == 0
@@ -0,0 +1,31 @@
+from retrieval_cache import RetrievalCache, retrieval_key
+
+def test_key_covers_query_filters_limit_and_version():
+    key = retrieval_key("AAPL risk", 3, filters={"ticker": "AAPL"}, limit=5)
+
+    assert key == retrieval_key("AAPL risk", 3, limit=5, filters={"ticker": "AAPL"})
+    assert key != retrieval_key("AAPL risk", 4, filters={"ticker": "AAPL"}, limit=5)
+    assert key != retrieval_key("AAPL risk", 3, filters={"ticker": "TSLA"}, limit=5)
+    assert key != retrieval_key("AAPL risk", 3, filters={"ticker": "AAPL"}, limit=10)
+    assert key != retrieval_key("AAPL trends", 3, filters={"ticker": "AAPL"}, limit=5)
+
+
+def test_version_bump_invalidates_entries():
+    cache = RetrievalCache()
+    cache.put(retrieval_key("query", 1), [{"id": "old"}])
+
+    assert cache.get(retrieval_key("query", 1)) == [{"id": "old"}]
+    assert cache.get(retrieval_key("query", 2)) is None
+
+
+def test_empty_results_are_cached_and_lru_is_bounded():
+    cache = RetrievalCache(max_size=2)
+    cache.put("a", [])
+    cache.put("b", [{"id": "b"}])
+    cache.put("c", [{"id": "c"}])
+
+    assert cache.get("a") is None
+    assert cache.get("b") == [{"id": "b"}]
+    cache.put("d", [])
+    assert cache.get("d") == []
+    assert cache.get("c") is None
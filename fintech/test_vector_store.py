@@ -0,0 +1,129 @@
+import os
+import pytest
+from unittest.mock import patch
+from vector_store import InMemoryVectorStore, LocalFileVectorStore, chunk_id, get_vector_store
+
+DOCUMENTS = [
+    {"text": "Apple beat revenue estimates on strong iPhone sales", "type": "market_news", "ticker": "aapl", "date": "2024-05-01"},
+    {"text": "Microsoft cloud growth slowed in the quarter", "type": "market_news", "ticker": "MSFT", "date": "2024-04-25"},
+    {"text": "New disclosure rules for climate risk", "type": "regulatory", "date": "2024-03-01"},
+]
+EMBEDDINGS = [[1.0, 0.0], [0.6, 0.8], [0.0, 1.0]]
+
+
+@pytest.fixture(params=["memory", "local"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryVectorStore()
+    return LocalFileVectorStore(str(tmp_path / "store"))
+
+
+def test_search_applies_filters_and_orders_by_distance(store):
+    store.add_documents(DOCUMENTS, EMBEDDINGS)
+
+    results = store.search([1.0, 0.1], limit=2)
+    assert [r["content"] for r in results] == [DOCUMENTS[0]["text"], DOCUMENTS[1]["text"]]
+    assert results[0]["metadata"]["ticker"] == "AAPL"
+    assert "embedding_full" not in results[0]
+
+    results = store.search([1.0, 0.1], metadata_filters={"type": "regulatory"})
+    assert [r["id"] for r in results] == [chunk_id(DOCUMENTS[2])]
+
+    results = store.lexical_search("cloud growth", date_range=("2024-04-01", None))
+    assert [r["id"] for r in results] == [chunk_id(DOCUMENTS[1])]
+
+
+def test_new_documents_skips_stored_and_repeated_chunks(store):
+    store.add_documents(DOCUMENTS[:1], EMBEDDINGS[:1])
+
+    new = store.new_documents(DOCUMENTS + [dict(DOCUMENTS[1])])
+    assert new == DOCUMENTS[1:]
+
+
+def test_writes_bump_corpus_version(store):
+    version = store.corpus_version()
+    stats = store.add_documents(DOCUMENTS, EMBEDDINGS)
+    assert stats["documents"] == 3
+    assert store.corpus_version() > version
+
+    version = store.corpus_version()
+    store.delete_documents([chunk_id(DOCUMENTS[0])])
+    assert store.corpus_version() > version
+    assert len(store.search([1.0, 0.0])) == 2
+
+
+def test_local_store_reloads_from_disk(tmp_path):
+    path = str(tmp_path / "store")
+    store = LocalFileVectorStore(path)
+    store.add_documents(DOCUMENTS, EMBEDDINGS)
+    store.add_documents([DOCUMENTS[1]], [[0.0, 1.0]])
+    store.delete_documents([chunk_id(DOCUMENTS[2])])
+    store.set_watermark("news_AAPL", "20240501T120000")
+
+    reopened = LocalFileVectorStore(path)
+    assert reopened.corpus_version() == store.corpus_version()
+    assert reopened.get_watermark("news_AAPL") == "20240501T120000"
+    results = reopened.search([0.0, 1.0])
+    assert [r["id"] for r in results] == [chunk_id(DOCUMENTS[1]), chunk_id(DOCUMENTS[0])]
+    assert results[0]["distance"] == pytest.approx(0.0, abs=1e-6)
+
+    reopened.add_documents([DOCUMENTS[2]], [[0.0, 1.0]])
+    assert len(LocalFileVectorStore(path).search([0.0, 1.0])) == 3
+
+
+def test_local_store_compaction_drops_dead_rows(tmp_path):
+    path = str(tmp_path / "store")
+    store = LocalFileVectorStore(path)
+    store.add_documents(DOCUMENTS, EMBEDDINGS)
+    store.add_documents([DOCUMENTS[1]], [[0.0, 1.0]])
+    store.delete_documents([chunk_id(DOCUMENTS[2])])
+
+    # One replaced row, one deleted row and one tombstone
+    assert store.compact() == 3
+    assert store.compact() == 0
+    assert os.path.getsize(store.vectors_path) == 2 * 2 * 4
+    with open(store.documents_path) as f:
+        assert len(f.readlines()) == 2
+
+    reopened = LocalFileVectorStore(path)
+    results = reopened.search([0.0, 1.0])
+    assert [r["id"] for r in results] == [chunk_id(DOCUMENTS[1]), chunk_id(DOCUMENTS[0])]
+    assert results[0]["distance"] == pytest.approx(0.0, abs=1e-6)
+    assert reopened.lexical_search("cloud growth")[0]["id"] == chunk_id(DOCUMENTS[1])
+
+    reopened.add_documents([DOCUMENTS[2]], [[0.0, 1.0]])
+    assert len(LocalFileVectorStore(path).search([0.0, 1.0])) == 3
+
+
+def test_interrupted_compaction_is_finished_on_open(tmp_path):
+    path = str(tmp_path / "store")
+    store = LocalFileVectorStore(path)
+    store.add_documents(DOCUMENTS, EMBEDDINGS)
+    store.delete_documents([chunk_id(DOCUMENTS[0])])
+    real_replace = os.replace
+
+    def crash_before_documents(source, destination):
+        if destination == store.documents_path:
+            raise OSError("interrupted")
+        real_replace(source, destination)
+
+    with patch("vector_store.os.replace", side_effect=crash_before_documents):
+        with pytest.raises(OSError):
+            store.compact()
+
+    reopened = LocalFileVectorStore(path)
+    assert sorted(r["id"] for r in reopened.search([0.6, 0.8])) == sorted(chunk_id(doc) for doc in DOCUMENTS[1:])
+    assert reopened.compact() == 0
+
+
+def test_get_vector_store_selects_backend(monkeypatch, tmp_path):
+    monkeypatch.setenv("VECTOR_STORE_BACKEND", "local")
+    monkeypatch.setenv("VECTOR_STORE_PATH", str(tmp_path))
+    store = get_vector_store(collection_name="test_collection")
+    assert isinstance(store, LocalFileVectorStore)
+    assert store.path == str(tmp_path / "test_collection")
+    assert get_vector_store(collection_name="test_collection") is store
+
+    assert isinstance(get_vector_store("memory", collection_name="test_collection"), InMemoryVectorStore)
+    with pytest.raises(ValueError):
+        get_vector_store("pinecone")
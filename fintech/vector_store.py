@@ -0,0 +1,428 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from lexical_index import LexicalIndex, matches_filters, term_frequencies
+from local_index import LocalVectorIndex
+from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("firestore", "memory", "local")
+DEFAULT_COLLECTION = "financial_data"
+DEFAULT_LOCAL_PATH = ".vector_store"
+
+VECTOR_SEARCH_LATENCY = registry.histogram("vector_search_seconds", "Vector search latency by backend, including result streaming")
+
+
+def document_metadata(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Metadata stored with a chunk; ticker and sector are only set for ticker-specific documents"""
+    metadata = {
+        "source": doc.get("source", "unknown"),
+        "date": doc.get("date", "unknown"),
+        "type": doc.get("type", "unknown")
+    }
+    if doc.get("ticker"):
+        metadata["ticker"] = doc["ticker"].upper()
+    if doc.get("sector"):
+        metadata["sector"] = doc["sector"]
+    return metadata
+
+
+def chunk_id(doc: Dict[str, Any]) -> str:
+    """Content-hash document ID for a chunk
+
+    The ticker and type are part of the hash, so shared text (e.g. the
+    sample regulatory documents) is stored once per ticker it was fetched for.
+    """
+    key = "\n".join([(doc.get("ticker") or "").upper(), doc.get("type", "unknown"), doc.get("text", "")])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+
+def write_stats(documents: int, start: float) -> Dict[str, Any]:
+    seconds = time.perf_counter() - start
+    return {
+        "documents": documents,
+        "batches": 1 if documents else 0,
+        "retries": 0,
+        "seconds": seconds,
+        "docs_per_second": documents / seconds if seconds > 0 else 0.0
+    }
+
+
+class VectorStore(ABC):
+    """Interface implemented by every vector store backend
+
+    Documents are dicts with `text` and metadata fields (source, date, type,
+    ticker, sector); search results are dicts with id, content, metadata and
+    distance (or score, for lexical_search).
+    """
+
+    # Name used by get_vector_store and in metrics labels
+    backend = None
+    # Whether search() does network I/O worth overlapping (see RAGManager.prefetch_context)
+    concurrent_search = False
+
+    @abstractmethod
+    def new_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Filter out documents that are already stored (or repeated in the list)"""
+
+    @abstractmethod
+    def add_documents(self, documents: List[Dict[str, Any]], embeddings: List[List[float]]) -> Dict[str, Any]:
+        """Upsert documents with their embeddings and return write stats"""
+
+    @abstractmethod
+    def search(
+        self,
+        query_embedding: List[float],
+        limit: int = 10,
+        distance_threshold: float = None,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search for the nearest documents by cosine distance, filters applied first"""
+
+    @abstractmethod
+    def lexical_search(
+        self,
+        query: str,
+        limit: int = 10,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search for documents by BM25 keyword relevance"""
+
+    @abstractmethod
+    def list_documents(
+        self,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Dict[str, Any]]:
+        """List the id and metadata of every document matching the filters"""
+
+    @abstractmethod
+    def delete_documents(self, document_ids: List[str]) -> Dict[str, Any]:
+        """Delete documents by their IDs and return write stats"""
+
+    @abstractmethod
+    def corpus_version(self) -> int:
+        """Counter that changes whenever the stored documents change"""
+
+    @abstractmethod
+    def get_watermark(self, key: str) -> Optional[str]:
+        """Ingestion high-water mark stored with the documents, or None if never set"""
+
+    @abstractmethod
+    def set_watermark(self, key: str, value: str) -> None:
+        """Record an ingestion high-water mark"""
+
+    def warm(self) -> None:
+        """Start loading in-process search indexes in the background (no-op for stores without any)"""
+
+    def compact(self) -> int:
+        """Reclaim storage still held by deleted or replaced documents
+
+        Returns:
+            Number of stale entries dropped (0 for stores that reclaim storage as they go)
+        """
+        return 0
+
+
+class InMemoryVectorStore(VectorStore):
+    """Vector store held entirely in process memory
+
+    For tests, benchmarks and offline development; contents are lost when
+    the process exits.
+    """
+
+    backend = "memory"
+
+    def __init__(self):
+        self.index = LocalVectorIndex(collection=None)
+        self.lexical_index = LexicalIndex(collection=None)
+        self.version = 0
+        self.watermarks: Dict[str, str] = {}
+        self._lock = threading.RLock()
+
+    def new_documents(self, documents: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        unique = {}
+        for doc in documents:
+            unique.setdefault(chunk_id(doc), doc)
+        return [doc for doc_id, doc in unique.items() if doc_id not in self.index.rows]
+
+    def _upsert(self, doc_id: str, embedding, content: str, metadata: Dict[str, Any], terms: Dict[str, int]) -> None:
+        self.index.upsert(doc_id, embedding, content, metadata)
+        self.lexical_index.upsert(doc_id, content, metadata, terms)
+
+    def add_documents(self, documents: List[Dict[str, Any]], embeddings: List[List[float]]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        with self._lock:
+            for doc, embedding in zip(documents, embeddings):
+                text = doc.get("text", "")
+                self._upsert(chunk_id(doc), embedding, text, document_metadata(doc), term_frequencies(text))
+            self.version += 1
+        return write_stats(len(documents), start)
+
+    def search(
+        self,
+        query_embedding: List[float],
+        limit: int = 10,
+        distance_threshold: float = None,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Dict[str, Any]]:
+        with VECTOR_SEARCH_LATENCY.time(backend="local"):
+            results = self.index.search(query_embedding, limit, distance_threshold, metadata_filters, date_range)
+        for result in results:
+            result.pop("embedding_full", None)
+            result.pop("embedding_encoding", None)
+        return results
+
+    def lexical_search(
+        self,
+        query: str,
+        limit: int = 10,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Dict[str, Any]]:
+        with VECTOR_SEARCH_LATENCY.time(backend="lexical"):
+            return self.lexical_index.search(query, limit, metadata_filters, date_range)
+
+    def list_documents(
+        self,
+        metadata_filters: Dict[str, Any] = None,
+        date_range: Tuple[Optional[str], Optional[str]] = None
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"id": doc_id, "metadata": self.index.metadata[row]}
+                for doc_id, row in self.index.rows.items()
+                if matches_filters(self.index.metadata[row], metadata_filters, date_range)
+            ]
+
+    def delete_documents(self, document_ids: List[str]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        with self._lock:
+            for doc_id in document_ids:
+                self.index.remove(doc_id)
+                self.lexical_index.remove(doc_id)
+            # Nothing reloads this index, so reclaim removed rows once they outnumber live ones
+            if self.index.dead_rows > len(self.index):
+                self.index.compact()
+            self.version += 1
+        return write_stats(len(document_ids), start)
+
+    def corpus_version(self) -> int:
+        return self.version
+
+    def get_watermark(self, key: str) -> Optional[str]:
+        return self.watermarks.get(key)
+
+    def set_watermark(self, key: str, value: str) -> None:
+        self.watermarks[key] = value
+
+
+class LocalFileVectorStore(InMemoryVectorStore):
+    """Vector store persisted to a local directory
+
+    Embeddings are appended to `vectors.f32`, a raw float32 matrix that is
+    memory-mapped on load; `documents.jsonl` holds one record per matrix row
+    (id, content, metadata, terms) plus deletion tombstones. Later records
+    for an ID replace earlier ones, so both files only grow until compact()
+    rewrites them with the live documents. `meta.json` holds the dimensions,
+    corpus version and ingestion watermarks. Search runs on the in-memory
+    indexes, so it behaves exactly like InMemoryVectorStore.
+    """
+
+    backend = "local"
+
+    def __init__(self, path: str):
+        """Open (or create) a store
+
+        Args:
+            path: Directory holding the store's files
+        """
+        super().__init__()
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.vectors_path = os.path.join(path, "vectors.f32")
+        self.documents_path = os.path.join(path, "documents.jsonl")
+        self.meta_path = os.path.join(path, "meta.json")
+        self.dimensions: Optional[int] = None
+        self.rows = 0
+        # Matrix row of each live document, and the number of tombstones, for compact()
+        self.file_rows: Dict[str, int] = {}
+        self.tombstones = 0
+        self._recover_compaction()
+        self._load()
+
+    def _recover_compaction(self) -> None:
+        vectors_temp, documents_temp = f"{self.vectors_path}.compact", f"{self.documents_path}.compact"
+        if os.path.exists(vectors_temp):
+            # Interrupted before the new files replaced the old ones; keep the old ones
+            os.remove(vectors_temp)
+            if os.path.exists(documents_temp):
+                os.remove(documents_temp)
+        elif os.path.exists(documents_temp):
+            # Interrupted between the two renames; the vectors are already the compacted ones
+            os.replace(documents_temp, self.documents_path)
+
+    def _load(self) -> None:
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            self.dimensions = meta["dimensions"]
+            self.version = meta.get("version", 0)
+            self.watermarks = meta.get("watermarks", {})
+        if self.dimensions is None or not os.path.exists(self.documents_path):
+            return
+
+        row_count = os.path.getsize(self.vectors_path) // (4 * self.dimensions)
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(row_count, self.dimensions)) if row_count else None
+        with open(self.documents_path) as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("deleted"):
+                    self.index.remove(record["id"])
+                    self.lexical_index.remove(record["id"])
+                    self.file_rows.pop(record["id"], None)
+                    self.tombstones += 1
+                    continue
+                row = record["row"]
+                if row >= row_count:
+                    break  # Partially written tail from an interrupted add
+                self._upsert(record["id"], vectors[row], record["content"], record["metadata"], record["terms"])
+                self.file_rows[record["id"]] = row
+                self.rows = row + 1
+        self.index.compact()
+
+    def _save_meta(self) -> None:
+        with open(self.meta_path, "w") as f:
+            json.dump({"dimensions": self.dimensions, "version": self.version, "watermarks": self.watermarks}, f)
+
+    def add_documents(self, documents: List[Dict[str, Any]], embeddings: List[List[float]]) -> Dict[str, Any]:
+        if not documents:
+            return write_stats(0, time.perf_counter())
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        with self._lock:
+            if self.dimensions is None:
+                self.dimensions = matrix.shape[1]
+            elif matrix.shape[1] != self.dimensions:
+                raise ValueError(f"Embeddings have {matrix.shape[1]} dimensions, store has {self.dimensions}")
+
+            # Vectors first: a crash before the sidecar is written leaves rows no record points at
+            with open(self.vectors_path, "ab") as f:
+                f.write(matrix.tobytes())
+            with open(self.documents_path, "a") as f:
+                for offset, doc in enumerate(documents):
+                    text = doc.get("text", "")
+                    f.write(json.dumps({
+                        "id": chunk_id(doc),
+                        "row": self.rows + offset,
+                        "content": text,
+                        "metadata": document_metadata(doc),
+                        "terms": term_frequencies(text)
+                    }) + "\n")
+                    self.file_rows[chunk_id(doc)] = self.rows + offset
+            self.rows += len(documents)
+            stats = super().add_documents(documents, matrix)
+            self._save_meta()
+        return stats
+
+    def set_watermark(self, key: str, value: str) -> None:
+        with self._lock:
+            super().set_watermark(key, value)
+            self._save_meta()
+
+    def delete_documents(self, document_ids: List[str]) -> Dict[str, Any]:
+        with self._lock:
+            with open(self.documents_path, "a") as f:
+                for doc_id in document_ids:
+                    f.write(json.dumps({"id": doc_id, "deleted": True}) + "\n")
+                    self.file_rows.pop(doc_id, None)
+            self.tombstones += len(document_ids)
+            stats = super().delete_documents(document_ids)
+            self._save_meta()
+        return stats
+
+    def compact(self) -> int:
+        """Rewrite both files with only the live documents
+
+        Drops the matrix rows of deleted and replaced documents and every
+        tombstone. The new files are written next to the old ones and then
+        renamed over them; a compaction interrupted part way is rolled back
+        or finished when the store is next opened.
+
+        Returns:
+            Number of dead matrix rows and tombstones dropped
+        """
+        with self._lock:
+            dropped = self.rows - len(self.file_rows) + self.tombstones
+            if not dropped:
+                return 0
+            live = sorted(self.file_rows.items(), key=lambda item: item[1])
+            vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(self.rows, self.dimensions))
+            vectors_temp, documents_temp = f"{self.vectors_path}.compact", f"{self.documents_path}.compact"
+            with open(vectors_temp, "wb") as f:
+                for doc_id, row in live:
+                    f.write(np.ascontiguousarray(vectors[row]).tobytes())
+            del vectors
+            with open(documents_temp, "w") as f:
+                for new_row, (doc_id, _) in enumerate(live):
+                    index_row = self.index.rows[doc_id]
+                    f.write(json.dumps({
+                        "id": doc_id,
+                        "row": new_row,
+                        "content": self.index.contents[index_row],
+                        "metadata": self.index.metadata[index_row],
+                        "terms": self.lexical_index.documents[doc_id]["terms"]
+                    }) + "\n")
+            # Vectors first: see _recover_compaction for how a crash between the renames is handled
+            os.replace(vectors_temp, self.vectors_path)
+            os.replace(documents_temp, self.documents_path)
+            self.file_rows = {doc_id: new_row for new_row, (doc_id, _) in enumerate(live)}
+            self.rows = len(live)
+            self.tombstones = 0
+        logger.info(f"Compacted local vector store {self.path}: dropped {dropped} dead rows and tombstones")
+        return dropped
+
+
+_stores: Dict[Tuple[str, str], VectorStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_vector_store(backend: str = None, collection_name: str = DEFAULT_COLLECTION, path: str = None) -> VectorStore:
+    """Get a vector store for the configured backend
+
+    The backend defaults to VECTOR_STORE_BACKEND ("firestore"). In-memory
+    and local stores are shared per collection within the process, so
+    populate_rag and RAGManager see the same data.
+
+    Args:
+        backend: "firestore", "memory" or "local"
+        collection_name: Collection (or local store) name
+        path: Directory for the local backend (defaults to VECTOR_STORE_PATH/<collection>)
+    """
+    backend = (backend or os.getenv("VECTOR_STORE_BACKEND", "firestore")).lower()
+    if backend == "firestore":
+        from firestore_vector_store import FirestoreVectorStore
+        return FirestoreVectorStore(collection_name)
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector store backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
+    with _stores_lock:
+        store = _stores.get((backend, collection_name))
+        if store is None:
+            if backend == "memory":
+                store = InMemoryVectorStore()
+            else:
+                base_path = os.getenv("VECTOR_STORE_PATH", DEFAULT_LOCAL_PATH)
+                store = LocalFileVectorStore(path or os.path.join(base_path, collection_name))
+            _stores[(backend, collection_name)] = store
+        return store
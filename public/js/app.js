@@ -17,6 +17,40 @@ const db = firebase.firestore();
 
 let currentAnalysisListener = null;
 
+// Responses cached by request body, revalidated with If-None-Match
+const responseCache = new Map();
+
+// POST to the analysis endpoint, reusing the cached body when the server answers 304
+async function postAnalysisRequest(payload, token) {
+    const cacheKey = JSON.stringify(payload);
+    const cached = responseCache.get(cacheKey);
+    const headers = {
+        'Content-Type': 'application/json',
+        'Accept': 'application/json',
+        'Authorization': `Bearer ${token}`
+    };
+    if (cached) {
+        headers['If-None-Match'] = cached.etag;
+    }
+
+    const response = await fetch('/api/analyze_stock_endpoint', {
+        method: 'POST',
+        headers,
+        body: cacheKey
+    });
+
+    if (response.status === 304 && cached) {
+        return { ok: true, status: 200, data: cached.data };
+    }
+
+    const data = await response.json();
+    const etag = response.headers.get('ETag');
+    if (response.ok && etag) {
+        responseCache.set(cacheKey, { etag, data });
+    }
+    return { ok: response.ok, status: response.status, data };
+}
+
 // Ticker List Functionality
 const NASDAQ_TICKERS = [
     { symbol: 'AAPL', name: 'Apple Inc.' },
@@ -141,12 +175,19 @@ function listenForAnalysisUpdates(documentId) {
             if (doc.exists) {
                 const data = doc.data();
                 if (data.status === 'completed') {
-                    document.getElementById('result-content').innerHTML = formatResults(data.result);
-                    document.getElementById('result').classList.add('active');
-                    document.getElementById('loading').classList.remove('active');
                     // Clean up the listener
                     currentAnalysisListener();
                     currentAnalysisListener = null;
+                    loadFullResult(data, documentId)
+                        .then(result => {
+                            document.getElementById('result-content').innerHTML = formatResults(result);
+                            document.getElementById('result').classList.add('active');
+                        })
+                        .catch(error => {
+                            console.error('Error loading analysis sections:', error);
+                            showError('Error loading analysis results');
+                        })
+                        .finally(() => document.getElementById('loading').classList.remove('active'));
                 } else if (data.status === 'error') {
                     showError(data.error_message || 'Analysis failed');
                     document.getElementById('loading').classList.remove('active');
@@ -165,6 +206,32 @@ function listenForAnalysisUpdates(documentId) {
         });
 }
 
+// Fetch analysis sections that were too large to store inline in the result document
+async function loadFullResult(data, documentId) {
+    const result = data.result || {};
+    const sections = data.offloaded_sections || [];
+    if (!sections.length) return result;
+
+    const token = await firebase.auth().currentUser.getIdToken();
+    await Promise.all(sections.map(async (section) => {
+        const response = await postAnalysisRequest({ document_id: documentId, section }, token);
+        const payload = response.data;
+        if (!response.ok) {
+            throw new Error(payload.error || `Failed to load section ${section}`);
+        }
+
+        // Section names are dotted paths into the result, e.g. "analysis.risk_assessment"
+        const path = section.split('.');
+        let target = result;
+        path.slice(0, -1).forEach(key => {
+            target[key] = target[key] || {};
+            target = target[key];
+        });
+        target[path[path.length - 1]] = payload.data;
+    }));
+    return result;
+}
+
 // Update auth state change handler
 auth.onAuthStateChanged(user => {
     console.log('Auth state changed:', user ? 'User signed in' : 'User signed out');
@@ -257,17 +324,8 @@ async function analyzeStock() {
     try {
         analytics.logEvent('analyze_stock', { ticker });
 
-        const response = await fetch('/api/analyze_stock_endpoint', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-                'Accept': 'application/json',
-                'Authorization': `Bearer ${token}`
-            },
-            body: JSON.stringify({ ticker })
-        });
-
-        const data = await response.json();
+        const response = await postAnalysisRequest({ ticker }, token);
+        const data = response.data;
         console.log('Response from backend:', data); // Debug log
 
         if (!response.ok) {
@@ -280,7 +338,8 @@ async function analyzeStock() {
         if(data.status === 'completed'){ // if the analysis was already completed within the last 24 hours
             console.log('Entering completed branch'); // Debug log
             console.log('Result data:', data.result); // Debug log
-            document.getElementById('result-content').innerHTML = formatResults(data.result);
+            const result = await loadFullResult(data, data.document_id);
+            document.getElementById('result-content').innerHTML = formatResults(result);
             document.getElementById('result').classList.add('active');
             document.getElementById('loading').classList.remove('active');
         }